@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Benchmark the command line answering from the result cache against answering from the log.
+
+How to use it:
+
+$ python3 benchmarks/bench_cache.py --lines 1000000 --runs 20
+
+A reproducible synthetic log is written with log_generator.py. most_active_cookie.py is
+run once with --refresh to answer from the log and fill a temporary result cache, then
+--runs times answering from the cache. The best and median wall times of the hits are
+printed with the time of the miss and of an interpreter doing nothing, which bounds how
+fast any hit can be on this machine.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from log_generator import add_generator_arguments, write_log  # noqa: E402
+
+MOST_ACTIVE_COOKIE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "most_active_cookie.py")
+
+
+def parse_arguments():
+    """Parse the shape of the generated log and the number of runs from the command line."""
+
+    parser = argparse.ArgumentParser(description="Benchmark result cache hits of most_active_cookie.py.")
+    add_generator_arguments(parser)
+    parser.add_argument("--date", type=str, default="2018-12-09", help="Target date 'YYYY-MM-DD' of the query.")
+    parser.add_argument("--runs", type=int, default=20, help="Number of cache hits to time.")
+    return parser.parse_args()
+
+
+def time_command(command: List[str], directory: str) -> float:
+    """Run command in directory and return its wall time in seconds."""
+
+    start = time.perf_counter()
+    subprocess.run(command, cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    """Generate the log, time a miss and the cache hits, then print the timings."""
+
+    args = parse_arguments()
+    with tempfile.TemporaryDirectory() as directory:
+        log = os.path.join(directory, "cookie_log.csv")
+        write_log(log, args)
+        command = [sys.executable, MOST_ACTIVE_COOKIE, log, "-d", args.date, "--cache-dir", directory]
+        miss_seconds = time_command(command + ["--refresh"], directory)
+        hit_seconds = [time_command(command, directory) for _ in range(args.runs)]
+        interpreter_seconds = min(time_command([sys.executable, "-c", "pass"], directory) for _ in range(args.runs))
+
+    print(f"interpreter alone:  {interpreter_seconds * 1000:>10.1f} ms")
+    print(f"cache miss:         {miss_seconds * 1000:>10.1f} ms")
+    print(f"cache hit (best):   {min(hit_seconds) * 1000:>10.1f} ms")
+    print(f"cache hit (median): {statistics.median(hit_seconds) * 1000:>10.1f} ms")
+
+
+if __name__ == "__main__":
+
+    main()
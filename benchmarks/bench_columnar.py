@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Benchmark the size and query time of a columnar log against the CSV log it was converted from.
+
+How to use it:
+
+$ python3 benchmarks/bench_columnar.py --lines 1000000 --days 30 --runs 5
+
+A reproducible synthetic log is written with log_generator.py and converted with
+--convert. most_active_cookie.py is then run on a single date of each log, with
+--no-cache, without and with --seek. The sizes of both logs, the conversion time and
+the best wall time of each query are printed. The answers must all match.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from log_generator import add_generator_arguments, write_log  # noqa: E402
+
+MOST_ACTIVE_COOKIE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "most_active_cookie.py")
+
+
+def parse_arguments():
+    """Parse the shape of the generated log and the number of runs from the command line."""
+
+    parser = argparse.ArgumentParser(description="Benchmark columnar logs against CSV logs.")
+    add_generator_arguments(parser)
+    parser.set_defaults(days=30)
+    parser.add_argument("--date", type=str, default="2018-12-09", help="Target date 'YYYY-MM-DD' of the query.")
+    parser.add_argument("--runs", type=int, default=5, help="Number of times each query is timed.")
+    return parser.parse_args()
+
+
+def run_command(command: List[str], directory: str) -> Tuple[float, bytes]:
+    """Run command in directory and return its wall time in seconds and its output."""
+
+    start = time.perf_counter()
+    completed = subprocess.run(command, cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return time.perf_counter() - start, completed.stdout
+
+
+def main() -> None:
+    """Generate and convert the log, time the queries on both logs, then print the sizes and timings."""
+
+    args = parse_arguments()
+    with tempfile.TemporaryDirectory() as directory:
+        log = os.path.join(directory, "cookie_log.csv")
+        columnar_log = os.path.join(directory, "cookie_log.clog")
+        write_log(log, args)
+        convert_seconds, _ = run_command(
+            [sys.executable, MOST_ACTIVE_COOKIE, log, "--convert", columnar_log], directory
+        )
+
+        timings = {}
+        answers = set()
+        for name, file_name in [("CSV", log), ("columnar", columnar_log)]:
+            for options in [[], ["--seek"]]:
+                command = [sys.executable, MOST_ACTIVE_COOKIE, file_name, "-d", args.date, "--no-cache"] + options
+                runs = [run_command(command, directory) for _ in range(args.runs)]
+                timings[" ".join([name] + options)] = min(seconds for seconds, _ in runs)
+                answers.update(answer for _, answer in runs)
+        sizes = {"CSV": os.path.getsize(log), "columnar": os.path.getsize(columnar_log)}
+
+    print(f"CSV size:           {sizes['CSV'] / 1024**2:>10.1f} MB")
+    ratio = sizes["CSV"] / sizes["columnar"]
+    print(f"columnar size:      {sizes['columnar'] / 1024**2:>10.1f} MB ({ratio:.1f}x smaller)")
+    print(f"conversion:         {convert_seconds * 1000:>10.1f} ms")
+    for name, seconds in timings.items():
+        print(f"{name + ' query:':<20}{seconds * 1000:>10.1f} ms")
+    if len(answers) != 1:
+        sys.exit("The answers differ.")
+
+
+if __name__ == "__main__":
+
+    main()
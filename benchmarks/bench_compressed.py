@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Benchmark reading plain and compressed logs with CSVFileReader.iter_entries().
+
+How to use it:
+
+$ python3 benchmarks/bench_compressed.py --lines 1000000
+
+A synthetic, timestamp-sorted cookie log is written to a temporary directory as plain
+text and compressed with gzip, bz2 and xz. Each file is read end to end with
+iter_entries(), which must return the same entries for every format, and the read is
+reported in lines/sec and in megabytes/sec of decompressed log, with the on-disk size.
+"""
+
+import argparse
+import bz2
+import gzip
+import lzma
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from csv_file_reader import CSVFileReader  # noqa: E402
+from log_generator import generate_lines  # noqa: E402
+
+COMPRESSORS = {"plain": lambda data: data, "gzip": gzip.compress, "bz2": bz2.compress, "xz": lzma.compress}
+
+
+def parse_arguments():
+    """Parse the benchmark size and shape from the command line."""
+
+    parser = argparse.ArgumentParser(description="Benchmark reading plain, gzip, bz2 and xz cookie logs.")
+    parser.add_argument("--lines", type=int, default=1_000_000, help="Number of log lines to read.")
+    parser.add_argument("--days", type=int, default=30, help="Number of distinct days covered by the log.")
+    parser.add_argument("--cookies", type=int, default=10_000, help="Number of distinct cookies in the log.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the generated log.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Write the log in every format, read each back and print the throughput."""
+
+    args = parse_arguments()
+    data = b"".join(generate_lines(args.lines, args.days, args.cookies, args.seed))
+    megabytes = len(data) / 1024**2
+    expected_entries = None
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'format':<8}{'size (MB)':>12}{'lines/sec':>14}{'MB/sec':>10}")
+        for name, compress in COMPRESSORS.items():
+            log = os.path.join(directory, f"cookie_log.{name}")
+            with open(log, "wb") as log_file:
+                log_file.write(compress(data))
+
+            start = time.perf_counter()
+            entries = list(CSVFileReader().iter_entries(log))
+            seconds = time.perf_counter() - start
+            if expected_entries is None:
+                expected_entries = entries
+            elif entries != expected_entries:
+                sys.exit(f"Reading the {name} log returned different entries from the plain log.")
+
+            size = os.path.getsize(log) / 1024**2
+            print(f"{name:<8}{size:>12.1f}{args.lines / seconds:>14,.0f}{megabytes / seconds:>10.1f}")
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Benchmark the peak memory, time and error of --distinct against counting the distinct cookies exactly.
+
+How to use it:
+
+$ python3 benchmarks/bench_distinct.py --lines 2000000 --cookies 1000000 --days 2 --error-rate 0.02 --error-rate 0.005
+
+A reproducible synthetic log is written by log_generator.py, by default with one
+distinct cookie for every two lines, so the exact count holds about as many cookies as
+the log has lines. most_active_cookie.py is then run as a separate process with
+--distinct --exact, and with --distinct under each error rate given, on every day of
+the log and across them with --combined. The wall time, peak RSS and largest relative
+error of the estimates of every run are printed.
+"""
+
+import argparse
+import datetime as dt
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from log_generator import add_generator_arguments  # noqa: E402
+
+MOST_ACTIVE_COOKIE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "most_active_cookie.py")
+LOG_GENERATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "log_generator.py")
+GENERATOR_OPTIONS = ["lines", "days", "cookies", "zipf", "malformed", "order", "seed"]
+# Newest day of the logs written by log_generator.py.
+LAST_DATE = dt.date(2018, 12, 9)
+
+
+def parse_arguments():
+    """Parse the shape of the generated log and the error rates from the command line."""
+
+    parser = argparse.ArgumentParser(description="Benchmark --distinct against exact distinct counts.")
+    add_generator_arguments(parser)
+    parser.set_defaults(lines=2_000_000, cookies=1_000_000, days=2)
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        action="append",
+        help="Error rate of a --distinct run, e.g. 0.01. May be repeated. Default: 0.02.",
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Processes sketching shards of the log.")
+    return parser.parse_args()
+
+
+def run_command_line(command: List[str], directory: str) -> Dict:
+    """Run most_active_cookie.py with command line arguments command. Return its time, peak RSS and counts."""
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, MOST_ACTIVE_COOKIE] + command + ["--no-cache"],
+        cwd=directory,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    answer = process.stdout.read().decode()
+    _, status, rusage = os.wait4(process.pid, 0)
+    if status != 0:
+        sys.exit(f"most_active_cookie.py failed with {command}.")
+    return {
+        "seconds": time.perf_counter() - start,
+        # ru_maxrss is in kilobytes on Linux.
+        "peak_rss_mb": rusage.ru_maxrss / 1024,
+        "counts": dict(line.rsplit(",", 1) for line in answer.splitlines()),
+    }
+
+
+def main() -> None:
+    """Generate the log, count its distinct cookies exactly and with each error rate, then print the results."""
+
+    args = parse_arguments()
+    first_date = LAST_DATE - dt.timedelta(days=args.days - 1)
+    with tempfile.TemporaryDirectory() as directory:
+        log = os.path.join(directory, "cookie_log.csv")
+        # Generated in a separate process: a child inherits the peak RSS of the process it was forked from.
+        options = [f"--{name}={getattr(args, name)}" for name in GENERATOR_OPTIONS]
+        subprocess.run([sys.executable, LOG_GENERATOR, log] + options, check=True, stdout=subprocess.DEVNULL)
+        command = [log, "--from", str(first_date), "--to", str(LAST_DATE), "--distinct", "--combined"]
+        command += ["--workers", str(args.workers)]
+        runs = {"--exact": run_command_line(command + ["--exact"], directory)}
+        for error_rate in args.error_rate or [0.02]:
+            runs[f"--error-rate {error_rate:g}"] = run_command_line(
+                command + ["--error-rate", str(error_rate)], directory
+            )
+
+    exact_counts = runs["--exact"]["counts"]
+    print(f"{'run':<24}{'seconds':>10}{'peak RSS MB':>13}{'max error':>11}")
+    for name, run in runs.items():
+        max_error = max(abs(int(run["counts"][key]) / int(count) - 1) for key, count in exact_counts.items())
+        print(f"{name:<24}{run['seconds']:>10.2f}{run['peak_rss_mb']:>13.1f}{max_error:>11.2%}")
+    print(f"exact distinct cookies: {', '.join(f'{key} {count}' for key, count in exact_counts.items())}")
+
+
+if __name__ == "__main__":
+
+    main()
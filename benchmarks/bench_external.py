@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Benchmark the peak memory and time of --external against counting in memory, with many distinct cookies.
+
+How to use it:
+
+$ python3 benchmarks/bench_external.py --lines 2000000 --cookies 1000000 --days 1 --memory-budget 8M
+
+A reproducible synthetic log is written by log_generator.py, by default with one
+distinct cookie for every two lines on a single day, so the in-memory dict holds about
+as many cookies as the log has lines. most_active_cookie.py is then run as a separate
+process counting in memory, and with --external under each memory budget given. The
+wall time, peak RSS and answer of every run are printed. The answers must all match.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from log_generator import add_generator_arguments  # noqa: E402
+from most_active_cookie import memory_size  # noqa: E402
+
+MOST_ACTIVE_COOKIE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "most_active_cookie.py")
+LOG_GENERATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "log_generator.py")
+GENERATOR_OPTIONS = ["lines", "days", "cookies", "zipf", "malformed", "order", "seed"]
+
+
+def parse_arguments():
+    """Parse the shape of the generated log and the memory budgets from the command line."""
+
+    parser = argparse.ArgumentParser(description="Benchmark --external against counting in memory.")
+    add_generator_arguments(parser)
+    parser.set_defaults(lines=2_000_000, cookies=1_000_000, days=1)
+    parser.add_argument("--date", type=str, default="2018-12-09", help="Target date 'YYYY-MM-DD' of the query.")
+    parser.add_argument(
+        "--memory-budget",
+        type=str,
+        action="append",
+        help="Memory budget of an --external run, e.g. '8M'. May be repeated. Default: 8M.",
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Processes counting the partitions of --external.")
+    return parser.parse_args()
+
+
+def run_command_line(command: List[str], directory: str) -> Dict:
+    """Run most_active_cookie.py with command line arguments command. Return its time, peak RSS and answer."""
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, MOST_ACTIVE_COOKIE] + command + ["--no-cache"],
+        cwd=directory,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    answer = process.stdout.read()
+    _, status, rusage = os.wait4(process.pid, 0)
+    if status != 0:
+        sys.exit(f"most_active_cookie.py failed with {command}.")
+    return {
+        "seconds": time.perf_counter() - start,
+        # ru_maxrss is in kilobytes on Linux.
+        "peak_rss_mb": rusage.ru_maxrss / 1024,
+        "answer": answer,
+    }
+
+
+def main() -> None:
+    """Generate the log, run the command line in memory and with --external, then print the results."""
+
+    args = parse_arguments()
+    with tempfile.TemporaryDirectory() as directory:
+        log = os.path.join(directory, "cookie_log.csv")
+        # Generated in a separate process: a child inherits the peak RSS of the process it was forked from.
+        options = [f"--{name}={getattr(args, name)}" for name in GENERATOR_OPTIONS]
+        subprocess.run([sys.executable, LOG_GENERATOR, log] + options, check=True, stdout=subprocess.DEVNULL)
+        runs = {"in memory": run_command_line([log, "-d", args.date], directory)}
+        for memory_budget in args.memory_budget or ["8M"]:
+            command = [log, "-d", args.date, "--external", "--memory-budget", memory_budget]
+            runs[f"--external {memory_size(memory_budget) / 1024**2:g}M"] = run_command_line(
+                command + ["--workers", str(args.workers), "--spill-dir", directory], directory
+            )
+
+    print(f"{'run':<24}{'seconds':>10}{'peak RSS MB':>13}")
+    for name, run in runs.items():
+        print(f"{name:<24}{run['seconds']:>10.2f}{run['peak_rss_mb']:>13.1f}")
+    if len({run["answer"] for run in runs.values()}) != 1:
+        sys.exit("The answers differ.")
+
+
+if __name__ == "__main__":
+
+    main()
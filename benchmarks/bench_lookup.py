@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Benchmark --cookie lookups on the inverted cookie index against scanning the log for the cookie.
+
+How to use it:
+
+$ python3 benchmarks/bench_lookup.py --lines 1000000 --lookups 1000 --block-entries 4096
+
+A reproducible synthetic log is written with log_generator.py and its inverted cookie
+index is built. Cookies of the log and cookies that are not in it are then looked up,
+and the p50 and p99 latencies of each are printed with the time of one scan of the log
+and the Bloom filter blocks skipped. --block-entries makes the blocks smaller, so a
+small log has as many blocks as an archive of many terabytes: the lookup time grows
+with the number of blocks, not with the size of the log.
+"""
+
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import cookie_lookup  # noqa: E402
+from csv_file_reader import CSVFileReader  # noqa: E402
+from log_generator import add_generator_arguments, write_log  # noqa: E402
+from metrics import metrics  # noqa: E402
+
+
+def parse_arguments():
+    """Parse the shape of the generated log, the number of lookups and the block size from the command line."""
+
+    parser = argparse.ArgumentParser(description="Benchmark --cookie lookups on the inverted cookie index.")
+    add_generator_arguments(parser)
+    parser.add_argument("--lookups", type=int, default=1000, help="Number of cookies of the log looked up.")
+    parser.add_argument(
+        "--block-entries", type=int, default=cookie_lookup.BLOCK_ENTRIES, help="Entries per block of the index."
+    )
+    return parser.parse_args()
+
+
+def time_lookups(cookie_lookup_index: cookie_lookup.CookieLookupIndex, cookies: List[str]) -> List[float]:
+    """Look every cookie up and return the sorted latencies in seconds."""
+
+    latencies = []
+    for cookie in cookies:
+        start = time.perf_counter()
+        cookie_lookup_index.lookup(cookie)
+        latencies.append(time.perf_counter() - start)
+    return sorted(latencies)
+
+
+def main() -> None:
+    """Generate the log, build its index, time the lookups and a scan, then print the timings."""
+
+    args = parse_arguments()
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        log = os.path.join(directory, "cookie_log.csv")
+        write_log(log, args)
+        cookie_lookup_index = cookie_lookup.CookieLookupIndex(log, block_entries=args.block_entries)
+        start = time.perf_counter()
+        cookie_lookup_index.build()
+        build_seconds = time.perf_counter() - start
+        log_size, index_size = os.path.getsize(log), os.path.getsize(cookie_lookup_index.index_file_name)
+        blocks = len(cookie_lookup_index._read_footer()["blocks"])
+
+        start = time.perf_counter()
+        cookies = list(dict.fromkeys(cookie for cookie, _ in CSVFileReader().iter_entries(log)))
+        scan_seconds = time.perf_counter() - start
+        rng = random.Random(args.seed)
+        present_cookies = [rng.choice(cookies) for _ in range(args.lookups)]
+        absent_cookies = [f"absent{index:010d}" for index in range(args.lookups)]
+
+        metrics.enable()
+        present_latencies = time_lookups(cookie_lookup_index, present_cookies)
+        absent_latencies = time_lookups(cookie_lookup_index, absent_cookies)
+        read_stage = metrics.disable()["stages"].get("read", {})
+
+    print(f"log size:           {log_size / 1024**2:>10.1f} MB")
+    print(f"index blocks:       {blocks:>10}")
+    print(f"index size:         {index_size / 1024**2:>10.1f} MB")
+    print(f"index build:        {build_seconds * 1000:>10.1f} ms")
+    print(f"log scan:           {scan_seconds * 1000:>10.1f} ms")
+    for name, latencies in [("present", present_latencies), ("absent", absent_latencies)]:
+        print(f"{name} p50:        {statistics.median(latencies) * 1000:>10.2f} ms")
+        print(f"{name} p99:        {latencies[int(len(latencies) * 0.99)] * 1000:>10.2f} ms")
+    skipped = read_stage.get("blocks_skipped", 0) / (2 * args.lookups * blocks)
+    print(f"blocks skipped:     {skipped:>10.1%}")
+    print(f"false positives:    {read_stage.get('bloom_false_positives', 0):>10}")
+
+
+if __name__ == "__main__":
+
+    main()
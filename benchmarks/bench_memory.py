@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Measure the memory held by parsed log entries as a list of tuples and as CookieColumns.
+
+How to use it:
+
+$ python3 benchmarks/bench_memory.py --lines 1000000
+
+A synthetic, timestamp-sorted cookie log is written to a temporary file and read with
+CSVFileReader.read_file_to_list() and with read_file_to_columns(). The memory still
+allocated once each container is built is measured with tracemalloc and reported per
+entry. Both containers must iterate to the same entries and give the same frequencies,
+which is checked before the figures are printed.
+"""
+
+import argparse
+import datetime as dt
+import logging
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from csv_file_reader import CSVFileReader  # noqa: E402
+from get_cookies import CookieGetter  # noqa: E402
+from log_generator import generate_lines  # noqa: E402
+
+
+def parse_arguments():
+    """Parse the benchmark size and shape from the command line."""
+
+    parser = argparse.ArgumentParser(description="Measure the memory of a list of entries against CookieColumns.")
+    parser.add_argument("--lines", type=int, default=1_000_000, help="Number of log lines to read.")
+    parser.add_argument("--days", type=int, default=30, help="Number of distinct days covered by the log.")
+    parser.add_argument("--cookies", type=int, default=10_000, help="Number of distinct cookies in the log.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the generated log.")
+    return parser.parse_args()
+
+
+def measure(read_function, file_name: str):
+    """Return the container read from file_name by read_function and the bytes it holds once built."""
+
+    tracemalloc.start()
+    container = read_function(file_name)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return container, size
+
+
+def main() -> None:
+    """Write the log, read it into both containers and print their memory per entry."""
+
+    args = parse_arguments()
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        log = os.path.join(directory, "cookie_log.csv")
+        with open(log, "wb") as log_file:
+            log_file.writelines(generate_lines(args.lines, args.days, args.cookies, args.seed))
+
+        entries, list_size = measure(CSVFileReader().read_file_to_list, log)
+        cookie_columns, columns_size = measure(CSVFileReader().read_file_to_columns, log)
+
+    cookie_getter = CookieGetter()
+    dates = {dt.date(2018, 12, 9)}
+    expected = cookie_getter.get_cookie_frequencies(cookie_getter.iter_cookies_on_dates(entries, dates))
+    cookie_frequency = cookie_getter.get_cookie_frequencies_in_columns(cookie_columns, dates)
+    if list(cookie_columns) != entries or list(cookie_frequency.items()) != list(expected.items()):
+        sys.exit("The list and the CookieColumns container disagree on the generated log.")
+
+    print(f"entries:         {len(entries)}")
+    print(f"list of tuples:  {list_size / len(entries):>8.1f} bytes/entry  {list_size / 1024**2:>8.1f} MB")
+    print(f"CookieColumns:   {columns_size / len(entries):>8.1f} bytes/entry  {columns_size / 1024**2:>8.1f} MB")
+    print(f"reduction:       {list_size / columns_size:>8.1f}x")
+
+
+if __name__ == "__main__":
+
+    main()
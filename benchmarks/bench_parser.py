@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Benchmark the line parsers of CSVFileReader and report their throughput in lines/sec.
+
+How to use it:
+
+$ python3 benchmarks/bench_parser.py --lines 1000000
+
+A synthetic, timestamp-sorted cookie log is generated in memory and parsed line by
+line with the original strptime() based parse_entry() and with the bytes based
+parse_line(). Both parsers must produce identical output, which is checked before
+the timings are printed.
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Callable, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from csv_file_reader import CSVFileReader  # noqa: E402
+from log_generator import generate_lines  # noqa: E402
+
+
+def parse_arguments():
+    """Parse the benchmark size and shape from the command line."""
+
+    parser = argparse.ArgumentParser(description="Benchmark CSVFileReader.parse_entry() against parse_line().")
+    parser.add_argument("--lines", type=int, default=1_000_000, help="Number of log lines to parse.")
+    parser.add_argument("--days", type=int, default=30, help="Number of distinct days covered by the log.")
+    parser.add_argument("--cookies", type=int, default=10_000, help="Number of distinct cookies in the log.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the generated log.")
+    return parser.parse_args()
+
+
+def time_parser(parse: Callable, lines: List) -> float:
+    """Return the number of seconds taken to parse every line with parse."""
+
+    start = time.perf_counter()
+    for line in lines:
+        parse(line)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    """Generate the log, check both parsers agree and print their throughput."""
+
+    args = parse_arguments()
+    lines = generate_lines(args.lines, args.days, args.cookies, args.seed)
+    text_lines = [line.decode() for line in lines]
+    reader = CSVFileReader()
+
+    if [reader.parse_entry(line) for line in text_lines] != [reader.parse_line(line) for line in lines]:
+        sys.exit("parse_entry() and parse_line() disagree on the generated log.")
+
+    strptime_seconds = time_parser(reader.parse_entry, text_lines)
+    fast_seconds = time_parser(reader.parse_line, lines)
+    print(f"lines parsed:            {args.lines}")
+    print(f"parse_entry (strptime):  {args.lines / strptime_seconds:>12,.0f} lines/sec")
+    print(f"parse_line (bytes):      {args.lines / fast_seconds:>12,.0f} lines/sec")
+    print(f"speedup:                 {strptime_seconds / fast_seconds:>12.1f}x")
+
+
+if __name__ == "__main__":
+
+    main()
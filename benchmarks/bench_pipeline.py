@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""Benchmark each stage of the parse-filter-count pipeline and the command line end to end.
+
+How to use it:
+
+$ python3 benchmarks/bench_pipeline.py --lines 1000000 --zipf 1.1 --malformed 0.01 --output after.json
+$ python3 benchmarks/bench_pipeline.py --lines 1000000 --zipf 1.1 --malformed 0.01 --compare after.json
+
+A reproducible synthetic log is written with log_generator.py. The stages are then
+timed separately, each on the output of the previous one: read_file_to_list(),
+filter_list_on_dates(), get_cookie_frequencies() and get_most_active_from_frequencies().
+The fused read and filter of iter_cookies_on_dates() is timed too, with and without
+seeking, and the chunked NumPy count of VectorCounter if NumPy is installed. Each stage is run --repeat times and its best time is kept. The peak RSS of
+the process is recorded after each stage, so the growth between stages is the memory
+that stage needed. most_active_cookie.py is also run as a separate process, timed and its peak
+RSS read back. The results are printed and written as JSON; with --compare, the
+timings of an earlier JSON result are shown alongside so regressions stand out.
+"""
+
+import argparse
+import datetime as dt
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from csv_file_reader import CSVFileReader  # noqa: E402
+from get_cookies import CookieGetter  # noqa: E402
+import vector_counter  # noqa: E402
+from log_generator import add_generator_arguments, write_log  # noqa: E402
+
+MOST_ACTIVE_COOKIE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "most_active_cookie.py")
+
+
+def parse_arguments():
+    """Parse the shape of the generated log and the benchmark options from the command line."""
+
+    parser = argparse.ArgumentParser(description="Benchmark the stages of the most active cookie pipeline.")
+    add_generator_arguments(parser)
+    parser.add_argument("--date", type=str, default="2018-12-09", help="Target date 'YYYY-MM-DD' of the query.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each stage; the best time is kept.")
+    parser.add_argument("--output", type=str, default="bench_pipeline.json", help="File to write the JSON results to.")
+    parser.add_argument("--compare", type=str, help="Earlier JSON results to compare the timings with.")
+    return parser.parse_args()
+
+
+def peak_rss_megabytes(rusage: resource.struct_rusage) -> float:
+    """Return the peak resident set size of a resource usage in megabytes (ru_maxrss is in kilobytes on Linux)."""
+
+    return rusage.ru_maxrss / 1024
+
+
+def time_stage(stage: Callable, repeat: int):
+    """Run stage repeat times. Return its last result and its best wall and CPU times in seconds."""
+
+    best_seconds = best_cpu_seconds = float("inf")
+    for _ in range(max(1, repeat)):
+        start, cpu_start = time.perf_counter(), time.process_time()
+        result = stage()
+        best_seconds = min(best_seconds, time.perf_counter() - start)
+        best_cpu_seconds = min(best_cpu_seconds, time.process_time() - cpu_start)
+    return result, best_seconds, best_cpu_seconds
+
+
+def run_stages(log: str, date_string: str, repeat: int) -> Dict[str, Dict]:
+    """Time each stage of the pipeline on the log. Return the results keyed by stage name."""
+
+    csv_file_reader = CSVFileReader()
+    cookie_getter = CookieGetter()
+    dates = {dt.datetime.strptime(date_string, "%Y-%m-%d").date()}
+    size = os.path.getsize(log)
+    results = {}
+
+    def record(name: str, items: int, seconds: float, cpu_seconds: float, **extra) -> None:
+        results[name] = dict(
+            seconds=seconds,
+            cpu_seconds=cpu_seconds,
+            items=items,
+            items_per_second=items / seconds if seconds else None,
+            peak_rss_mb=peak_rss_megabytes(resource.getrusage(resource.RUSAGE_SELF)),
+            **extra,
+        )
+
+    entries, seconds, cpu_seconds = time_stage(lambda: csv_file_reader.read_file_to_list(log), repeat)
+    record("read_file_to_list", len(entries), seconds, cpu_seconds, megabytes_per_second=size / 1024**2 / seconds)
+    cookie_list, seconds, cpu_seconds = time_stage(lambda: cookie_getter.filter_list_on_dates(entries, dates), repeat)
+    record("filter_list_on_dates", len(entries), seconds, cpu_seconds)
+    cookie_frequency, seconds, cpu_seconds = time_stage(
+        lambda: cookie_getter.get_cookie_frequencies(cookie_list), repeat
+    )
+    record("get_cookie_frequencies", len(cookie_list), seconds, cpu_seconds, distinct_cookies=len(cookie_frequency))
+    _, seconds, cpu_seconds = time_stage(
+        lambda: cookie_getter.get_most_active_from_frequencies(cookie_frequency), repeat
+    )
+    record("get_most_active_from_frequencies", len(cookie_frequency), seconds, cpu_seconds)
+    _, seconds, cpu_seconds = time_stage(lambda: list(csv_file_reader.iter_cookies_on_dates(log, dates)), repeat)
+    record(
+        "iter_cookies_on_dates (fused)",
+        len(entries),
+        seconds,
+        cpu_seconds,
+        megabytes_per_second=size / 1024**2 / seconds,
+    )
+    cookies, seconds, cpu_seconds = time_stage(
+        lambda: list(csv_file_reader.iter_cookies_on_dates(log, dates, seek=True)), repeat
+    )
+    record("iter_cookies_on_dates (seek)", len(cookies), seconds, cpu_seconds)
+    if vector_counter.is_available():
+        _, seconds, cpu_seconds = time_stage(
+            lambda: vector_counter.VectorCounter().count_cookies_on_dates([log], dates), repeat
+        )
+        record(
+            "VectorCounter (vectorized)",
+            len(entries),
+            seconds,
+            cpu_seconds,
+            megabytes_per_second=size / 1024**2 / seconds,
+        )
+    return results
+
+
+def run_command_line(log: str, date_string: str, line_count: int, directory: str) -> Dict:
+    """Run most_active_cookie.py on the log as a separate process. Return its time and peak RSS."""
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, MOST_ACTIVE_COOKIE, log, "-d", date_string],
+        cwd=directory,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    _, status, rusage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    if status != 0:
+        sys.exit("most_active_cookie.py failed on the generated log.")
+    return {
+        "seconds": seconds,
+        "cpu_seconds": rusage.ru_utime + rusage.ru_stime,
+        "items": line_count,
+        "items_per_second": line_count / seconds,
+        "peak_rss_mb": peak_rss_megabytes(rusage),
+    }
+
+
+def print_results(results: Dict[str, Dict], previous: Dict[str, Dict]) -> None:
+    """Print one line per stage, with the change from the previous results if there are any."""
+
+    print(f"{'stage':<34}{'seconds':>10}{'items/sec':>14}{'peak RSS MB':>13}{'vs previous':>13}")
+    for name, result in results.items():
+        change = ""
+        if name in previous and previous[name]["seconds"]:
+            change = f"{result['seconds'] / previous[name]['seconds']:>12.2f}x"
+        print(
+            f"{name:<34}{result['seconds']:>10.3f}{result['items_per_second'] or 0:>14,.0f}"
+            f"{result['peak_rss_mb']:>13.1f}{change:>13}"
+        )
+
+
+def main() -> None:
+    """Generate the log, time every stage and the command line, then print and save the results."""
+
+    args = parse_arguments()
+    logging.disable(logging.WARNING)
+    previous = {}
+    if args.compare:
+        with open(args.compare) as previous_file:
+            previous = json.load(previous_file)["stages"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        log = os.path.join(directory, "cookie_log.csv")
+        size = write_log(log, args)
+        # Run the command line first: a child inherits the peak RSS of the process it was forked from.
+        command_line = run_command_line(log, args.date, args.lines, directory)
+        stages = dict(run_stages(log, args.date, args.repeat), command_line=command_line)
+
+    config = {
+        name: getattr(args, name) for name in ["lines", "days", "cookies", "zipf", "malformed", "order", "seed", "date"]
+    }
+    report = {
+        "created": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": dict(config, log_megabytes=size / 1024**2),
+        "stages": stages,
+    }
+    with open(args.output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+
+    print_results(stages, previous)
+    print(f"Results written to '{args.output}'.")
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Benchmark a batch of in-process date queries on a CookieLog against one command line run per query.
+
+How to use it:
+
+$ python3 benchmarks/bench_queries.py --lines 1000000 --queries 10000
+
+A reproducible synthetic log is written with log_generator.py and loaded once into a
+CookieLog. --queries most active cookie queries on random dates and pairs of dates are
+then answered in-process, dates with no cookie counting as answered through
+NoCookiesFoundError. The load time, queries per second and mean latency are printed,
+with the time of a few most_active_cookie.py runs, i.e. what each query costs when
+every query starts a fresh process.
+"""
+
+import argparse
+import datetime as dt
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from cookie_errors import NoCookiesFoundError  # noqa: E402
+from cookie_query import CookieLog  # noqa: E402
+from log_generator import NEWEST_TIMESTAMP, add_generator_arguments, write_log  # noqa: E402
+
+MOST_ACTIVE_COOKIE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "most_active_cookie.py")
+COMMAND_LINE_RUNS = 3
+
+
+def parse_arguments():
+    """Parse the shape of the generated log and the number of queries from the command line."""
+
+    parser = argparse.ArgumentParser(description="Benchmark in-process queries on a CookieLog.")
+    add_generator_arguments(parser)
+    parser.add_argument("--queries", type=int, default=10_000, help="Number of date queries to answer.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Generate the log, answer the queries in-process and on the command line, then print the timings."""
+
+    args = parse_arguments()
+    logging.disable(logging.WARNING)
+    rng = random.Random(args.seed)
+    # One day past each end of the log, so some queries find no cookie.
+    days = [(NEWEST_TIMESTAMP - dt.timedelta(days=day)).date() for day in range(-1, args.days + 1)]
+    queries = [rng.sample(days, rng.choice([1, 2])) for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        log = os.path.join(directory, "cookie_log.csv")
+        write_log(log, args)
+
+        start = time.perf_counter()
+        for dates in queries[:COMMAND_LINE_RUNS]:
+            command = [sys.executable, MOST_ACTIVE_COOKIE, log] + [f"-d{log_date}" for log_date in dates]
+            subprocess.run(command, cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        cli_seconds = (time.perf_counter() - start) / COMMAND_LINE_RUNS
+
+        start = time.perf_counter()
+        cookie_log = CookieLog(log)
+        load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    not_found = 0
+    for dates in queries:
+        try:
+            cookie_log.most_active(dates)
+        except NoCookiesFoundError:
+            not_found += 1
+    query_seconds = time.perf_counter() - start
+
+    print(f"command line run:   {cli_seconds * 1000:>10.1f} ms per query")
+    print(f"CookieLog load:     {load_seconds * 1000:>10.1f} ms")
+    print(f"queries:            {len(queries):>10} ({not_found} with no cookie)")
+    print(f"throughput:         {len(queries) / query_seconds:>10,.0f} queries/sec")
+    print(f"mean latency:       {query_seconds / len(queries) * 1e6:>10.1f} us")
+
+
+if __name__ == "__main__":
+
+    main()
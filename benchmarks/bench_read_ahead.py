@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Benchmark reading a log ahead on a background thread against reading and parsing it on one thread, cold.
+
+How to use it:
+
+$ python3 benchmarks/bench_read_ahead.py --lines 5000000 --buffers 4 --buffer-size 4M
+
+A reproducible synthetic log is written with log_generator.py and flushed to disk.
+Before every timed run its pages are dropped from the page cache with posix_fadvise(),
+so each run reads it from the disk. The cookies on --date are counted without and
+with --buffers read-ahead buffers. Reading the cold log alone and counting the cached
+log alone give the I/O and CPU times; read-ahead can hide at most the shorter of the two.
+The best time of --runs runs is kept.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from csv_file_reader import CSVFileReader  # noqa: E402
+from get_cookies import CookieGetter  # noqa: E402
+from log_generator import add_generator_arguments, write_log  # noqa: E402
+from most_active_cookie import memory_size  # noqa: E402
+from read_ahead import DEFAULT_BUFFER_COUNT, DEFAULT_BUFFER_SIZE  # noqa: E402
+
+
+def parse_arguments():
+    """Parse the shape of the generated log and the read-ahead buffers from the command line."""
+
+    parser = argparse.ArgumentParser(description="Benchmark read-ahead on a cold log.")
+    add_generator_arguments(parser)
+    parser.set_defaults(lines=5_000_000)
+    parser.add_argument("--date", type=str, default="2018-12-09", help="Target date 'YYYY-MM-DD' of the query.")
+    parser.add_argument("--buffers", type=int, default=DEFAULT_BUFFER_COUNT, help="Read-ahead buffers.")
+    parser.add_argument("--buffer-size", type=memory_size, default=DEFAULT_BUFFER_SIZE, help="Size of each buffer.")
+    parser.add_argument("--runs", type=int, default=3, help="Number of times each run is timed.")
+    return parser.parse_args()
+
+
+def drop_cache(file_name: str) -> None:
+    """Drop the pages of the file from the page cache, so the next read comes from the disk."""
+
+    with open(file_name, "rb") as log_file:
+        os.fsync(log_file.fileno())
+        os.posix_fadvise(log_file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def time_run(run: Callable[[], object], file_name: str, runs: int, cold: bool = True) -> float:
+    """Return the best wall time of runs calls of run, dropping the file from the page cache before each if cold."""
+
+    best = float("inf")
+    for _ in range(runs):
+        if cold:
+            drop_cache(file_name)
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    """Generate the log, time the read alone, the count alone and both without and with read-ahead."""
+
+    args = parse_arguments()
+    if not hasattr(os, "posix_fadvise"):
+        sys.exit("posix_fadvise() is needed to drop the log from the page cache.")
+    logging.disable(logging.WARNING)
+    cookie_getter = CookieGetter()
+    dates = cookie_getter.strings_to_dates([args.date])
+
+    def count(csv_file_reader: CSVFileReader) -> Callable[[], object]:
+        return lambda: cookie_getter.get_cookie_frequencies(csv_file_reader.iter_cookies_on_dates(log, dates))
+
+    def read() -> None:
+        with open(log, "rb", buffering=0) as log_file:
+            while log_file.read(args.buffer_size):
+                pass
+
+    with tempfile.TemporaryDirectory() as directory:
+        log = os.path.join(directory, "cookie_log.csv")
+        write_log(log, args)
+        read_ahead_reader = CSVFileReader(read_ahead_buffers=args.buffers, read_ahead_size=args.buffer_size)
+        io_seconds = time_run(read, log, args.runs)
+        cpu_seconds = time_run(count(CSVFileReader()), log, args.runs, cold=False)
+        serial_seconds = time_run(count(CSVFileReader()), log, args.runs)
+        read_ahead_seconds = time_run(count(read_ahead_reader), log, args.runs)
+
+    hidden_seconds = serial_seconds - read_ahead_seconds
+    print(f"cold read alone:    {io_seconds * 1000:>10.1f} ms")
+    print(f"cached count alone: {cpu_seconds * 1000:>10.1f} ms")
+    print(f"cold count:         {serial_seconds * 1000:>10.1f} ms")
+    print(f"cold read-ahead:    {read_ahead_seconds * 1000:>10.1f} ms ({args.buffers} x {args.buffer_size} bytes)")
+    print(f"hidden:             {hidden_seconds * 1000:>10.1f} ms of {min(io_seconds, cpu_seconds) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Load test the query server and report the latency of its answers.
+
+How to use it:
+
+$ python3 benchmarks/bench_server.py --lines 1000000 --requests 10000 --clients 16
+
+A synthetic, timestamp-sorted cookie log is written to a temporary directory and served
+by 'most_active_cookie.py --serve' on a Unix socket. Concurrent clients then send
+most-active, top-K, histogram and per-date queries on random dates over keep-alive
+connections. The p50, p99 and maximum latencies and the throughput are printed, with
+the time of one command line run on the same log for comparison.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from log_generator import generate_lines  # noqa: E402
+
+MOST_ACTIVE_COOKIE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "most_active_cookie.py")
+DAYS = ["2018-12-09", "2018-12-08", "2018-12-01", "2018-11-20"]
+QUERIES = ["/most-active?date={0}", "/top?date={0}&k=10", "/histogram?date={0}", "/by-date?date={0}&date={1}"]
+
+
+def parse_arguments():
+    """Parse the log size and the load from the command line."""
+
+    parser = argparse.ArgumentParser(description="Load test most_active_cookie.py --serve.")
+    parser.add_argument("--lines", type=int, default=1_000_000, help="Number of log lines to serve.")
+    parser.add_argument("--days", type=int, default=30, help="Number of distinct days covered by the log.")
+    parser.add_argument("--cookies", type=int, default=10_000, help="Number of distinct cookies in the log.")
+    parser.add_argument("--requests", type=int, default=10_000, help="Total number of queries to send.")
+    parser.add_argument("--clients", type=int, default=16, help="Number of concurrent keep-alive connections.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the generated log and the queries.")
+    return parser.parse_args()
+
+
+async def run_client(socket_path: str, targets: List[str], latencies: List[float]) -> None:
+    """Send each query of targets in turn on one connection and record the latency of each answer."""
+
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    for target in targets:
+        start = time.perf_counter()
+        writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        status_line = await reader.readline()
+        content_length = 0
+        while True:
+            header_line = await reader.readline()
+            if header_line == b"\r\n":
+                break
+            name, _, value = header_line.decode().partition(":")
+            if name.lower() == "content-length":
+                content_length = int(value)
+        json.loads(await reader.readexactly(content_length))
+        latencies.append(time.perf_counter() - start)
+        if b" 200 " not in status_line:
+            raise RuntimeError(f"Query {target} failed: {status_line.decode().strip()}")
+    writer.close()
+
+
+async def run_load(socket_path: str, request_count: int, client_count: int, seed: int) -> List[float]:
+    """Send request_count random queries over client_count concurrent connections. Return the latencies."""
+
+    rng = random.Random(seed)
+    targets = [rng.choice(QUERIES).format(*rng.sample(DAYS, 2)) for _ in range(request_count)]
+    latencies = []
+    await asyncio.gather(
+        *(run_client(socket_path, targets[client::client_count], latencies) for client in range(client_count))
+    )
+    return latencies
+
+
+def wait_for_server(socket_path: str, server: subprocess.Popen) -> None:
+    """Wait until the server listens on its socket, stopping if it exited instead."""
+
+    while not os.path.exists(socket_path):
+        if server.poll() is not None:
+            sys.exit("The server exited before listening. See cookies.log in the log directory.")
+        time.sleep(0.05)
+
+
+def main() -> None:
+    """Serve a generated log, load test the server and print the latency percentiles."""
+
+    args = parse_arguments()
+    with tempfile.TemporaryDirectory() as directory:
+        log = os.path.join(directory, "cookie_log.csv")
+        with open(log, "wb") as log_file:
+            log_file.writelines(generate_lines(args.lines, args.days, args.cookies, args.seed))
+
+        start = time.perf_counter()
+        command = [sys.executable, MOST_ACTIVE_COOKIE, log, "-d", DAYS[0]]
+        subprocess.run(command, cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        cli_seconds = time.perf_counter() - start
+
+        socket_path = os.path.join(directory, "server.sock")
+        start = time.perf_counter()
+        command = [sys.executable, MOST_ACTIVE_COOKIE, log, "--serve", f"unix:{socket_path}"]
+        server = subprocess.Popen(command, cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_server(socket_path, server)
+            load_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            # Not asyncio.run(), which needs Python 3.7.
+            loop = asyncio.get_event_loop()
+            latencies = loop.run_until_complete(run_load(socket_path, args.requests, args.clients, args.seed))
+            run_seconds = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+
+    latencies.sort()
+    print(f"command line run:   {cli_seconds * 1000:>10.1f} ms")
+    print(f"server load time:   {load_seconds * 1000:>10.1f} ms")
+    print(f"queries:            {len(latencies):>10} over {args.clients} connections")
+    print(f"throughput:         {len(latencies) / run_seconds:>10,.0f} queries/sec")
+    print(f"p50 latency:        {latencies[len(latencies) // 2] * 1000:>10.2f} ms")
+    print(f"p99 latency:        {latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] * 1000:>10.2f} ms")
+    print(f"max latency:        {latencies[-1] * 1000:>10.2f} ms")
+
+
+if __name__ == "__main__":
+
+    main()
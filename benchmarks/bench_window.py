@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Benchmark --follow: the lines per second a sliding window keeps up with and the latency of each update.
+
+How to use it:
+
+$ python3 benchmarks/bench_window.py --lines 2000000 --window 15m --batch 10000
+
+A reproducible synthetic log is written with log_generator.py, oldest line first as a
+live log grows. It is first read whole by a LogFollower into a SlidingWindowCounter,
+which gives the throughput of reading, parsing and counting. The same lines are then
+appended to an empty log --batch lines at a time, and each update is timed: reading
+the new lines, counting them and getting the most active cookies. The p50, p99 and
+largest update latencies are printed.
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from log_generator import add_generator_arguments, write_log  # noqa: E402
+from most_active_cookie import duration  # noqa: E402
+from window_counter import LogFollower, SlidingWindowCounter  # noqa: E402
+
+
+def parse_arguments():
+    """Parse the shape of the generated log, the window and the batch size from the command line."""
+
+    parser = argparse.ArgumentParser(description="Benchmark the sliding window of --follow.")
+    add_generator_arguments(parser)
+    parser.set_defaults(order="oldest-first")
+    parser.add_argument("--window", type=duration, default="15m", help="Span of log time counted, e.g. '15m'.")
+    parser.add_argument("--batch", type=int, default=10_000, help="Lines appended to the log between two updates.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Generate the log, time a whole read and the updates of a growing log, then print the timings."""
+
+    args = parse_arguments()
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        log = os.path.join(directory, "cookie_log.csv")
+        write_log(log, args)
+
+        window_counter = SlidingWindowCounter(args.window)
+        start = time.perf_counter()
+        entries = window_counter.add_all(LogFollower(log).iter_entries())
+        window_counter.get_most_active()
+        whole_seconds = time.perf_counter() - start
+
+        with open(log, "rb") as log_file:
+            lines = log_file.readlines()
+        growing_log = os.path.join(directory, "growing_log.csv")
+        open(growing_log, "wb").close()
+        follower = LogFollower(growing_log)
+        window_counter = SlidingWindowCounter(args.window)
+        latencies = []
+        for batch_start in range(0, len(lines), args.batch):
+            with open(growing_log, "ab") as log_file:
+                log_file.writelines(lines[batch_start : batch_start + args.batch])
+            start = time.perf_counter()
+            window_counter.add_all(follower.iter_entries())
+            window_counter.get_most_active()
+            latencies.append(time.perf_counter() - start)
+        follower.close()
+
+    latencies.sort()
+    print(f"whole log:          {entries / whole_seconds:>12,.0f} lines/sec")
+    print(f"updates:            {len(latencies):>12} of {args.batch} lines")
+    print(f"update p50:         {statistics.median(latencies) * 1000:>12.2f} ms")
+    print(f"update p99:         {latencies[int(len(latencies) * 0.99)] * 1000:>12.2f} ms")
+    print(f"update max:         {latencies[-1] * 1000:>12.2f} ms")
+    print(f"update throughput:  {len(lines) / sum(latencies):>12,.0f} lines/sec")
+
+
+if __name__ == "__main__":
+
+    main()
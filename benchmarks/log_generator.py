@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Generate reproducible synthetic cookie logs for the benchmarks.
+
+How to use it:
+
+$ python3 benchmarks/log_generator.py big_log.csv --lines 10000000 --cookies 100000 --zipf 1.1 --malformed 0.01
+
+The same arguments and seed always give the same log. Cookies are drawn uniformly or
+with a Zipf skew (the cookie of rank r is drawn with weight 1 / r ** skew), timestamps
+are spread evenly over the days covered and written newest first, oldest first or in
+random order, and a ratio of the lines is replaced by malformed ones. Lines are
+generated in batches, so logs much larger than memory can be written.
+"""
+
+import argparse
+import datetime as dt
+import itertools
+import random
+from typing import Iterator, List
+
+COOKIE_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+NEWEST_TIMESTAMP = dt.datetime(2018, 12, 9, 23, 59, 59, tzinfo=dt.timezone.utc)
+SORT_ORDERS = ["newest-first", "oldest-first", "random"]
+# Lines that are not 'cookie,timestamp', as found in real logs.
+MALFORMED_LINES = [
+    b"\n",
+    b"cookie,timestamp\n",
+    b"AtY0laUfhglK3lC7\n",
+    b"AtY0laUfhglK3lC7,2018-13-45T25:61:00+00:00\n",
+    b"AtY0laUfhglK3lC7;2018-12-09T14:19:00+00:00\n",
+    b"\x00\xff\xfe garbage\n",
+]
+BATCH_SIZE = 10_000
+
+
+def add_generator_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the options describing the shape of the generated log to parser."""
+
+    parser.add_argument("--lines", type=int, default=1_000_000, help="Number of log lines to generate.")
+    parser.add_argument("--days", type=int, default=30, help="Number of distinct days covered by the log.")
+    parser.add_argument("--cookies", type=int, default=10_000, help="Number of distinct cookies in the log.")
+    parser.add_argument("--zipf", type=float, default=0.0, help="Zipf skew of the cookie draws. 0 draws uniformly.")
+    parser.add_argument("--malformed", type=float, default=0.0, help="Ratio of malformed lines, e.g. 0.01.")
+    parser.add_argument("--order", choices=SORT_ORDERS, default=SORT_ORDERS[0], help="Order of the timestamps.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the generated log.")
+
+
+def iter_lines(
+    line_count: int,
+    day_count: int = 30,
+    cookie_count: int = 10_000,
+    seed: int = 0,
+    zipf_skew: float = 0.0,
+    malformed_ratio: float = 0.0,
+    order: str = SORT_ORDERS[0],
+) -> Iterator[bytes]:
+    """Yield line_count raw log lines spread evenly over day_count days, in the given timestamp order."""
+
+    rng = random.Random(seed)
+    cookies = ["".join(rng.choice(COOKIE_ALPHABET) for _ in range(16)) for _ in range(cookie_count)]
+    cumulative_weights = list(itertools.accumulate(1 / rank**zipf_skew for rank in range(1, cookie_count + 1)))
+    step = dt.timedelta(days=day_count) / max(line_count, 1)
+    last_seconds, timestamp = None, None
+
+    for batch_start in range(0, line_count, BATCH_SIZE):
+        batch_size = min(BATCH_SIZE, line_count - batch_start)
+        batch_cookies = rng.choices(cookies, cum_weights=cumulative_weights, k=batch_size)
+        for index, cookie in enumerate(batch_cookies, batch_start):
+            if malformed_ratio and rng.random() < malformed_ratio:
+                yield rng.choice(MALFORMED_LINES)
+                continue
+            if order == "oldest-first":
+                index = line_count - 1 - index
+            elif order == "random":
+                index = rng.randrange(line_count)
+            # Consecutive lines in the same second reuse the timestamp string.
+            seconds = int((step * index).total_seconds())
+            if seconds != last_seconds:
+                last_seconds = seconds
+                timestamp = (NEWEST_TIMESTAMP - dt.timedelta(seconds=seconds)).isoformat()
+            yield f"{cookie},{timestamp}\n".encode()
+
+
+def generate_lines(line_count: int, day_count: int, cookie_count: int, seed: int, **shape) -> List[bytes]:
+    """Return the lines of iter_lines() as a list, for logs that are parsed from memory."""
+
+    return list(iter_lines(line_count, day_count, cookie_count, seed, **shape))
+
+
+def write_log(file_name: str, args: argparse.Namespace) -> int:
+    """Write the log described by the generator options in args to file_name. Return its size in bytes."""
+
+    lines = iter_lines(args.lines, args.days, args.cookies, args.seed, args.zipf, args.malformed, args.order)
+    size = 0
+    with open(file_name, "wb") as log_file:
+        for line in lines:
+            size += log_file.write(line)
+    return size
+
+
+def main() -> None:
+    """Write a synthetic log to the file named on the command line."""
+
+    parser = argparse.ArgumentParser(description="Generate a reproducible synthetic cookie log.")
+    parser.add_argument("log_file_name", type=str, help="File to write.")
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+    size = write_log(args.log_file_name, args)
+    print(f"Wrote {args.lines} lines ({size / 1024**2:.1f} MB) to '{args.log_file_name}'.")
+
+
+if __name__ == "__main__":
+
+    main()
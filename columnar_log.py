@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""This module writes and reads cookie logs in a compact binary columnar format partitioned by day.
+
+A text log takes 43 bytes per line and is parsed again by every query. A columnar log
+stores each distinct cookie once, in a dictionary block, and each line as two 4-byte
+columns: the id of its cookie in the dictionary and its time, in seconds from midnight
+UTC of its date, so a line takes 8 bytes and nothing is parsed when it is read. Lines
+are grouped in segments of consecutive lines on the same date, and the footer lists
+the segments of each date, so a query on some dates only reads the pages of their
+segments, through mmap, and decodes only the cookies found in them. A log sorted by
+timestamp has a single segment per date, unless the date has more than SEGMENT_ROWS
+lines.
+
+Entries come out of a date in log order and the dates in the order of their first
+line, so the counts of each date, and their ties, are the same as from the text log.
+Malformed lines are left out when the log is converted. The file is written to a
+temporary file and moved into place, so a columnar log is only ever replaced whole.
+It is intended to be imported by the 'csv_file_reader.py' file where the
+ColumnarLogWriter and ColumnarLog classes are instantiated.
+
+Layout of a columnar log, integers little-endian:
+    b"COOKIECOL1\\n"
+    segments: cookie id column (uint32 per line), then time column (int32 per line)
+    dictionary block: (cookie count + 1) uint32 end offsets, then the UTF-8 cookies
+    JSON footer: {"rows": ..., "cookies": ..., "dictionary": [offset, length],
+                  "dates": {"YYYY-MM-DD": [[offset, rows], ...]}}
+    8-byte big-endian offset of the footer
+"""
+
+from array import array
+import datetime as dt
+import json
+import mmap
+import os
+import struct
+import sys
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from metrics import metrics
+
+COLUMNAR_MAGIC = b"COOKIECOL1\n"
+COLUMNAR_SUFFIX = ".clog"
+FOOTER_OFFSET = struct.Struct(">Q")
+# Time column value of a line whose date is valid but whose time is not.
+NO_TIME = -(2**31)
+# Lines held in memory before a segment is written out.
+SEGMENT_ROWS = 1024 * 1024
+
+
+def is_columnar_log(file_name: str) -> bool:
+    """Return whether the file starts with the magic bytes of a columnar log. A missing file is not one."""
+
+    try:
+        with open(file_name, "rb") as log_file:
+            return log_file.read(len(COLUMNAR_MAGIC)) == COLUMNAR_MAGIC
+    except OSError:
+        return False
+
+
+def read_column(data: bytes, typecode: str) -> array:
+    """Return the little-endian integers of data as an array of typecode."""
+
+    column = array(typecode, data)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+
+def write_column(output_file, column: array) -> None:
+    """Write the integers of column to output_file in little-endian order."""
+
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    column.tofile(output_file)
+
+
+class ColumnarLogWriter:
+    """Write log entries to a columnar log file, one segment per run of consecutive lines on the same date."""
+
+    def __init__(self, file_name: str) -> None:
+        self.file_name = file_name
+        directory = os.path.dirname(os.path.abspath(file_name))
+        # Imported only to write: every CSVFileReader imports this module, including result cache hits.
+        import tempfile
+
+        self.output_file = tempfile.NamedTemporaryFile("wb", dir=directory, delete=False)
+        self.output_file.write(COLUMNAR_MAGIC)
+        # cookie -> id, in order of first occurrence.
+        self.cookie_ids = {}
+        # 'YYYY-MM-DD' -> [[offset, rows], ...] of its segments, in order of the first line of each date.
+        self.segments = {}
+        self.rows = 0
+        self.segment_date = None
+        self.id_column = array("I")
+        self.time_column = array("i")
+
+    def __enter__(self) -> "ColumnarLogWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        """Finish the file, or remove the temporary file if the conversion failed."""
+
+        if exc_type is None:
+            self.close()
+        else:
+            self.output_file.close()
+            os.remove(self.output_file.name)
+
+    def add(self, cookie: str, log_date: dt.date, seconds: Optional[int]) -> None:
+        """Add the line of cookie on log_date, seconds after its midnight UTC, or None if its time is unknown."""
+
+        if log_date != self.segment_date or len(self.id_column) >= SEGMENT_ROWS:
+            self._write_segment()
+            self.segment_date = log_date
+        cookie_id = self.cookie_ids.get(cookie)
+        if cookie_id is None:
+            cookie_id = self.cookie_ids[cookie] = len(self.cookie_ids)
+        self.id_column.append(cookie_id)
+        self.time_column.append(NO_TIME if seconds is None else seconds)
+
+    def close(self) -> None:
+        """Write the last segment, the dictionary block and the footer, and move the file into place."""
+
+        self._write_segment()
+        cookies = [cookie.encode() for cookie in self.cookie_ids]
+        dictionary_offset = self.output_file.tell()
+        end_offsets = array("I")
+        end = 0
+        for cookie in cookies:
+            end += len(cookie)
+            end_offsets.append(end)
+        write_column(self.output_file, array("I", [0]) + end_offsets)
+        self.output_file.write(b"".join(cookies))
+
+        footer_offset = self.output_file.tell()
+        footer = {
+            "rows": self.rows,
+            "cookies": len(cookies),
+            "dictionary": [dictionary_offset, footer_offset - dictionary_offset],
+            "dates": self.segments,
+        }
+        self.output_file.write(json.dumps(footer, separators=(",", ":")).encode())
+        self.output_file.write(FOOTER_OFFSET.pack(footer_offset))
+        self.output_file.close()
+        os.replace(self.output_file.name, self.file_name)
+
+    def _write_segment(self) -> None:
+        """Write the columns of the current segment, if it has any line, and record it under its date."""
+
+        if not self.id_column:
+            return
+        self.segments.setdefault(self.segment_date.isoformat(), []).append(
+            [self.output_file.tell(), len(self.id_column)]
+        )
+        write_column(self.output_file, self.id_column)
+        write_column(self.output_file, self.time_column)
+        self.rows += len(self.id_column)
+        self.id_column = array("I")
+        self.time_column = array("i")
+
+
+class ColumnarLog:
+    """Read the entries of a columnar log file, only reading the segments of the dates asked for."""
+
+    def __init__(self, file_name: str) -> None:
+        """Memory-map the columnar log and read its footer. Raise ValueError if the file is not a columnar log."""
+
+        self.file_name = file_name
+        with open(file_name, "rb") as log_file:
+            self.size = os.fstat(log_file.fileno()).st_size
+            if self.size < len(COLUMNAR_MAGIC) + FOOTER_OFFSET.size:
+                raise ValueError(f"'{file_name}' is not a columnar log.")
+            self.log_map = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.log_map[: len(COLUMNAR_MAGIC)] != COLUMNAR_MAGIC:
+            self.close()
+            raise ValueError(f"'{file_name}' is not a columnar log.")
+        (footer_offset,) = FOOTER_OFFSET.unpack(self.log_map[-FOOTER_OFFSET.size :])
+        footer = json.loads(self.log_map[footer_offset : -FOOTER_OFFSET.size])
+        self.rows = footer["rows"]
+        self.cookie_count = footer["cookies"]
+        self.dictionary_offset = footer["dictionary"][0]
+        # strptime() rather than date.fromisoformat(), which needs Python 3.7.
+        self.segments = {
+            dt.datetime.strptime(date_string, "%Y-%m-%d").date(): segments
+            for date_string, segments in footer["dates"].items()
+        }
+        # Cookies decoded so far, by id, and the dictionary end offsets, read on first use.
+        self._cookies = {}
+        self._end_offsets = None
+
+    def __enter__(self) -> "ColumnarLog":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Unmap the file."""
+
+        self.log_map.close()
+
+    def get_date_span(self) -> Optional[Tuple[dt.date, dt.date]]:
+        """Return the (oldest, newest) dates of the log from its footer, or None if it has no entry."""
+
+        if not self.segments:
+            return None
+        return (min(self.segments), max(self.segments))
+
+    def iter_cookies(self, dates: Optional[Set[dt.date]] = None) -> Iterator[str]:
+        """Yield the cookie of every entry on the target date(s), or of every entry if dates is None.
+
+        The dates come one after the other, in the order of their first line in the log,
+        and the entries of each date in log order.
+        """
+
+        for cookie_ids, _ in self._iter_columns(dates):
+            yield from map(self._get_cookies(cookie_ids).__getitem__, cookie_ids)
+
+    def iter_entries(self, dates: Optional[Set[dt.date]] = None) -> Iterator[Tuple[str, dt.date]]:
+        """Yield the ('cookie', datetime.date) entries on the target date(s), or every entry if dates is None."""
+
+        for log_date in self._get_dates(dates):
+            for cookie in self.iter_cookies({log_date}):
+                yield (cookie, log_date)
+
+    def iter_rows(self, dates: Optional[Set[dt.date]] = None) -> Iterator[Tuple[str, dt.date, Optional[int]]]:
+        """Yield the (cookie, date, seconds after its midnight UTC or None) rows on the target date(s), or all of them."""
+
+        for log_date in self._get_dates(dates):
+            for cookie_ids, times in self._iter_columns({log_date}):
+                cookies = self._get_cookies(cookie_ids)
+                for cookie_id, seconds in zip(cookie_ids, times):
+                    yield (cookies[cookie_id], log_date, None if seconds == NO_TIME else seconds)
+
+    def _get_dates(self, dates: Optional[Set[dt.date]]) -> List[dt.date]:
+        """Return the dates of the log among the target date(s), or all of them, in the order of their first line."""
+
+        return [log_date for log_date in self.segments if dates is None or log_date in dates]
+
+    def _iter_columns(self, dates: Optional[Set[dt.date]]) -> Iterator[Tuple[array, array]]:
+        """Yield the (cookie id, time) columns of each segment on the target date(s), or of every segment."""
+
+        segments = [segment for log_date in self._get_dates(dates) for segment in self.segments[log_date]]
+        return metrics.iter_stage("read", self._iter_segment_columns(segments))
+
+    def _iter_segment_columns(self, segments: List[List[int]]) -> Iterator[Tuple[array, array]]:
+        """Yield the (cookie id, time) columns of the [offset, rows] segments, for _iter_columns()."""
+
+        for offset, rows in segments:
+            cookie_ids = read_column(self.log_map[offset : offset + 4 * rows], "I")
+            times = read_column(self.log_map[offset + 4 * rows : offset + 8 * rows], "i")
+            metrics.count("read", "bytes", 8 * rows)
+            yield cookie_ids, times
+
+    def _get_cookies(self, cookie_ids: array) -> Dict[int, str]:
+        """Return the cookies decoded so far by id, after decoding those of cookie_ids not decoded yet."""
+
+        missing_ids = set(cookie_ids).difference(self._cookies)
+        if missing_ids:
+            if self._end_offsets is None:
+                offsets_size = 4 * (self.cookie_count + 1)
+                self._end_offsets = read_column(
+                    self.log_map[self.dictionary_offset : self.dictionary_offset + offsets_size], "I"
+                )
+            cookies_offset = self.dictionary_offset + 4 * (self.cookie_count + 1)
+            end_offsets, log_map = self._end_offsets, self.log_map
+            for cookie_id in missing_ids:
+                start, end = end_offsets[cookie_id], end_offsets[cookie_id + 1]
+                self._cookies[cookie_id] = log_map[cookies_offset + start : cookies_offset + end].decode()
+        return self._cookies
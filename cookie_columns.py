@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""This module stores parsed log entries in compact columns instead of a list of tuples.
+
+A list of ('cookie', datetime.date) tuples, as returned by CSVFileReader.read_file_to_list(),
+costs a tuple, a date object and a cookie string for every line: about 200 bytes each.
+The CookieColumns container stores each distinct cookie once in an interning table and
+keeps two array('i') columns, the integer id of the cookie and the day ordinal of the
+date, so an entry takes 8 bytes. Iterating over it still yields ('cookie', datetime.date)
+tuples, so it can be passed wherever such a list is expected. It is intended to be
+imported by the 'csv_file_reader.py' file where the CookieColumns class is instantiated.
+"""
+
+from array import array
+import datetime as dt
+import sys
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+
+class CookieColumns:
+    """Hold log entries as interned cookie ids and day ordinals in two integer columns."""
+
+    def __init__(self, entries: Iterable[Tuple[str, dt.date]] = ()) -> None:
+        # Interning table: the cookie string of each id, and the id of each cookie string.
+        self.cookies: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.cookie_column = array("i")
+        self.day_column = array("i")
+        self.extend(entries)
+
+    def append(self, cookie: str, log_date: dt.date) -> None:
+        """Add one entry, interning the cookie if it was not seen before."""
+
+        cookie_id = self.ids.get(cookie)
+        if cookie_id is None:
+            cookie_id = self.ids[cookie] = len(self.cookies)
+            self.cookies.append(cookie)
+        self.cookie_column.append(cookie_id)
+        self.day_column.append(log_date.toordinal())
+
+    def extend(self, entries: Iterable[Tuple[str, dt.date]]) -> None:
+        """Add every entry of an iterable, e.g. CSVFileReader.iter_entries(), in order."""
+
+        for cookie, log_date in entries:
+            self.append(cookie, log_date)
+
+    def get_memory_size(self) -> int:
+        """Return the approximate number of bytes used by the columns and the interning table."""
+
+        return (
+            sys.getsizeof(self.cookie_column)
+            + sys.getsizeof(self.day_column)
+            + sys.getsizeof(self.cookies)
+            + sys.getsizeof(self.ids)
+            + sum(sys.getsizeof(cookie) for cookie in self.cookies)
+        )
+
+    def __len__(self) -> int:
+        return len(self.cookie_column)
+
+    def __getitem__(self, index: int) -> Tuple[str, dt.date]:
+        return (self.cookies[self.cookie_column[index]], dt.date.fromordinal(self.day_column[index]))
+
+    def __iter__(self) -> Iterator[Tuple[str, dt.date]]:
+        """Yield the entries as ('cookie', datetime.date) tuples, creating one date object per distinct day."""
+
+        dates = {}
+        cookies = self.cookies
+        for cookie_id, day in zip(self.cookie_column, self.day_column):
+            log_date = dates.get(day)
+            if log_date is None:
+                log_date = dates[day] = dt.date.fromordinal(day)
+            yield (cookies[cookie_id], log_date)
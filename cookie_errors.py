@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""This module defines the errors raised when the cookie modules are used as a library.
+
+On the command line, an unusable input is logged as a critical message and execution
+stops. CSVFileReader, CookieGetter, CookieStore and the indexes do that by default. Created with
+exit_on_error=False, they raise one of the exceptions below instead, with the same
+message, so a batch job can catch the error and go on with its next query. They all
+derive from CookieLogError.
+"""
+
+import logging
+import sys
+from typing import NoReturn
+
+
+class CookieLogError(Exception):
+    """Base class of the errors raised by the cookie modules instead of stopping execution."""
+
+
+class LogFileNotFoundError(CookieLogError, FileNotFoundError):
+    """A log file, directory or glob pattern does not name any existing file."""
+
+
+class EmptyLogError(CookieLogError):
+    """A log file holds no valid entry."""
+
+
+class InvalidDateError(CookieLogError, ValueError):
+    """A date is not a valid 'YYYY-MM-DD' date, or a date range is empty."""
+
+
+class NoCookiesFoundError(CookieLogError, LookupError):
+    """No cookie was seen on any of the target dates."""
+
+
+class InvalidFrequenciesError(CookieLogError, TypeError):
+    """A dict of cookie frequencies holds values that are not numbers."""
+
+
+class CompressedLogError(CookieLogError, ValueError):
+    """A compressed log file is given where only a plain text log can be read, e.g. to follow it as it grows."""
+
+
+class StaleIndexError(CookieLogError):
+    """An index no longer matches its log, which was truncated or rotated, and may not be rebuilt."""
+
+
+def raise_or_exit(error: CookieLogError, exit_on_error: bool) -> NoReturn:
+    """Log error as a critical message and stop execution if exit_on_error, else raise it."""
+
+    if not exit_on_error:
+        raise error
+    logging.critical(str(error))
+    sys.exit()
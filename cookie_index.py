@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""This module builds and queries a persistent per-day cookie count index for a log file.
+
+The index is a sidecar file stored next to the log ('cookie_log.csv.idx' for
+'cookie_log.csv'). It holds one compressed section per date with the frequency of every
+cookie seen that day, followed by a footer recording where each section starts and the
+size and modification time of the log the index was built from. Answering a query only
+reads the footer and the sections of the requested date(s), never the log itself.
+
+The footer also holds a checkpoint of the read: the byte offset just past the last
+complete line, the unfinished last line, the inode of the log and a digest of its first
+bytes. When lines are appended to the log, only the new bytes are parsed and merged into
+the sections of the dates they touch. If the log was truncated or rotated, the index is
+rebuilt from scratch or the query is refused. The SidecarIndex base class keeps any
+such index up to date with its log; CookieIndex defines the per-day sections. It is
+intended to be imported by the 'most_active_cookie.py' file where the CookieIndex class
+is instantiated.
+
+Layout of the index file:
+    b"COOKIEIDX2\\n"
+    one zlib-compressed JSON section per date: [[cookie, count, first_entry], ...]
+    JSON footer: {"log_size": ..., "log_mtime_ns": ..., "log_inode": ..., "log_offset": ...,
+                  "partial_line": ..., "head_length": ..., "head_digest": ..., "entry_count": ...,
+                  "dates": {"YYYY-MM-DD": [offset, length]}}
+    8-byte big-endian offset of the footer
+"""
+
+import abc
+import datetime as dt
+import hashlib
+import json
+import logging
+import os
+import struct
+import tempfile
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+from cookie_errors import LogFileNotFoundError, StaleIndexError, raise_or_exit
+from csv_file_reader import CSVFileReader
+
+INDEX_MAGIC = b"COOKIEIDX2\n"
+INDEX_SUFFIX = ".idx"
+FOOTER_OFFSET = struct.Struct(">Q")
+# Number of leading bytes of the log hashed to recognise a log rotated in place.
+HEAD_BYTES = 4096
+
+
+class SidecarIndex(abc.ABC):
+    """Keep an index file next to a log up to date with the log: build it, check it and update it.
+
+    Subclasses must define the contents of the index in _index_from(), which writes the
+    file with a footer made by _get_checkpoint(), and may set the magic bytes and suffix
+    of the file.
+    Like CSVFileReader, a missing log or a stale index stops execution, or raises with
+    exit_on_error=False.
+    """
+
+    index_magic = INDEX_MAGIC
+    index_suffix = INDEX_SUFFIX
+
+    def __init__(self, log_file_name: str, index_file_name: Optional[str] = None, exit_on_error: bool = True) -> None:
+        self.log_file_name = log_file_name
+        self.index_file_name = index_file_name or log_file_name + self.index_suffix
+        self.exit_on_error = exit_on_error
+
+    def build(self) -> None:
+        """Read the whole log once and write the index file."""
+
+        self._index_from(None)
+
+    def update(self) -> None:
+        """Parse only the bytes appended to the log since the last build or update.
+
+        The new lines are added to the index by _index_from(), starting from the checkpoint
+        in the footer. If the log is not the one indexed any more (its
+        inode changed, it shrank below the checkpoint, or its first bytes differ), the
+        index is rebuilt from scratch instead.
+        """
+
+        footer = self._read_footer()
+        if footer is None or self._is_rotated(footer):
+            logging.info(f"Log file '{self.log_file_name}' was truncated or rotated. Rebuilding the index.")
+            self.build()
+        else:
+            self._index_from(footer)
+
+    def is_current(self) -> bool:
+        """Return True if the index exists and was built from the log as it is now."""
+
+        footer = self._read_footer()
+        if footer is None:
+            return False
+        log_stat = self._stat_log()
+        return footer["log_size"] == log_stat.st_size and footer["log_mtime_ns"] == log_stat.st_mtime_ns
+
+    def ensure_current(self, rebuild: bool = True) -> None:
+        """Make sure the index matches the log before it is queried.
+
+        A missing index is always built, and lines appended to the log are always added
+        incrementally. If the log was truncated or rotated, the index is rebuilt if rebuild
+        is True; otherwise log a critical message and stop execution, or raise StaleIndexError.
+        """
+
+        if not os.path.exists(self.index_file_name):
+            self.build()
+        elif not self.is_current():
+            footer = self._read_footer()
+            if not rebuild and (footer is None or self._is_rotated(footer)):
+                raise_or_exit(
+                    StaleIndexError(
+                        f"Index '{self.index_file_name}' is out of date with '{self.log_file_name}'. "
+                        "Rebuild it or allow automatic rebuilds."
+                    ),
+                    self.exit_on_error,
+                )
+            self.update()
+
+    @abc.abstractmethod
+    def _index_from(self, footer: Optional[Dict]) -> None:
+        """Index the log from the checkpoint in footer, or from the start if None, and write the index file."""
+
+    def _get_checkpoint(self, log_stat: os.stat_result, csv_file_reader: CSVFileReader, entry_count: int) -> Dict:
+        """Return the footer fields recording how far the log was read, from the checkpoint of csv_file_reader.
+
+        log_stat must be the stat of the log taken before it was read.
+        """
+
+        log_offset, partial_line = csv_file_reader.checkpoint
+        head_length = min(HEAD_BYTES, log_offset)
+        return {
+            "log_size": log_stat.st_size,
+            "log_mtime_ns": log_stat.st_mtime_ns,
+            "log_inode": log_stat.st_ino,
+            "log_offset": log_offset,
+            "partial_line": partial_line.decode("latin-1"),
+            "head_length": head_length,
+            "head_digest": self._head_digest(head_length),
+            "entry_count": entry_count,
+        }
+
+    def _is_rotated(self, footer: Dict) -> bool:
+        """Return True if the log is no longer the file the index was built from, or a continuation of it.
+
+        A compressed log is always treated as rotated: the checkpoint counts decompressed
+        bytes, which cannot be compared with the size of the compressed file.
+        """
+
+        if CSVFileReader().get_compression(self.log_file_name) is not None:
+            return True
+        log_stat = self._stat_log()
+        return (
+            log_stat.st_ino != footer["log_inode"]
+            or log_stat.st_size < footer["log_offset"] + len(footer["partial_line"])
+            or self._head_digest(footer["head_length"]) != footer["head_digest"]
+        )
+
+    def _head_digest(self, length: int) -> str:
+        """Return a hex digest of the first length bytes of the log."""
+
+        with open(self.log_file_name, "rb") as log_file:
+            return hashlib.sha1(log_file.read(length)).hexdigest()
+
+    def _parse_partial_line(self, footer: Dict) -> Optional[Tuple[str, dt.date]]:
+        """Return the entry of the unfinished last line of the log, or None if there is no valid one."""
+
+        if not footer["partial_line"]:
+            return None
+        try:
+            return CSVFileReader().parse_line(footer["partial_line"].encode("latin-1"))
+        except (IndexError, ValueError, UnicodeDecodeError):
+            return None
+
+    def _read_footer(self) -> Optional[Dict]:
+        """Return the footer of the index file, or None if it is missing or not a valid index."""
+
+        try:
+            with open(self.index_file_name, "rb") as index_file:
+                if index_file.read(len(self.index_magic)) != self.index_magic:
+                    return None
+                index_file.seek(-FOOTER_OFFSET.size, os.SEEK_END)
+                footer_end = index_file.tell()
+                (footer_offset,) = FOOTER_OFFSET.unpack(index_file.read(FOOTER_OFFSET.size))
+                index_file.seek(footer_offset)
+                return json.loads(index_file.read(footer_end - footer_offset))
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def _stat_log(self) -> os.stat_result:
+        """Return the stat of the log file, stopping execution or raising LogFileNotFoundError if it does not exist."""
+
+        try:
+            return os.stat(self.log_file_name)
+        except FileNotFoundError:
+            raise_or_exit(
+                LogFileNotFoundError(
+                    f"File: '{self.log_file_name}' not found. Please check the file name and try again."
+                ),
+                self.exit_on_error,
+            )
+
+
+class CookieIndex(SidecarIndex):
+    """Build, update, check and query the per-day cookie count index of one log file.
+
+    For each date, every cookie is stored with its count and the position of its first
+    entry in the log, so merged multi-date results keep the log order of the cookies and
+    report ties exactly as a full scan would.
+    """
+
+    def load_frequencies(self, dates: Set[dt.date]) -> Dict:
+        """Return the cookie frequencies on the specified date(s) read from the index.
+
+        Only the sections of the requested dates are read and decompressed. An unfinished
+        last line of the log is counted too, so the result matches a full scan. Cookies are
+        returned in the order of their first occurrence in the log.
+        """
+
+        footer = self._read_footer()
+        merged = {}
+        with open(self.index_file_name, "rb") as index_file:
+            for log_date in dates:
+                section = footer["dates"].get(log_date.isoformat())
+                if section is None:
+                    continue
+                index_file.seek(section[0])
+                for cookie, count, first_entry in self._decode_section(index_file.read(section[1])):
+                    if cookie in merged:
+                        merged[cookie][0] += count
+                        merged[cookie][1] = min(merged[cookie][1], first_entry)
+                    else:
+                        merged[cookie] = [count, first_entry]
+
+        partial_entry = self._parse_partial_line(footer)
+        if partial_entry is not None and partial_entry[1] in dates:
+            merged.setdefault(partial_entry[0], [0, footer["entry_count"]])[0] += 1
+
+        ordered = sorted(merged.items(), key=lambda item: item[1][1])
+        return {cookie: count for cookie, (count, _) in ordered}
+
+    def _index_from(self, footer: Optional[Dict]) -> None:
+        """Parse the log from the checkpoint in footer, or from the start if None, and write the index.
+
+        The log is stat'ed before it is read, so lines appended during the read only make
+        the index look stale and are picked up by the next update.
+        """
+
+        log_stat = self._stat_log()
+        offset = footer["log_offset"] if footer else 0
+        entry_count = footer["entry_count"] if footer else 0
+        sections = self._read_sections(footer) if footer else {}
+
+        csv_file_reader = CSVFileReader(self.exit_on_error)
+        counts_by_date = {}
+        for cookie, log_date in csv_file_reader.iter_entries_from(self.log_file_name, offset):
+            day_counts = counts_by_date.setdefault(log_date.isoformat(), {})
+            if cookie in day_counts:
+                day_counts[cookie][0] += 1
+            else:
+                day_counts[cookie] = [1, entry_count]
+            entry_count += 1
+
+        for date_string, day_counts in counts_by_date.items():
+            if date_string in sections:
+                # Cookies already in the section appeared earlier in the log: add to their counts.
+                previous_counts = {
+                    cookie: [count, first_entry]
+                    for cookie, count, first_entry in self._decode_section(sections[date_string])
+                }
+                for cookie, (count, first_entry) in day_counts.items():
+                    previous_counts.setdefault(cookie, [0, first_entry])[0] += count
+                day_counts = previous_counts
+            section = [[cookie, count, first_entry] for cookie, (count, first_entry) in day_counts.items()]
+            sections[date_string] = zlib.compress(json.dumps(section, separators=(",", ":")).encode())
+
+        self._write(sections, self._get_checkpoint(log_stat, csv_file_reader, entry_count))
+        logging.info(
+            f"Indexed '{self.log_file_name}' up to byte {csv_file_reader.checkpoint[0]} in '{self.index_file_name}'."
+        )
+
+    def _decode_section(self, data: bytes) -> List:
+        """Return the [[cookie, count, first_entry], ...] list stored in a compressed section."""
+
+        return json.loads(zlib.decompress(data))
+
+    def _read_sections(self, footer: Dict) -> Dict[str, bytes]:
+        """Return the raw compressed section of every date in the index, keyed by 'YYYY-MM-DD'."""
+
+        sections = {}
+        with open(self.index_file_name, "rb") as index_file:
+            for date_string, (offset, length) in footer["dates"].items():
+                index_file.seek(offset)
+                sections[date_string] = index_file.read(length)
+        return sections
+
+    def _write(self, sections: Dict[str, bytes], footer: Dict) -> None:
+        """Atomically write the index file from the compressed sections and the footer fields.
+
+        The index is written to a temporary file and moved into place, so readers never
+        see a partial index.
+        """
+
+        offsets = {}
+        directory = os.path.dirname(os.path.abspath(self.index_file_name))
+        with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False) as index_file:
+            index_file.write(INDEX_MAGIC)
+            for date_string in sorted(sections):
+                offsets[date_string] = [index_file.tell(), len(sections[date_string])]
+                index_file.write(sections[date_string])
+            footer_offset = index_file.tell()
+            index_file.write(json.dumps(dict(footer, dates=offsets), separators=(",", ":")).encode())
+            index_file.write(FOOTER_OFFSET.pack(footer_offset))
+        os.replace(index_file.name, self.index_file_name)
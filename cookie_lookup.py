@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""This module builds and queries a persistent inverted index from each cookie to the days it was seen.
+
+The index is a sidecar file stored next to the log ('cookie_log.csv.cookies.idx' for
+'cookie_log.csv'), kept up to date with the log like the per-day CookieIndex. The log
+is indexed in blocks of BLOCK_ENTRIES entries by default. Each block holds a Bloom
+filter of its cookies and the per-day counts of every one of them, in hash buckets of
+about BUCKET_COOKIES cookies compressed separately. Looking a cookie up probes the Bloom
+filter of every block, skips the blocks that cannot hold the cookie, and decompresses a
+single bucket of each of the others, so the time of a lookup grows with the number of
+blocks and the blocks holding the cookie, not with the size of the log. Lines appended
+to the log are indexed as new blocks written in place over the old footer, followed by
+a new footer, so an update writes only the new blocks, not the whole index. Updates
+hold an exclusive lock on a '.lock' file next to the index, so concurrent processes
+update it one after the other. Unlike a build, an update is not atomic: a lookup that
+meets a half-written footer waits for the update, and an index left half-written by a
+crash has no valid footer and is rebuilt. It is intended to be imported by the 'most_active_cookie.py'
+file where the CookieLookupIndex class is instantiated.
+
+Layout of the index file, integers little-endian:
+    b"COOKIELKP1\\n"
+    per block: Bloom filter bits, (bucket count + 1) uint64 bucket offsets,
+               one zlib-compressed JSON bucket per offset: {cookie: [["YYYY-MM-DD", count], ...]}
+    JSON footer: the fields of the CookieIndex footer, "data_size" and
+                 "blocks": [[bloom_offset, bloom_bits, directory_offset, bucket_count], ...]
+    8-byte big-endian offset of the footer
+"""
+
+import datetime as dt
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cookie_index import FOOTER_OFFSET, SidecarIndex
+from csv_file_reader import CSVFileReader
+from metrics import metrics
+from result_cache import exclusive_lock
+
+LOOKUP_MAGIC = b"COOKIELKP1\n"
+# Ends in '.idx' so that expanding a directory of logs leaves it out.
+LOOKUP_SUFFIX = ".cookies.idx"
+# Appended to the name of the index for the lock file of its updates.
+LOCK_SUFFIX = ".lock"
+# Entries per block: the counts of one block are held in memory while it is indexed.
+BLOCK_ENTRIES = 512 * 1024
+# Bits per distinct cookie and probes of the Bloom filters: about 1% false positives.
+BITS_PER_COOKIE = 10
+HASH_COUNT = 7
+# Cookies per compressed bucket of a block.
+BUCKET_COOKIES = 512
+BUCKET_OFFSET = struct.Struct("<Q")
+
+
+def hash_cookie(cookie: str) -> Tuple[int, int]:
+    """Return two independent 64-bit hashes of the cookie, stable across processes."""
+
+    digest = hashlib.blake2b(cookie.encode(), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+
+def get_bloom_bits(hashes: Tuple[int, int], bloom_bits: int) -> List[int]:
+    """Return the HASH_COUNT bit positions of a cookie with the given hashes in a Bloom filter of bloom_bits bits."""
+
+    first, step = hashes
+    return [(first + probe * step) % bloom_bits for probe in range(HASH_COUNT)]
+
+
+def may_contain(index_map: mmap.mmap, bloom_offset: int, bloom_bits: int, hashes: Tuple[int, int]) -> bool:
+    """Return False if the Bloom filter at bloom_offset certainly does not hold the cookie with the given hashes.
+
+    The bits are tested in the order of get_bloom_bits() and the test stops at the first
+    bit not set, so a block without the cookie is most often ruled out in one or two reads.
+    """
+
+    position, step = hashes[0] % bloom_bits, hashes[1] % bloom_bits
+    for _ in range(HASH_COUNT):
+        if not index_map[bloom_offset + (position >> 3)] & (1 << (position & 7)):
+            return False
+        position = (position + step) % bloom_bits
+    return True
+
+
+class CookieLookupIndex(SidecarIndex):
+    """Build, update, check and query the inverted cookie -> per-day count index of one log file."""
+
+    index_magic = LOOKUP_MAGIC
+    index_suffix = LOOKUP_SUFFIX
+
+    def __init__(
+        self,
+        log_file_name: str,
+        index_file_name: Optional[str] = None,
+        block_entries: int = BLOCK_ENTRIES,
+        exit_on_error: bool = True,
+    ) -> None:
+        super().__init__(log_file_name, index_file_name, exit_on_error)
+        self.block_entries = block_entries
+
+    def lookup(self, cookie: str) -> Dict[dt.date, int]:
+        """Return the number of times the cookie was seen on each day it was seen, newest day first.
+
+        The dict is empty if the cookie is not in the log. An unfinished last line of the
+        log is counted too, so the result matches a full scan. An index whose footer cannot
+        be read, e.g. while another process updates it, is brought up to date first.
+        """
+
+        footer = self._read_footer()
+        if footer is None:
+            self.ensure_current()
+            footer = self._read_footer()
+        hashes = hash_cookie(cookie)
+        day_counts = {}
+        skipped_blocks = false_positives = 0
+        with open(self.index_file_name, "rb") as index_file:
+            with mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ) as index_map:
+                for bloom_offset, bloom_bits, directory_offset, bucket_count in footer["blocks"]:
+                    if not may_contain(index_map, bloom_offset, bloom_bits, hashes):
+                        skipped_blocks += 1
+                        continue
+                    bucket_offset = directory_offset + BUCKET_OFFSET.size * (hashes[1] % bucket_count)
+                    (start,) = BUCKET_OFFSET.unpack_from(index_map, bucket_offset)
+                    (end,) = BUCKET_OFFSET.unpack_from(index_map, bucket_offset + BUCKET_OFFSET.size)
+                    block_counts = json.loads(zlib.decompress(index_map[start:end])).get(cookie)
+                    if block_counts is None:
+                        false_positives += 1
+                        continue
+                    for date_string, count in block_counts:
+                        day_counts[date_string] = day_counts.get(date_string, 0) + count
+        metrics.count("read", "blocks_skipped", skipped_blocks)
+        metrics.count("read", "bloom_false_positives", false_positives)
+
+        partial_entry = self._parse_partial_line(footer)
+        if partial_entry is not None and partial_entry[0] == cookie:
+            date_string = partial_entry[1].isoformat()
+            day_counts[date_string] = day_counts.get(date_string, 0) + 1
+        return {
+            dt.datetime.strptime(date_string, "%Y-%m-%d").date(): day_counts[date_string]
+            for date_string in sorted(day_counts)[::-1]
+        }
+
+    def update(self) -> None:
+        """Parse only the bytes appended to the log since the last build or update, like SidecarIndex.update().
+
+        The footer is read and the new blocks are written under an exclusive lock, so two
+        processes updating the index at once do not both write from the same old footer.
+        """
+
+        with open(self.index_file_name + LOCK_SUFFIX, "w") as lock_file, exclusive_lock(lock_file):
+            super().update()
+
+    def _index_from(self, footer: Optional[Dict]) -> None:
+        """Index the log from the checkpoint in footer, or from the start if None, into new blocks.
+
+        A build writes a temporary file moved into place. An update opens the index file,
+        writes the new blocks from the end of the old ones, over the old footer, and then
+        the new footer, and syncs the file to disk. The log is stat'ed before it is read, so
+        lines appended during the read only make the index look stale and are picked up by
+        the next update.
+        """
+
+        log_stat = self._stat_log()
+        offset = footer["log_offset"] if footer else 0
+        entry_count = footer["entry_count"] if footer else 0
+
+        csv_file_reader = CSVFileReader(self.exit_on_error)
+        if footer:
+            index_file = open(self.index_file_name, "r+b")
+            index_file.seek(len(LOOKUP_MAGIC) + footer["data_size"])
+            blocks = footer["blocks"]
+        else:
+            directory = os.path.dirname(os.path.abspath(self.index_file_name))
+            index_file = tempfile.NamedTemporaryFile("wb", dir=directory, delete=False)
+            index_file.write(LOOKUP_MAGIC)
+            blocks = []
+        with index_file:
+            # cookie -> {date: count} of the block being read.
+            block_counts = {}
+            for cookie, log_date in csv_file_reader.iter_entries_from(self.log_file_name, offset):
+                day_counts = block_counts.get(cookie)
+                if day_counts is None:
+                    day_counts = block_counts[cookie] = {}
+                day_counts[log_date] = day_counts.get(log_date, 0) + 1
+                entry_count += 1
+                if entry_count % self.block_entries == 0:
+                    blocks.append(self._write_block(index_file, block_counts))
+                    block_counts = {}
+            if block_counts:
+                blocks.append(self._write_block(index_file, block_counts))
+
+            footer_offset = index_file.tell()
+            new_footer = dict(
+                self._get_checkpoint(log_stat, csv_file_reader, entry_count),
+                data_size=footer_offset - len(LOOKUP_MAGIC),
+                blocks=blocks,
+            )
+            index_file.write(json.dumps(new_footer, separators=(",", ":")).encode())
+            index_file.write(FOOTER_OFFSET.pack(footer_offset))
+            # The old footer may have been longer than the new blocks and footer.
+            index_file.truncate()
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        if not footer:
+            os.replace(index_file.name, self.index_file_name)
+        logging.info(
+            f"Indexed the cookies of '{self.log_file_name}' up to byte {csv_file_reader.checkpoint[0]} "
+            f"in {len(blocks)} block(s) of '{self.index_file_name}'."
+        )
+
+    def _write_block(self, index_file, block_counts: Dict[str, Dict[dt.date, int]]) -> List[int]:
+        """Write the Bloom filter and the buckets of one block. Return its [bloom_offset, bloom_bits, ...] entry."""
+
+        bloom_bits = max(64, -(-len(block_counts) * BITS_PER_COOKIE // 8) * 8)
+        bloom_filter = bytearray(bloom_bits // 8)
+        bucket_count = max(1, len(block_counts) // BUCKET_COOKIES)
+        buckets = [{} for _ in range(bucket_count)]
+        for cookie, day_counts in block_counts.items():
+            hashes = hash_cookie(cookie)
+            for bit in get_bloom_bits(hashes, bloom_bits):
+                bloom_filter[bit >> 3] |= 1 << (bit & 7)
+            buckets[hashes[1] % bucket_count][cookie] = [
+                [log_date.isoformat(), count] for log_date, count in day_counts.items()
+            ]
+
+        bloom_offset = index_file.tell()
+        index_file.write(bloom_filter)
+        directory_offset = index_file.tell()
+        compressed_buckets = [zlib.compress(json.dumps(bucket, separators=(",", ":")).encode()) for bucket in buckets]
+        bucket_offset = directory_offset + BUCKET_OFFSET.size * (bucket_count + 1)
+        for compressed_bucket in compressed_buckets:
+            index_file.write(BUCKET_OFFSET.pack(bucket_offset))
+            bucket_offset += len(compressed_bucket)
+        index_file.write(BUCKET_OFFSET.pack(bucket_offset))
+        index_file.write(b"".join(compressed_buckets))
+        return [bloom_offset, bloom_bits, directory_offset, bucket_count]
+
+
+def merge_day_counts(day_counts_list: Iterable[Dict[dt.date, int]]) -> Dict[dt.date, int]:
+    """Return the per-day counts of several logs summed, newest day first."""
+
+    merged = {}
+    for day_counts in day_counts_list:
+        for log_date, count in day_counts.items():
+            merged[log_date] = merged.get(log_date, 0) + count
+    return dict(sorted(merged.items(), reverse=True))
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""This module answers most active cookie queries in-process, for batch jobs embedding the tool.
+
+A CookieLog loads its log files once into a CookieStore and then answers any number of
+queries from memory. Unlike the command line, it never configures logging, opens a log
+file or stops execution: results are returned as MostActiveCookies tuples or plain
+lists and dicts, and unusable input raises one of the CookieLogError exceptions of
+'cookie_errors.py', so the caller can catch it and go on with its next query. Dates may
+be given as datetime.date objects or 'YYYY-MM-DD' strings, one or several at a time.
+
+    cookie_log = CookieLog(["cookie_log.csv"])
+    for date_string in date_strings:
+        try:
+            result = cookie_log.most_active(date_string)
+        except NoCookiesFoundError:
+            continue
+        print(result.dates, result.cookies, result.count)
+
+It is intended to be imported by batch drivers, as 'most_active_cookie.py' is the command
+line front end to the same CSVFileReader, CookieGetter and CookieStore classes.
+"""
+
+import datetime as dt
+from typing import Dict, Iterable, List, NamedTuple, Tuple, Union
+
+from cookie_errors import EmptyLogError, InvalidDateError, NoCookiesFoundError
+from cookie_server import CookieStore
+from csv_file_reader import CSVFileReader
+from get_cookies import CookieGetter
+
+# A date, a 'YYYY-MM-DD' string or an iterable of them.
+Dates = Union[dt.date, str, Iterable[Union[dt.date, str]]]
+
+
+class MostActiveCookies(NamedTuple):
+    """The most active cookies over some dates and the number of times each of them was seen."""
+
+    dates: Tuple[dt.date, ...]
+    cookies: List[str]
+    count: int
+
+
+class CookieLog:
+    """Answer most active cookie queries on log files loaded once, raising CookieLogError instead of exiting."""
+
+    def __init__(self, file_names: Union[str, Iterable[str]]) -> None:
+        """Load the log files, directories or glob patterns named by file_names.
+
+        Raise LogFileNotFoundError if any of them names no existing file and EmptyLogError
+        if the files hold no valid entry.
+        """
+
+        self.csv_file_reader = CSVFileReader(exit_on_error=False)
+        self.cookie_getter = CookieGetter(exit_on_error=False)
+        if isinstance(file_names, str):
+            file_names = [file_names]
+        self.file_names = self.csv_file_reader.expand_paths(file_names)
+        for file_name in self.file_names:
+            # Raises LogFileNotFoundError for a missing file.
+            self.csv_file_reader.get_compression(file_name)
+        self.store = CookieStore(self.file_names, exit_on_error=False)
+        # Answers of most_active() by dates, dropped whenever refresh() finds new entries.
+        self._most_active_cache = {}
+        self.store.refresh()
+        if not self.store.get_status()["entries"]:
+            raise EmptyLogError(f"Empty log file(s) supplied: {self.file_names}. Nothing to do.")
+
+    def refresh(self) -> int:
+        """Read the lines appended to the log files since they were loaded. Return the number of new entries.
+
+        Raise LogFileNotFoundError if a log file was deleted meanwhile; the entries already loaded are kept.
+        """
+
+        new_entries = self.store.refresh()
+        if new_entries:
+            self._most_active_cache.clear()
+        return new_entries
+
+    def frequencies(self, dates: Dates) -> Dict[str, int]:
+        """Return the number of times each cookie was seen on the date(s), in order of first occurrence.
+
+        Raise InvalidDateError if a date is invalid or none is given, and NoCookiesFoundError
+        if no cookie was seen on any of them.
+        """
+
+        dates = self.to_dates(dates)
+        cookie_frequency = self.store.get_frequencies(set(dates))
+        if not cookie_frequency:
+            raise NoCookiesFoundError(f"No cookies found on date(s): {[log_date.isoformat() for log_date in dates]}.")
+        return cookie_frequency
+
+    def most_active(self, dates: Dates) -> MostActiveCookies:
+        """Return the most active cookies over the date(s) taken together, ties in order of first occurrence.
+
+        Answers are kept until the next refresh() that finds new entries, so a batch asking
+        for the same dates again is answered without merging the day counts again.
+        """
+
+        dates = self.to_dates(dates)
+        result = self._most_active_cache.get(dates)
+        if result is None:
+            cookie_frequency = self.frequencies(dates)
+            cookies = self.cookie_getter.get_most_active_from_frequencies(cookie_frequency)
+            result = self._most_active_cache[dates] = MostActiveCookies(dates, cookies, cookie_frequency[cookies[0]])
+        return result
+
+    def most_active_by_date(self, dates: Dates) -> Dict[dt.date, MostActiveCookies]:
+        """Return the most active cookies of each date, by ascending date, leaving out dates with no cookie."""
+
+        results = {}
+        for log_date in self.to_dates(dates):
+            try:
+                results[log_date] = self.most_active(log_date)
+            except NoCookiesFoundError:
+                continue
+        return results
+
+    def top(self, dates: Dates, k: int) -> List[Tuple[str, int]]:
+        """Return the k most active cookies over the date(s) as (cookie, count) tuples, most active first."""
+
+        if k < 1:
+            raise ValueError(f"k must be a positive integer, not {k}.")
+        return self.cookie_getter.get_top_cookies(self.frequencies(dates), k)
+
+    def histogram(self, dates: Dates) -> Dict[int, int]:
+        """Return the number of cookies seen each number of times over the date(s), by ascending count."""
+
+        return self.cookie_getter.get_frequency_histogram(self.frequencies(dates))
+
+    def to_dates(self, dates: Dates) -> Tuple[dt.date, ...]:
+        """Return the date(s) as a tuple of distinct datetime.date objects in ascending order.
+
+        Raise InvalidDateError if any of them is not a date or a valid 'YYYY-MM-DD' string,
+        or if none is given.
+        """
+
+        if isinstance(dates, (dt.date, str)):
+            dates = [dates]
+        parsed_dates = set()
+        for log_date in dates:
+            if isinstance(log_date, str):
+                try:
+                    log_date = dt.datetime.strptime(log_date, "%Y-%m-%d").date()
+                except ValueError:
+                    raise InvalidDateError(f"Invalid date '{log_date}'. Please use 'YYYY-MM-DD' format.") from None
+            elif isinstance(log_date, dt.datetime) or not isinstance(log_date, dt.date):
+                raise InvalidDateError(f"Invalid date {log_date!r}. Please give a datetime.date or 'YYYY-MM-DD'.")
+            parsed_dates.add(log_date)
+        if not parsed_dates:
+            raise InvalidDateError("No date given. Please give one or more dates.")
+        return tuple(sorted(parsed_dates))
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""This module answers most active cookie queries from memory over a local HTTP API.
+
+The log files are parsed once into a CookieStore, which keeps the entries of each file
+in a CookieColumns container: two array('i') columns of cookie ids and day ordinals, 8
+bytes per entry, with every cookie string of the file stored once in its interning
+table. A file reloaded after a rotation gets new columns and a new table, so cookies
+that are gone are not held any more. The runs of rows of each day are recorded as they
+are read, so a query only counts the rows of the requested day(s) instead of parsing the
+logs again. The CookieServer serves queries with asyncio on a TCP port or a Unix socket,
+answers them with the CookieGetter query logic and picks up the lines appended to the
+logs every refresh interval, on a worker thread so queries are answered meanwhile. While
+the logs cannot be read, e.g. one was deleted, queries are answered with 503 Service
+Unavailable. It is intended to be imported by the 'most_active_cookie.py' file
+where the CookieStore and CookieServer classes are instantiated.
+
+API (every response is JSON, dates are 'YYYY-MM-DD' and 'date' may be repeated):
+    GET /most-active?date=...       {"cookies": [cookie, ...]}
+    GET /top?date=...&k=K           {"cookies": [[cookie, count], ...]}
+    GET /histogram?date=...         {"histogram": [[count, number of cookies], ...]}
+    GET /by-date?date=...&date=...  {"YYYY-MM-DD": [cookie, ...], ...}, newest date first
+    GET /status                     {"files": ..., "entries": ..., "cookies": ...}
+    While the last refresh failed:  503 {"error": ...}
+"""
+
+import asyncio
+from collections import Counter
+import datetime as dt
+from http import HTTPStatus
+import itertools
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from cookie_columns import CookieColumns
+from cookie_errors import CookieLogError, LogFileNotFoundError, raise_or_exit
+from csv_file_reader import CSVFileReader
+from get_cookies import CookieGetter
+
+DEFAULT_REFRESH_INTERVAL = 1.0
+
+
+class CookieStore:
+    """Hold the entries of log files in memory as columns and keep them up to date as the logs grow.
+
+    refresh() may run on another thread than the queries: a query only reads the rows
+    recorded in the day runs, which are published once the rows they cover are read.
+    """
+
+    def __init__(self, file_names: List[str], exit_on_error: bool = True) -> None:
+        self.file_names = file_names
+        # Passed on to the CSVFileReader of each refresh. False when refreshed on a worker thread of the server.
+        self.exit_on_error = exit_on_error
+        # For each file: its entries and, by day ordinal, the [start, stop) runs of their rows in log order.
+        self.columns = [(CookieColumns(), {}) for _ in file_names]
+        self.entry_counts = [0 for _ in file_names]
+        # For each file: (size, mtime_ns, inode, offset just past the last complete line read).
+        self.checkpoints = [None for _ in file_names]
+
+    def refresh(self) -> int:
+        """Read the lines appended to each log file since the last refresh. Return the number of new entries.
+
+        A file that did not change since the last refresh is only stat'ed. A file that
+        shrank or was replaced is read again from the start, and so is a compressed file
+        that changed, as its offsets cannot be compared with its size. An unfinished last
+        line is left for the next refresh. If a file cannot be read, e.g. it was deleted,
+        stop execution, or raise a CookieLogError with exit_on_error=False; the entries
+        already held are kept.
+        """
+
+        csv_file_reader = CSVFileReader(self.exit_on_error)
+        new_entries = 0
+        for file_index, file_name in enumerate(self.file_names):
+            try:
+                log_stat = os.stat(file_name)
+            except FileNotFoundError:
+                raise_or_exit(
+                    LogFileNotFoundError(f"File: '{file_name}' not found. Please check the file name and try again."),
+                    self.exit_on_error,
+                )
+
+            checkpoint = self.checkpoints[file_index]
+            if checkpoint is not None and checkpoint[:2] == (log_stat.st_size, log_stat.st_mtime_ns):
+                continue
+            offset = 0
+            if checkpoint is not None:
+                if (
+                    log_stat.st_ino == checkpoint[2]
+                    and log_stat.st_size >= checkpoint[3]
+                    and csv_file_reader.get_compression(file_name) is None
+                ):
+                    offset = checkpoint[3]
+                else:
+                    logging.info(f"Log file '{file_name}' was truncated, rotated or recompressed. Reloading it.")
+
+            new_entries += self._read(csv_file_reader, file_index, offset)
+            self.checkpoints[file_index] = (
+                log_stat.st_size,
+                log_stat.st_mtime_ns,
+                log_stat.st_ino,
+                csv_file_reader.checkpoint[0],
+            )
+        return new_entries
+
+    def get_frequencies(self, dates: Set[dt.date]) -> Dict:
+        """Return the cookie frequencies on the specified date(s) over all the log files.
+
+        Only the rows of the runs of the dates are counted, on the integer cookie ids of
+        each file, in log order, files in the order they were given, so cookies come out in
+        order of first occurrence and ties as from a full scan of the logs.
+        """
+
+        days = {log_date.toordinal() for log_date in dates}
+        cookie_frequency = {}
+        for cookie_columns, day_runs in self.columns:
+            id_frequency = Counter()
+            for start, stop in sorted(run for day in days for run in list(day_runs.get(day, ()))):
+                id_frequency.update(cookie_columns.cookie_column[start:stop])
+            cookies = cookie_columns.cookies
+            for cookie_id, count in id_frequency.items():
+                cookie = cookies[cookie_id]
+                cookie_frequency[cookie] = cookie_frequency.get(cookie, 0) + count
+        return cookie_frequency
+
+    def get_status(self) -> Dict:
+        """Return the number of files, entries and distinct cookies held in the store."""
+
+        if len(self.columns) == 1:
+            cookie_count = len(self.columns[0][0].cookies)
+        else:
+            cookie_count = len(set().union(*(cookie_columns.ids for cookie_columns, _ in self.columns)))
+        return {"files": len(self.file_names), "entries": sum(self.entry_counts), "cookies": cookie_count}
+
+    def _read(self, csv_file_reader: CSVFileReader, file_index: int, offset: int) -> int:
+        """Append the entries of one log file from byte offset onwards to its columns. Return how many there were.
+
+        From offset 0, the file is read into new columns with a new interning table, which
+        replace the old ones once read. The offset just past the last complete line is left
+        in csv_file_reader.checkpoint.
+        """
+
+        if offset == 0:
+            cookie_columns, day_runs = CookieColumns(), {}
+        else:
+            cookie_columns, day_runs = self.columns[file_index]
+        start = len(cookie_columns)
+        for cookie, log_date in csv_file_reader.iter_entries_from(self.file_names[file_index], offset):
+            cookie_columns.append(cookie, log_date)
+
+        row = start
+        for day, run in itertools.groupby(cookie_columns.day_column[start:]):
+            stop = row + sum(1 for _ in run)
+            runs = day_runs.setdefault(day, [])
+            if runs and runs[-1][1] == row:
+                runs[-1] = [runs[-1][0], stop]
+            else:
+                runs.append([row, stop])
+            row = stop
+        self.columns[file_index] = (cookie_columns, day_runs)
+        entries = len(cookie_columns) - start
+        self.entry_counts[file_index] = len(cookie_columns)
+        return entries
+
+
+class CookieServer:
+    """Answer most active cookie queries on a CookieStore over HTTP, on a TCP port or a Unix socket."""
+
+    def __init__(self, store: CookieStore, refresh_interval: float = DEFAULT_REFRESH_INTERVAL) -> None:
+        self.store = store
+        self.refresh_interval = refresh_interval
+        self.cookie_getter = CookieGetter()
+        # The error of the last refresh, if it failed: queries are answered with 503 until a refresh succeeds.
+        self.refresh_error: Optional[CookieLogError] = None
+        self._refresh_task = None
+
+    def serve(self, address: str) -> None:
+        """Serve queries on address, 'HOST:PORT' or 'unix:PATH', until interrupted."""
+
+        # An explicit loop rather than asyncio.run(), which needs Python 3.7.
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server = loop.run_until_complete(self.start(address))
+        logging.info(f"Serving {self.store.get_status()['entries']} entries on {address}.")
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            logging.info("Server stopped.")
+        finally:
+            loop.run_until_complete(self.stop(server))
+            loop.close()
+
+    async def start(self, address: str) -> asyncio.AbstractServer:
+        """Start listening on address, 'HOST:PORT' or 'unix:PATH', and refreshing the store periodically.
+
+        A port of 0 picks a free port, which can be read from the sockets of the returned server.
+        """
+
+        if address.startswith("unix:"):
+            server = await asyncio.start_unix_server(self._handle_connection, path=address[len("unix:") :])
+        else:
+            host, _, port = address.rpartition(":")
+            server = await asyncio.start_server(self._handle_connection, host or "127.0.0.1", int(port))
+        self._refresh_task = asyncio.ensure_future(self._refresh_periodically())
+        return server
+
+    async def stop(self, server: asyncio.AbstractServer) -> None:
+        """Stop refreshing the store and close server, as returned by start()."""
+
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+        server.close()
+        await server.wait_closed()
+
+    def handle_request(self, method: str, target: str) -> Tuple[int, Dict]:
+        """Answer one request for target, e.g. '/top?date=2018-12-09&k=3'. Return the HTTP status and the JSON body."""
+
+        if method != "GET":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"Method {method} not allowed. Use GET."}
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        if url.path not in ("/status", "/most-active", "/top", "/histogram", "/by-date"):
+            return HTTPStatus.NOT_FOUND, {"error": f"Unknown path: '{url.path}'."}
+        if self.refresh_error is not None:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"error": f"Cannot read the logs: {self.refresh_error}"}
+        if url.path == "/status":
+            return HTTPStatus.OK, self.store.get_status()
+
+        dates = self._parse_dates(query.get("date", []))
+        if dates is None:
+            return HTTPStatus.BAD_REQUEST, {"error": "Please supply one or more valid 'date=YYYY-MM-DD'."}
+        if url.path == "/by-date":
+            # Newest first, like the per-date lines of the command line.
+            frequencies_by_date = {
+                log_date: self.store.get_frequencies({log_date}) for log_date in sorted(dates, reverse=True)
+            }
+            return HTTPStatus.OK, {
+                log_date.isoformat(): self.cookie_getter.get_most_active_from_frequencies(cookie_frequency)
+                for log_date, cookie_frequency in frequencies_by_date.items()
+                if cookie_frequency
+            }
+
+        cookie_frequency = self.store.get_frequencies(dates)
+        if not cookie_frequency:
+            return HTTPStatus.NOT_FOUND, {"error": f"No cookies found on date(s): {sorted(query['date'])}."}
+        if url.path == "/top":
+            try:
+                k = int(query.get("k", ["1"])[0])
+            except ValueError:
+                k = 0
+            if k < 1:
+                return HTTPStatus.BAD_REQUEST, {"error": "Please supply a positive integer 'k'."}
+            return HTTPStatus.OK, {"cookies": self.cookie_getter.get_top_cookies(cookie_frequency, k)}
+        if url.path == "/histogram":
+            histogram = self.cookie_getter.get_frequency_histogram(cookie_frequency)
+            return HTTPStatus.OK, {"histogram": list(histogram.items())}
+        return HTTPStatus.OK, {"cookies": self.cookie_getter.get_most_active_from_frequencies(cookie_frequency)}
+
+    async def _refresh_periodically(self) -> None:
+        """Pick up the lines appended to the logs every refresh interval, on a worker thread.
+
+        Reading a large append takes a while: the event loop goes on answering queries meanwhile.
+        A CookieLogError, e.g. a deleted log, is kept in refresh_error until a refresh succeeds.
+        """
+
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                new_entries = await loop.run_in_executor(None, self.store.refresh)
+            except CookieLogError as error:
+                if self.refresh_error is None:
+                    logging.error(f"Cannot refresh the store: {error}")
+                self.refresh_error = error
+                continue
+            if self.refresh_error is not None:
+                logging.info("The logs can be read again.")
+                self.refresh_error = None
+            if new_entries > 0:
+                logging.info(f"Added {new_entries} appended entries to the store.")
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer the HTTP/1.1 requests of one connection, keeping it open between requests unless asked not to."""
+
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    header_line = await reader.readline()
+                    if header_line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header_line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip().lower()
+
+                request = request_line.decode("latin-1").split()
+                if len(request) != 3:
+                    status, body = HTTPStatus.BAD_REQUEST, {"error": "Malformed request line."}
+                    keep_alive = False
+                else:
+                    status, body = self.handle_request(request[0], request[1])
+                    keep_alive = request[2] == "HTTP/1.1" and headers.get("connection") != "close"
+
+                payload = json.dumps(body).encode()
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _parse_dates(self, date_strings: List[str]) -> Optional[Set[dt.date]]:
+        """Return the dates of the query, or None if there are none or any of them is invalid."""
+
+        try:
+            dates = {dt.datetime.strptime(date_string, "%Y-%m-%d").date() for date_string in date_strings}
+        except ValueError:
+            return None
+        return dates or None
@@ -14,16 +14,98 @@ so the file can be run, this module is intended to be imported by the
 
 """
 
-from datetime import datetime
+import bz2
+from datetime import date, datetime, timedelta, timezone
+import glob
+import gzip
+import io
 import logging
+import lzma
+import math
+import mmap
+import os
+import re
 import sys
-from typing import List, Tuple
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional, Set, Tuple
+
+from columnar_log import ColumnarLog, ColumnarLogWriter, is_columnar_log
+from cookie_columns import CookieColumns
+from cookie_errors import EmptyLogError, LogFileNotFoundError, raise_or_exit
+from metrics import metrics
+from read_ahead import DEFAULT_BUFFER_SIZE, ReadAheadFile
 
 # Default variables
 LOG_FILE_NAME = "cookie_log.csv"
+# Number of evenly spaced lines sampled to check that a log is sorted before seeking in it.
+SORTEDNESS_PROBES = 64
+# Compressed formats decompressed on the fly, recognised by the magic bytes they start with.
+COMPRESSION_FORMATS = {
+    "gzip": (b"\x1f\x8b", gzip.open),
+    "bz2": (b"BZh", bz2.open),
+    "xz": (b"\xfd7zXZ\x00", lzma.open),
+}
+# Size of the buffer decompressed data is read through.
+READ_BUFFER_SIZE = 1024 * 1024
+# What follows the time of a canonical line, with or without its newline.
+CANONICAL_OFFSETS = (b"+00:00", b"+00:00\n")
+# Proleptic Gregorian ordinal of 1970-01-01, the day POSIX time starts from.
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# Files left out when a directory or glob pattern is expanded: the sidecar cookie indexes and their lock files.
+SKIPPED_SUFFIXES = (".idx", ".idx.lock")
+# The timestamps datetime.fromisoformat() reads, for Python 3.6 which does not have it.
+ISO_TIMESTAMP = re.compile(
+    r"(\d{4})-(\d\d)-(\d\d)(?:.(\d\d)(?::(\d\d)(?::(\d\d)(?:\.(\d{3}(?:\d{3})?))?)?)?([+-]\d\d:\d\d)?)?"
+)
+
+
+def parse_iso_timestamp(timestamp: str) -> datetime:
+    """Return the datetime of an ISO 8601 timestamp, like datetime.fromisoformat() which needs Python 3.7.
+
+    Raise ValueError if the timestamp is malformed.
+    """
+
+    if hasattr(datetime, "fromisoformat"):
+        return datetime.fromisoformat(timestamp)
+    match = ISO_TIMESTAMP.fullmatch(timestamp)
+    if match is None:
+        raise ValueError(f"Invalid isoformat string: '{timestamp}'")
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    tzinfo = None
+    if offset is not None:
+        sign = -1 if offset[0] == "-" else 1
+        tzinfo = timezone(sign * timedelta(hours=int(offset[1:3]), minutes=int(offset[4:6])))
+    return datetime(
+        int(year),
+        int(month),
+        int(day),
+        int(hour or 0),
+        int(minute or 0),
+        int(second or 0),
+        int((fraction or "0").ljust(6, "0")),
+        tzinfo,
+    )
 
 
 class CSVFileReader:
+    def __init__(
+        self, exit_on_error: bool = True, read_ahead_buffers: int = 0, read_ahead_size: int = DEFAULT_BUFFER_SIZE
+    ) -> None:
+        # Log a critical message and stop execution on unusable input, or raise a CookieLogError.
+        self.exit_on_error = exit_on_error
+        # Buffers of read_ahead_size bytes read ahead on a background thread by full reads of a log, if not 0.
+        self.read_ahead_buffers = read_ahead_buffers
+        self.read_ahead_size = read_ahead_size
+        # Maps each 10-byte 'YYYY-MM-DD' prefix seen so far to its datetime.date.
+        self._date_cache = {}
+        # Map the 'YYYY-MM-DD' prefixes and 'hh:mm:ss' times seen so far to their POSIX seconds.
+        self._day_seconds_cache = {}
+        self._time_seconds_cache = {}
+        # Running total of the malformed lines skipped by this reader.
+        self.malformed_lines = 0
+        # (offset past the last complete line, bytes of the unfinished last line) of the last
+        # log read by iter_entries_from(), to resume reading a growing log from later.
+        self.checkpoint = (0, b"")
+
     def read_file_to_list(self, file_name: str) -> List[Tuple[str, datetime.date]]:
         """Read log file and return a List containing the entries as tuples ('cookie', datetime.date(YYYY, M, D)).
 
@@ -38,31 +120,698 @@ class CSVFileReader:
         Function is resilient to malformed input data, skipping any such lines.
         """
 
-        try:
-            with open(file_name, "r") as log_file:
-                result = []
-                malformed_lines = 0
-                for entry in log_file:
+        result = list(self.iter_entries(file_name))
+
+        # if log file is empty, stop execution
+        if not result:
+            raise_or_exit(EmptyLogError("Empty log file supplied. Nothing to do."), self.exit_on_error)
+        else:
+            return result
+
+    def read_file_to_columns(self, file_name: str) -> CookieColumns:
+        """Read the log file into a compact CookieColumns container instead of a List of tuples.
+
+        The entries are the same as those of read_file_to_list() and iterate as the same
+        ('cookie', datetime.date) tuples, but every cookie is stored once and each entry
+        takes two integers. If the log file has no valid entry, stop execution.
+        """
+
+        cookie_columns = CookieColumns(self.iter_entries(file_name))
+
+        # if log file is empty, stop execution
+        if not cookie_columns:
+            raise_or_exit(EmptyLogError("Empty log file supplied. Nothing to do."), self.exit_on_error)
+        return cookie_columns
+
+    def iter_entries(self, file_name: str) -> Iterator[Tuple[str, datetime.date]]:
+        """Yield the entries of the log file one at a time as tuples ('cookie', datetime.date(YYYY, M, D)).
+
+        Streaming counterpart of read_file_to_list(). Lines are read as raw bytes and
+        parsed with parse_line() as they are read so the whole log is never held in
+        memory; only the current line is alive at any time. Malformed lines are skipped
+        and counted, and the count is logged once the file is exhausted. An empty log
+        file is not an error here, the generator simply yields nothing and it is up to
+        the consumer to decide what to do. Lines are split on '\\n' only; '\\r\\n' endings
+        are handled, bare '\\r' line separators are not. A columnar log is read without parsing.
+        With read_ahead_buffers, up to that many buffers are read ahead of the parsing.
+        """
+
+        if is_columnar_log(file_name):
+            with ColumnarLog(file_name) as columnar_log:
+                yield from columnar_log.iter_entries()
+            return
+        log_file = self._open_sequential(file_name)
+
+        with log_file:
+            yield from self._parse_lines(log_file)
+
+    def iter_entries_in_range(self, file_name: str, start: int, end: int) -> Iterator[Tuple[str, datetime.date]]:
+        """Yield the entries of the lines starting in the byte range [start, end) of the log file.
+
+        start and end are expected to be line boundaries as returned by split_into_ranges().
+        The range is one shard of a larger read, so malformed lines are only added to
+        self.malformed_lines and not logged; the caller reports the total for the file.
+        A columnar log is a single range starting at 0.
+        """
+
+        if is_columnar_log(file_name):
+            if start == 0:
+                yield from self.iter_entries(file_name)
+            return
+        log_file = self.open_log(file_name)
+
+        with log_file:
+            log_file.seek(start)
+            yield from self._parse_lines(self._iter_lines_until(log_file, end - start), log_malformed=False)
+
+    def iter_entries_from(self, file_name: str, offset: int = 0) -> Iterator[Tuple[str, datetime.date]]:
+        """Yield the entries of the complete lines of the log file from byte offset onwards.
+
+        Used to pick up the lines appended to a growing log since an earlier read. A last
+        line without a newline may still be being written, so it is left unparsed. Once
+        the generator is exhausted, self.checkpoint holds the offset just past the last
+        complete line and the bytes of the unfinished line, if any; passing that offset
+        to a later call resumes exactly where this one stopped. A columnar log is only ever
+        replaced whole, so it is read whole from offset 0 and has nothing past its end.
+        """
+
+        if is_columnar_log(file_name):
+            if offset == 0:
+                yield from self.iter_entries(file_name)
+            self.checkpoint = (os.path.getsize(file_name), b"")
+            return
+        log_file = self.open_log(file_name)
+
+        with log_file:
+            log_file.seek(offset)
+            yield from self._parse_lines(self._iter_complete_lines(log_file, offset))
+
+    def split_into_ranges(self, file_name: str, range_count: int) -> List[Tuple[int, int]]:
+        """Split the log file into at most range_count newline-aligned (start, end) byte ranges.
+
+        The file is cut into equal parts and each cut is moved forward to the start of the
+        next line, so every line belongs to exactly one range. Empty ranges are dropped.
+        """
+
+        if self.get_compression(file_name) is not None or is_columnar_log(file_name):
+            logging.info(f"Compressed or columnar log '{file_name}' cannot be split and is read as a single range.")
+            return [(0, sys.maxsize)]
+
+        with open(file_name, "rb") as log_file:
+            size = os.fstat(log_file.fileno()).st_size
+            boundaries = [0]
+            for index in range(1, range_count):
+                log_file.seek(max(index * size // range_count - 1, boundaries[-1]))
+                log_file.readline()
+                boundaries.append(max(log_file.tell(), boundaries[-1]))
+            boundaries.append(size)
+        return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+    def write_columnar_log(self, file_names: Iterable[str], output_file_name: str) -> int:
+        """Convert the log files, read one after the other, into one columnar log. Return its number of entries.
+
+        Each line is parsed once, with parse_line() for its cookie and date and
+        parse_line_time() for its time, kept as seconds from midnight UTC of its date.
+        Malformed lines are left out, counted and logged as by iter_entries(). A columnar
+        log among the files is copied over without parsing.
+        """
+
+        entries = 0
+        with ColumnarLogWriter(output_file_name) as columnar_log_writer:
+            for file_name in file_names:
+                for cookie, log_date, seconds in self._iter_rows(file_name):
+                    columnar_log_writer.add(cookie, log_date, seconds)
+                    entries += 1
+        logging.info(f"Converted {entries} entries into columnar log '{output_file_name}'.")
+        return entries
+
+    def _iter_rows(self, file_name: str) -> Iterator[Tuple[str, date, Optional[int]]]:
+        """Yield the (cookie, date, seconds from midnight UTC of the date or None) rows of a log, for conversion."""
+
+        if is_columnar_log(file_name):
+            with ColumnarLog(file_name) as columnar_log:
+                yield from columnar_log.iter_rows()
+            return
+        malformed_lines = 0
+        log_file = self._open_sequential(file_name)
+
+        with log_file:
+            for line in metrics.iter_stage("read", log_file, count_bytes=True):
+                try:
+                    cookie, log_date = self.parse_line(line)
+                except (IndexError, ValueError, Exception):
+                    malformed_lines += 1
+                    continue
+                try:
+                    seconds = self.parse_line_time(line)[1] - (log_date.toordinal() - EPOCH_ORDINAL) * 86400
+                except (IndexError, ValueError, Exception):
+                    seconds = None
+                yield (cookie, log_date, seconds)
+
+        self.malformed_lines += malformed_lines
+        if malformed_lines > 0:
+            logging.warning(f"Log file contains invalid data. Skipped {malformed_lines} malformed line(s).")
+
+    def _iter_complete_lines(self, log_file, offset: int) -> Iterator[bytes]:
+        """Yield the newline-terminated lines of log_file and record where they end in self.checkpoint."""
+
+        for line in log_file:
+            if not line.endswith(b"\n"):
+                self.checkpoint = (offset, line)
+                return
+            offset += len(line)
+            yield line
+        self.checkpoint = (offset, b"")
+
+    def _iter_lines_until(self, log_file, length: int) -> Iterator[bytes]:
+        """Yield lines from the current position of log_file until length bytes have been read."""
+
+        while length > 0:
+            line = log_file.readline()
+            if not line:
+                return
+            length -= len(line)
+            yield line
+
+    def _parse_lines(self, lines: Iterable[bytes], log_malformed: bool = True) -> Iterator[Tuple[str, datetime.date]]:
+        """Parse raw lines with parse_line() and return an iterator over the entries, skipping malformed lines.
+
+        Skipped lines are added to self.malformed_lines. Unless log_malformed is False,
+        the number skipped is logged once the lines are exhausted. When metrics are
+        enabled, getting the raw lines is timed as the 'read' stage and parsing them as
+        the 'parse' stage.
+        """
+
+        lines = metrics.iter_stage("read", lines, count_bytes=True)
+        return metrics.iter_stage("parse", self._iter_parsed_lines(lines, log_malformed))
+
+    def _match_lines(
+        self, lines: Iterable[bytes], dates: Set[datetime.date], log_malformed: bool = True
+    ) -> Iterator[str]:
+        """Return an iterator over the cookies of the raw lines on the target date(s), for iter_cookies_on_dates().
+
+        When metrics are enabled, getting the raw lines is timed as the 'read' stage and
+        matching them as the 'parse' stage, which also counts the lines on other days.
+        """
+
+        lines = metrics.iter_stage("read", lines, count_bytes=True)
+        return metrics.iter_stage("parse", self._iter_matching_cookies(lines, dates, log_malformed))
+
+    def _iter_matching_cookies(
+        self, lines: Iterable[bytes], dates: Set[datetime.date], log_malformed: bool
+    ) -> Iterator[str]:
+        """Yield the cookies of the raw lines on the target date(s) for _match_lines(), counting the malformed lines."""
+
+        # 'YYYY-MM-DDT' as it follows the comma of a canonical line on each target date.
+        date_prefixes = tuple(f"{log_date.isoformat()}T".encode() for log_date in dates)
+        date_cache, get_date_of_key = self._date_cache, self.get_date_of_key
+        malformed_lines = other_lines = 0
+        for line in lines:
+            comma = line.find(b",")
+            # A cookie that is not valid UTF-8 is left to parse_line() to reject, on any date.
+            if comma >= 0:
+                if line.startswith(date_prefixes, comma + 1):
                     try:
-                        cookie = entry.rstrip().split(",")[0]
-                        timestamp_str = entry.rstrip().split(",")[1].split("T")[0]
-                        timestamp = datetime.strptime(timestamp_str, "%Y-%m-%d").date()
-                        result.append((cookie, timestamp))
-                    except (IndexError, ValueError, Exception):
-                        malformed_lines += 1
-
-                if malformed_lines > 0:
-                    logging.warning(f"Log file contains invalid data. Skipped {malformed_lines} malformed line(s).")
-
-                # if log file is empty, stop execution
-                if not result:
-                    logging.critical("Empty log file supplied. Nothing to do.")
-                    sys.exit()
-                else:
-                    return result
+                        cookie = line[:comma].decode()
+                    except UnicodeDecodeError:
+                        pass
+                    else:
+                        yield cookie
+                        continue
+                # A valid date on another day, checked once per distinct day with the date cache of
+                # parse_line(). Anything else, e.g. '2018-13-45', is left to parse_line() to reject.
+                elif line.startswith(b"T", comma + 11):
+                    date_key = line[comma + 1 : comma + 11]
+                    if date_key in date_cache or get_date_of_key(date_key) is not None:
+                        try:
+                            line[:comma].decode()
+                        except UnicodeDecodeError:
+                            pass
+                        else:
+                            other_lines += 1
+                            continue
+            try:
+                cookie, log_date = self.parse_line(line)
+            except (IndexError, ValueError, Exception):
+                malformed_lines += 1
+                continue
+            if log_date in dates:
+                yield cookie
+            else:
+                other_lines += 1
+
+        self.malformed_lines += malformed_lines
+        metrics.count("parse", "lines_skipped", malformed_lines)
+        metrics.count("parse", "lines_on_other_dates", other_lines)
+        if log_malformed and malformed_lines > 0:
+            logging.warning(f"Log file contains invalid data. Skipped {malformed_lines} malformed line(s).")
+
+    def _iter_parsed_lines(self, lines: Iterable[bytes], log_malformed: bool) -> Iterator[Tuple[str, datetime.date]]:
+        """Yield the entries of the raw lines for _parse_lines(), counting and logging the malformed lines."""
+
+        malformed_lines = 0
+        for line in lines:
+            try:
+                parsed_entry = self.parse_line(line)
+            except (IndexError, ValueError, Exception):
+                malformed_lines += 1
+                continue
+            yield parsed_entry
+
+        self.malformed_lines += malformed_lines
+        metrics.count("parse", "lines_skipped", malformed_lines)
+        if log_malformed and malformed_lines > 0:
+            logging.warning(f"Log file contains invalid data. Skipped {malformed_lines} malformed line(s).")
+
+    def expand_paths(self, paths: Iterable[str]) -> List[str]:
+        """Return the log files named by paths, expanding directories and glob patterns.
+
+        A directory stands for the files directly inside it and a pattern for the files it
+        matches, both in sorted name order, leaving out sidecar index files. Other paths are
+        kept as they are. A file named more than once is returned once, at its first place.
+        If a directory or pattern holds no file, log a critical message and stop execution.
+        """
+
+        file_names = []
+        for path in paths:
+            if os.path.isdir(path):
+                matches = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+            elif glob.escape(path) != path:
+                matches = sorted(glob.glob(path))
+            else:
+                file_names.append(path)
+                continue
+            matches = [match for match in matches if os.path.isfile(match) and not match.endswith(SKIPPED_SUFFIXES)]
+            if not matches:
+                raise_or_exit(
+                    LogFileNotFoundError(f"No log file found in: '{path}'. Please check the path and try again."),
+                    self.exit_on_error,
+                )
+            file_names.extend(matches)
+        return list(dict.fromkeys(file_names))
+
+    def filter_files_on_dates(self, file_names: Iterable[str], dates: Set[date]) -> List[str]:
+        """Return the log files that may hold entries on the specified date(s), in the given order.
+
+        A file is left out only if its date span, read by get_date_span(), lies entirely
+        outside every target date. Files whose span cannot be told cheaply are kept.
+        """
+
+        kept_file_names = []
+        skipped_files = 0
+        for file_name in file_names:
+            span = self.get_date_span(file_name)
+            if span is None or any(span[0] <= log_date <= span[1] for log_date in dates):
+                kept_file_names.append(file_name)
+            else:
+                skipped_files += 1
+        if skipped_files > 0:
+            logging.info(f"Skipped {skipped_files} log file(s) with no entries on the target date(s).")
+        return kept_file_names
+
+    def get_date_span(self, file_name: str) -> Optional[Tuple[date, date]]:
+        """Return the (oldest, newest) dates of a timestamp-sorted log, from its first and last lines.
+
+        The file is memory-mapped so only the pages holding the first valid line, the last
+        line and the sortedness sample of iter_entries_on_dates() are read. Return None if
+        the span cannot be told that way: the log is compressed or empty, its last line is
+        malformed or the sample shows it is not sorted. The span of a columnar log is read
+        from its footer.
+        """
+
+        if is_columnar_log(file_name):
+            with ColumnarLog(file_name) as columnar_log:
+                return columnar_log.get_date_span()
+        if self.get_compression(file_name) is not None:
+            return None
+        with open(file_name, "rb") as log_file:
+            size = os.fstat(log_file.fileno()).st_size
+            if size == 0:
+                return None
+            with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+                first_date, _ = self._next_valid_date(log_map, 0, size)
+                last_date = self._line_date(log_map, self._line_start(log_map, 0, size - 1), size)
+                if first_date is None or last_date is None or not self._is_sorted_sample(log_map):
+                    return None
+        return (min(first_date, last_date), max(first_date, last_date))
+
+    def get_compression(self, file_name: str) -> Optional[str]:
+        """Return the compression format of the log file ('gzip', 'bz2' or 'xz'), or None for plain text.
+
+        The format is recognised from the magic bytes at the start of the file, whatever
+        the file is named. If the file does not exist, log a critical message and stop execution.
+        """
+
+        try:
+            with open(file_name, "rb") as log_file:
+                head = log_file.read(max(len(magic) for magic, _ in COMPRESSION_FORMATS.values()))
         except FileNotFoundError:
-            logging.critical(f"File: '{file_name}' not found. Please check the file name and try again.")
-            sys.exit()
+            raise_or_exit(
+                LogFileNotFoundError(f"File: '{file_name}' not found. Please check the file name and try again."),
+                self.exit_on_error,
+            )
+
+        for compression, (magic, _) in COMPRESSION_FORMATS.items():
+            if head.startswith(magic):
+                return compression
+        return None
+
+    def open_log(self, file_name: str) -> BinaryIO:
+        """Open the log file for reading bytes, decompressing gzip, bz2 and xz logs on the fly.
+
+        Compressed logs are streamed through the standard library codecs and a buffer of
+        READ_BUFFER_SIZE bytes, so nothing is decompressed to disk. Concatenated gzip members,
+        as left by appending rotated chunks to one file, are read as a single stream. Offsets
+        into a compressed log count decompressed bytes.
+        """
+
+        compression = self.get_compression(file_name)
+        if compression is None:
+            return open(file_name, "rb")
+        _, open_compressed = COMPRESSION_FORMATS[compression]
+        return io.BufferedReader(open_compressed(file_name, "rb"), buffer_size=READ_BUFFER_SIZE)
+
+    def _open_sequential(self, file_name: str) -> BinaryIO:
+        """Open the log file to be read once from start to end, with open_log().
+
+        If read_ahead_buffers is not 0, the file is read ahead on a background thread by a
+        ReadAheadFile, so reading overlaps with parsing.
+        """
+
+        log_file = self.open_log(file_name)
+        if not self.read_ahead_buffers:
+            return log_file
+        return ReadAheadFile(log_file, self.read_ahead_buffers, self.read_ahead_size)
+
+    def parse_entry(self, entry: str) -> Tuple[str, datetime.date]:
+        """Parse a single line of the log into a tuple ('cookie', datetime.date(YYYY, M, D)).
+
+        Split the string on ',' to separate cookie from datetime. Then split the datetime
+        on 'T' to separate date from time. Raise IndexError or ValueError if the line
+        is malformed; it is up to the caller to count and skip such lines.
+        """
+
+        cookie = entry.rstrip().split(",")[0]
+        timestamp_str = entry.rstrip().split(",")[1].split("T")[0]
+        timestamp = datetime.strptime(timestamp_str, "%Y-%m-%d").date()
+        return (cookie, timestamp)
+
+    def parse_line(self, line: bytes) -> Tuple[str, datetime.date]:
+        """Parse a single raw line of the log into a tuple ('cookie', datetime.date(YYYY, M, D)).
+
+        Fast path for the canonical 'cookie,YYYY-MM-DDThh:mm:ss+00:00' layout: the comma
+        is found once and the fixed-width date after it is looked up in a per-day cache,
+        so a date object is built once per distinct day instead of strptime() running on
+        every line. Any line that does not fit the layout is decoded and handed to
+        parse_entry(), so exactly the same lines are accepted and rejected.
+        """
+
+        comma = line.find(b",")
+        if comma >= 0 and line[comma + 11 : comma + 12] == b"T":
+            date_key = line[comma + 1 : comma + 11]
+            timestamp = self._date_cache.get(date_key)
+            if timestamp is None:
+                timestamp = self._cache_date_key(date_key)
+            if timestamp is not None:
+                return (line[:comma].decode(), timestamp)
+        return self.parse_entry(line.decode())
+
+    def parse_line_time(self, line: bytes) -> Tuple[str, int]:
+        """Parse a single raw line of the log into a tuple ('cookie', POSIX time in whole seconds).
+
+        Fast path for the canonical layout: the day is looked up in a per-day cache built
+        from the one of parse_line(), and the time of day in a cache of the 'hh:mm:ss'
+        strings seen so far. Any other line is decoded and its timestamp read with
+        parse_iso_timestamp(), a timestamp without a UTC offset being taken as UTC.
+        Raise IndexError or ValueError if the line is malformed.
+        """
+
+        comma = line.find(b",")
+        if comma >= 0 and line[comma + 11 : comma + 12] == b"T" and line[comma + 20 :] in CANONICAL_OFFSETS:
+            day_seconds = self._day_seconds_cache.get(line[comma + 1 : comma + 11])
+            if day_seconds is None:
+                day_seconds = self._cache_day_seconds(line[comma + 1 : comma + 11])
+            time_seconds = self._time_seconds_cache.get(line[comma + 12 : comma + 20])
+            if time_seconds is None:
+                time_seconds = self._cache_time_seconds(line[comma + 12 : comma + 20])
+            if day_seconds is not None and time_seconds is not None:
+                return (line[:comma].decode(), day_seconds + time_seconds)
+
+        fields = line.decode().rstrip().split(",")
+        timestamp = parse_iso_timestamp(fields[1])
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return (fields[0], math.floor(timestamp.timestamp()))
+
+    def _cache_day_seconds(self, date_key: bytes) -> Optional[int]:
+        """Convert a 10-byte 'YYYY-MM-DD' key to the POSIX time of its midnight UTC and cache it, or return None."""
+
+        log_date = self._date_cache.get(date_key) or self._cache_date_key(date_key)
+        if log_date is None:
+            return None
+        day_seconds = self._day_seconds_cache[date_key] = (log_date.toordinal() - EPOCH_ORDINAL) * 86400
+        return day_seconds
+
+    def _cache_time_seconds(self, time_key: bytes) -> Optional[int]:
+        """Convert an 8-byte 'hh:mm:ss' key to seconds since midnight and cache it, or return None if it is invalid."""
+
+        hours, minutes, seconds = time_key[:2], time_key[3:5], time_key[6:]
+        if time_key[2:3] != b":" or time_key[5:6] != b":" or not (hours + minutes + seconds).isdigit():
+            return None
+        if int(hours) > 23 or int(minutes) > 59 or int(seconds) > 59:
+            return None
+        time_seconds = self._time_seconds_cache[time_key] = int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+        return time_seconds
+
+    def get_date_of_key(self, date_key: bytes) -> Optional[datetime.date]:
+        """Return the datetime.date of a 10-byte 'YYYY-MM-DD' key as parse_line() reads it, or None if it is not one.
+
+        The key is looked up in the date cache of parse_line() and converted once if it is
+        not there yet, so a caller can check the date of a line without parsing the line.
+        """
+
+        timestamp = self._date_cache.get(date_key)
+        if timestamp is None:
+            timestamp = self._cache_date_key(date_key)
+        return timestamp
+
+    def _cache_date_key(self, date_key: bytes) -> Optional[datetime.date]:
+        """Convert a 10-byte 'YYYY-MM-DD' key to a datetime.date and cache it.
+
+        Only keys made of ASCII digits in the exact strptime("%Y-%m-%d") layout are
+        converted, by integer arithmetic. Return None for anything else, including
+        invalid dates such as Feb 30, so the caller falls back to parse_entry().
+        """
+
+        if date_key[4:5] != b"-" or date_key[7:8] != b"-":
+            return None
+        year, month, day = date_key[:4], date_key[5:7], date_key[8:]
+        if not (year + month + day).isdigit():
+            return None
+        try:
+            timestamp = date(int(year), int(month), int(day))
+        except ValueError:
+            return None
+        self._date_cache[date_key] = timestamp
+        return timestamp
+
+    def iter_entries_on_dates(self, file_name: str, dates: Set[datetime.date]) -> Iterator[Tuple[str, datetime.date]]:
+        """Yield only the entries of a timestamp-sorted log that lie between the earliest and latest target date.
+
+        The log is assumed to be sorted by timestamp with the most recent entry first.
+        The file is memory-mapped and binary searched on line boundaries to find the byte
+        range holding the target date(s), then only that range is parsed, so only the
+        pages around the probes and the range itself are ever read from disk.
+        Before seeking, a sample of lines is checked for ordering, and the selected range
+        is checked again before anything is yielded. If the log turns out not to be sorted,
+        a warning is logged and the whole file is scanned with iter_entries() instead.
+        Entries inside the range that fall on a non-target date (e.g. between two
+        non-consecutive target dates) are still yielded, so the consumer must filter.
+        Only the entries on the target dates of a columnar log are read.
+        """
+
+        if is_columnar_log(file_name):
+            with ColumnarLog(file_name) as columnar_log:
+                yield from columnar_log.iter_entries(dates)
+            return
+        span = self._seek_date_span(file_name, dates)
+        if span is None:
+            yield from self.iter_entries(file_name)
+            return
+
+        with open(file_name, "rb") as log_file:
+            # mmap cannot map an empty file and there is nothing to seek in anyway.
+            if span == (0, 0):
+                return
+            with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+                yield from self._iter_span_entries(log_map, *span)
+
+    def iter_cookies_on_dates(self, file_name: str, dates: Set[datetime.date], seek: bool = False) -> Iterator[str]:
+        """Yield the cookie of every entry of the log file on the target date(s), in log order.
+
+        Parsing and filtering fused: the 10 bytes after the comma of each raw line are
+        compared with the target dates before anything is decoded, so a line on another
+        day is skipped without building a string, tuple or date object. Only lines that
+        are not in the canonical 'cookie,YYYY-MM-DDThh:mm:ss' layout go through
+        parse_line(), so the same cookies are yielded and the same lines are counted as
+        malformed as by filtering iter_entries(): the date of a line on another day is
+        checked once per distinct day against the date cache of parse_line(). With seek, a timestamp-sorted
+        plain log is binary searched as by iter_entries_on_dates() and reading stops
+        once the oldest target date is passed. Only the segments of the target date(s) of a
+        columnar log are read, whether or not seek is given.
+        """
+
+        if is_columnar_log(file_name):
+            with ColumnarLog(file_name) as columnar_log:
+                yield from columnar_log.iter_cookies(dates)
+            return
+        span = self._seek_date_span(file_name, dates) if seek else None
+        log_file = self.open_log(file_name) if span is not None else self._open_sequential(file_name)
+
+        with log_file:
+            if span is None:
+                yield from self._match_lines(log_file, dates)
+            else:
+                log_file.seek(span[0])
+                yield from self._match_lines(self._iter_lines_until(log_file, span[1] - span[0]), dates)
+
+    def iter_cookies_on_dates_in_range(
+        self, file_name: str, start: int, end: int, dates: Set[datetime.date]
+    ) -> Iterator[str]:
+        """Yield the cookies on the target date(s) of the lines starting in the byte range [start, end) of the log file.
+
+        Fused counterpart of iter_entries_in_range(), matching lines as iter_cookies_on_dates()
+        does. Malformed lines are only added to self.malformed_lines and not logged.
+        """
+
+        if is_columnar_log(file_name):
+            if start == 0:
+                yield from self.iter_cookies_on_dates(file_name, dates)
+            return
+        log_file = self.open_log(file_name)
+
+        with log_file:
+            log_file.seek(start)
+            yield from self._match_lines(self._iter_lines_until(log_file, end - start), dates, log_malformed=False)
+
+    def _seek_date_span(self, file_name: str, dates: Set[datetime.date]) -> Optional[Tuple[int, int]]:
+        """Return the byte range of a timestamp-sorted log holding the target date(s), or None to scan it all.
+
+        An empty log gives (0, 0). A compressed log cannot be memory-mapped and an unsorted
+        one cannot be binary searched; either is logged and gives None.
+        """
+
+        if self.get_compression(file_name) is not None:
+            logging.info(f"Compressed log '{file_name}' cannot be memory-mapped. Falling back to a full scan.")
+            return None
+
+        with open(file_name, "rb") as log_file:
+            if os.fstat(log_file.fileno()).st_size == 0:
+                return (0, 0)
+            with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+                span = self._find_date_span(log_map, min(dates), max(dates))
+
+        if span is None:
+            logging.warning(f"Log file '{file_name}' is not sorted by timestamp. Falling back to a full scan.")
+        return span
+
+    def _find_date_span(
+        self, log_map: mmap.mmap, first_date: datetime.date, last_date: datetime.date
+    ) -> Optional[Tuple[int, int]]:
+        """Return the (start, end) byte offsets of the lines dated first_date to last_date.
+
+        Returns None if the log is detected not to be sorted newest first.
+        """
+
+        size = len(log_map)
+        if not self._is_sorted_sample(log_map):
+            return None
+        start = self._bisect_lines(log_map, 0, size, lambda log_date: log_date <= last_date)
+        end = self._bisect_lines(log_map, start, size, lambda log_date: log_date < first_date)
+
+        # Verify the span itself: every valid line must be in range and in descending order.
+        previous_date = last_date
+        for line_start, line_end in self._iter_lines(log_map, start, end):
+            log_date = self._line_date(log_map, line_start, line_end)
+            if log_date is None:
+                continue
+            if log_date > previous_date or log_date < first_date:
+                return None
+            previous_date = log_date
+        return (start, end)
+
+    def _is_sorted_sample(self, log_map: mmap.mmap) -> bool:
+        """Check that evenly spaced sample lines of the log are in descending date order."""
+
+        size = len(log_map)
+        previous_date = None
+        for probe in range(SORTEDNESS_PROBES + 1):
+            line_start = self._line_start(log_map, 0, probe * (size - 1) // SORTEDNESS_PROBES)
+            log_date, _ = self._next_valid_date(log_map, line_start, size)
+            if log_date is None:
+                continue
+            if previous_date is not None and log_date > previous_date:
+                return False
+            previous_date = log_date
+        return True
+
+    def _bisect_lines(self, log_map: mmap.mmap, lo: int, hi: int, is_past: Callable[[datetime.date], bool]) -> int:
+        """Return the offset of the first line in [lo, hi) whose date satisfies is_past, or hi if none does.
+
+        lo and hi must be line boundaries and is_past must be False for the newer lines
+        and True for the older ones. Malformed lines take the date of the next valid line.
+        """
+
+        while lo < hi:
+            line_start = self._line_start(log_map, lo, (lo + hi) // 2)
+            log_date, valid_line_end = self._next_valid_date(log_map, line_start, hi)
+            if log_date is None or is_past(log_date):
+                hi = line_start
+            else:
+                lo = valid_line_end
+        return lo
+
+    def _line_start(self, log_map: mmap.mmap, lo: int, position: int) -> int:
+        """Return the offset of the start of the line containing position, no lower than lo."""
+
+        newline = log_map.rfind(b"\n", lo, position)
+        return lo if newline == -1 else newline + 1
+
+    def _iter_lines(self, log_map: mmap.mmap, start: int, end: int) -> Iterator[Tuple[int, int]]:
+        """Yield the (start, end) offsets of each line in [start, end), end including the newline."""
+
+        while start < end:
+            newline = log_map.find(b"\n", start, end)
+            line_end = end if newline == -1 else newline + 1
+            yield (start, line_end)
+            start = line_end
+
+    def _line_date(self, log_map: mmap.mmap, start: int, end: int) -> Optional[datetime.date]:
+        """Return the date of the line at [start, end), or None if the line is malformed."""
+
+        try:
+            return self.parse_line(log_map[start:end])[1]
+        except (IndexError, ValueError, Exception):
+            return None
+
+    def _next_valid_date(self, log_map: mmap.mmap, start: int, end: int) -> Tuple[Optional[datetime.date], int]:
+        """Return the date of the first valid line in [start, end) and the offset just past that line.
+
+        If there is no valid line in the range, return (None, end).
+        """
+
+        for line_start, line_end in self._iter_lines(log_map, start, end):
+            log_date = self._line_date(log_map, line_start, line_end)
+            if log_date is not None:
+                return (log_date, line_end)
+        return (None, end)
+
+    def _iter_span_entries(self, log_map: mmap.mmap, start: int, end: int) -> Iterator[Tuple[str, datetime.date]]:
+        """Yield the parsed entries of the lines in [start, end), counting and logging malformed lines."""
+
+        yield from self._parse_lines(
+            log_map[line_start:line_end] for line_start, line_end in self._iter_lines(log_map, start, end)
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""This module finds the most active cookies exactly when the distinct cookies do not fit in memory.
+
+Cookies are counted in a dict of at most max_entries cookies, sized from the memory
+budget. If the stream ends before the dict fills up, the answer comes straight from it.
+Otherwise the dict is spilled every time it fills up. Each cookie goes, as a
+'cookie,first,count' record, to one of FANOUT partition files chosen by a hash of the
+cookie. 'first' is the position of the cookie's first occurrence in the stream. Every
+cookie then lives in exactly one partition, so the partitions are counted
+independently, one after the other or in a process pool. A partition that still holds
+more than max_entries distinct cookies is split again on other digits of the hash, as
+often as needed, so memory stays bounded however many distinct cookies there are.
+
+Each partition returns its highest count and the cookies with that count. The maxima
+are merged and the winning cookies sorted by first occurrence, so the answer is the
+same, ties included, as get_most_active_cookies() over the whole stream. It is intended
+to be imported by the 'most_active_cookie.py' file where the ExternalCounter class is
+instantiated.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import tempfile
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from metrics import metrics
+
+# Approximate number of bytes per counted cookie: the 16-character cookie string, its
+# dict entry, the [first, count] list and the ints it holds, with room for dict resizes.
+BYTES_PER_ENTRY = 250
+# Number of partition files each spill or split writes to.
+FANOUT = 16
+# The write buffers of the partition files take at most a quarter of the budget.
+MAX_BUFFER_SIZE = 1024 * 1024
+MIN_BUFFER_SIZE = 4096
+MIN_ENTRIES = 256
+
+# The highest count of a partition and its (first occurrence, cookie) pairs with that count.
+PartitionResult = Tuple[int, List[Tuple[int, str]]]
+
+
+def get_winners(counts: Dict[str, List[int]]) -> PartitionResult:
+    """Return the highest count of a cookie -> [first, count] dict and the (first, cookie) pairs with that count."""
+
+    max_count = max((count for _, count in counts.values()), default=0)
+    return max_count, [(first, cookie) for cookie, (first, count) in counts.items() if count == max_count]
+
+
+def write_partitions(records: Iterable[Tuple[str, int, int]], file_names: List[str], depth: int, buffer_size: int):
+    """Append the (cookie, first, count) records to the partition files chosen by a hash of each cookie.
+
+    Each depth of splitting uses other digits of the hash, so a partition split again
+    spreads its cookies over all its sub-partitions.
+    """
+
+    partition_files = [open(file_name, "ab", buffering=buffer_size) for file_name in file_names]
+    divisor = len(partition_files) ** depth
+    try:
+        for cookie, first, count in records:
+            partition = hash(cookie) // divisor % len(partition_files)
+            partition_files[partition].write(f"{cookie},{first},{count}\n".encode())
+    finally:
+        for partition_file in partition_files:
+            partition_file.close()
+
+
+def iter_records(file_name: str, buffer_size: int) -> Iterable[Tuple[str, int, int]]:
+    """Yield the (cookie, first, count) records of a partition file."""
+
+    with open(file_name, "rb", buffering=buffer_size) as partition_file:
+        for line in partition_file:
+            cookie, first, count = line.rsplit(b",", 2)
+            yield cookie.decode(), int(first), int(count)
+
+
+def count_partition(file_name: str, max_entries: int, buffer_size: int, depth: int = 1) -> PartitionResult:
+    """Count the records of one partition file and return its highest count and the cookies with that count.
+
+    If the partition holds more than max_entries distinct cookies, it is split into
+    FANOUT sub-partitions that are counted one after the other. The file is removed once
+    counted. Defined at module level so it can be sent to the worker processes.
+    """
+
+    counts = {}
+    for cookie, first, count in iter_records(file_name, buffer_size):
+        entry = counts.get(cookie)
+        if entry is not None:
+            entry[1] += count
+        elif len(counts) < max_entries:
+            counts[cookie] = [first, count]
+        else:
+            break
+    else:
+        os.remove(file_name)
+        return get_winners(counts)
+
+    counts.clear()
+    sub_file_names = [f"{file_name}.{index}" for index in range(FANOUT)]
+    write_partitions(iter_records(file_name, buffer_size), sub_file_names, depth, buffer_size)
+    os.remove(file_name)
+    return merge_winners(count_partition(name, max_entries, buffer_size, depth + 1) for name in sub_file_names)
+
+
+def merge_winners(results: Iterable[PartitionResult]) -> PartitionResult:
+    """Merge the results of several partitions into the highest count over all of them and its cookies."""
+
+    max_count, winners = 0, []
+    for count, partition_winners in results:
+        if count > max_count:
+            max_count, winners = count, list(partition_winners)
+        elif count == max_count:
+            winners += partition_winners
+    return max_count, winners
+
+
+class ExternalCounter:
+    """Find the most active cookies of a stream exactly, spilling counts to disk beyond a memory budget."""
+
+    def __init__(self, memory_budget: int, workers: int = 1, directory: Optional[str] = None) -> None:
+        """Count within about memory_budget bytes, in workers processes, with partition files in directory.
+
+        The budget is shared by the workers. It covers the counts and the write buffers,
+        not the interpreter itself. directory defaults to the system temporary directory.
+        """
+
+        self.workers = max(1, workers)
+        self.directory = directory
+        budget = memory_budget // self.workers
+        self.buffer_size = max(MIN_BUFFER_SIZE, min(MAX_BUFFER_SIZE, budget // (4 * FANOUT)))
+        self.max_entries = max(MIN_ENTRIES, (budget - FANOUT * self.buffer_size) // BYTES_PER_ENTRY)
+        # Number of times the counts were spilled to disk by the last call.
+        self.spills = 0
+
+    def get_most_active_cookies(self, cookies: Iterable[str]) -> Tuple[List[str], int]:
+        """Return the most active cookies of the stream, in order of first occurrence, and their count.
+
+        The list is empty if the stream is empty.
+        """
+
+        self.spills = 0
+        counts = {}
+        with tempfile.TemporaryDirectory(prefix="most_active_cookie-", dir=self.directory) as directory:
+            file_names = [os.path.join(directory, str(index)) for index in range(FANOUT)]
+            with metrics.stage("count"):
+                for first, cookie in enumerate(cookies):
+                    entry = counts.get(cookie)
+                    if entry is not None:
+                        entry[1] += 1
+                        continue
+                    if len(counts) >= self.max_entries:
+                        self._spill(counts, file_names)
+                    counts[cookie] = [first, 1]
+
+            if not self.spills:
+                max_count, winners = get_winners(counts)
+            else:
+                self._spill(counts, file_names)
+                with metrics.stage("count"):
+                    max_count, winners = merge_winners(self._count_partitions(file_names))
+        metrics.count("count", "spills", self.spills)
+
+        with metrics.stage("select"):
+            return [cookie for _, cookie in sorted(winners)], max_count
+
+    def _spill(self, counts: Dict[str, List[int]], file_names: List[str]) -> None:
+        """Append the counts to the partition files and clear them."""
+
+        write_partitions(
+            ((cookie, first, count) for cookie, (first, count) in counts.items()), file_names, 0, self.buffer_size
+        )
+        counts.clear()
+        self.spills += 1
+
+    def _count_partitions(self, file_names: List[str]) -> List[PartitionResult]:
+        """Count every partition file, in the process pool if there are several workers."""
+
+        file_names = [file_name for file_name in file_names if os.path.getsize(file_name)]
+        if self.workers == 1:
+            return [count_partition(file_name, self.max_entries, self.buffer_size) for file_name in file_names]
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = [
+                executor.submit(count_partition, file_name, self.max_entries, self.buffer_size)
+                for file_name in file_names
+            ]
+            return [future.result() for future in futures]
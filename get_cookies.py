@@ -10,9 +10,13 @@ so the file can be run, this module is intended to be imported by the
 from datetime import datetime
 import datetime as dt
 
+import heapq
 import logging
-import sys
-from typing import List, Dict, Set, Tuple
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from cookie_columns import CookieColumns
+from cookie_errors import InvalidDateError, InvalidFrequenciesError, NoCookiesFoundError, raise_or_exit
+from metrics import metrics
 
 # Default variables
 # These globals are only used if main() method is run, NOT in normal use of the program.
@@ -32,6 +36,10 @@ COOKIE_LIST = [
 class CookieGetter:
     """Output a list of the most active cookies given a timestamped cookie log file and a target date."""
 
+    def __init__(self, exit_on_error: bool = True) -> None:
+        # Log a critical message and stop execution on unusable input, or raise a CookieLogError.
+        self.exit_on_error = exit_on_error
+
     def string_to_date(self, date_string: str) -> datetime:
         """Convert a string to a datetime.date object.  Returns a datetime.date.
 
@@ -56,23 +64,36 @@ class CookieGetter:
 
         filtered_cookie_list = []
 
-        for cookie_entry in cookie_list:
-            # Isolate the date portion of the log entry string
-            cookie = cookie_entry[0]  # string
-            log_date = cookie_entry[1]  # datetime.date
+        with metrics.stage("filter"):
+            for cookie_entry in cookie_list:
+                # Isolate the date portion of the log entry string
+                cookie = cookie_entry[0]  # string
+                log_date = cookie_entry[1]  # datetime.date
 
-            # Convert the date string to datetime.date object
-            # log_date = datetime.strptime(log_date, "%Y-%m-%d").date()
-            if log_date in dates:
-                filtered_cookie_list.append(cookie)
+                # Convert the date string to datetime.date object
+                # log_date = datetime.strptime(log_date, "%Y-%m-%d").date()
+                if log_date in dates:
+                    filtered_cookie_list.append(cookie)
 
         # If resulting list is empty, there are no cookies on the specified date. Nothing to do.
         if not filtered_cookie_list:
-            logging.critical(f"No cookies found on date: {dates}. Exiting")
-            sys.exit()
+            raise_or_exit(NoCookiesFoundError(f"No cookies found on date: {dates}. Exiting"), self.exit_on_error)
         else:
             return filtered_cookie_list
 
+    def iter_cookies_on_dates(
+        self, cookie_entries: Iterable[Tuple[str, datetime.date]], dates: Set[datetime]
+    ) -> Iterator[str]:
+        """Return an iterator over each cookie that appears on the specified date(s).
+
+        Streaming counterpart of filter_list_on_dates(). The entries are consumed one
+        at a time, e.g. straight from CSVFileReader.iter_entries(), and nothing is
+        accumulated, so the output can be fed directly to get_cookie_frequencies().
+        """
+
+        cookies = (cookie for cookie, log_date in cookie_entries if log_date in dates)
+        return metrics.iter_stage("filter", cookies)
+
     def get_most_active_cookies(self, cookie_list: List[str]) -> List[str]:
         """Return the most frequently occuring cookies given a list of cookies with frequencies.
 
@@ -82,10 +103,20 @@ class CookieGetter:
         """
 
         cookie_frequency = self.get_cookie_frequencies(cookie_list)
-        max_frequency = self.get_max_value_in_dict(cookie_frequency)
-        most_common_cookie_list = [
-            cookie for cookie in cookie_frequency.keys() if cookie_frequency[cookie] == max_frequency
-        ]
+        return self.get_most_active_from_frequencies(cookie_frequency)
+
+    def get_most_active_from_frequencies(self, cookie_frequency: Dict) -> List[str]:
+        """Return the cookies with the highest frequency given a dict of cookie frequencies.
+
+        Pass the dict to get_max_value_in_dict().
+        Return a list of cookies with frequencies equal to max_frequency, in dict order.
+        """
+
+        with metrics.stage("select"):
+            max_frequency = self.get_max_value_in_dict(cookie_frequency)
+            most_common_cookie_list = [
+                cookie for cookie in cookie_frequency.keys() if cookie_frequency[cookie] == max_frequency
+            ]
         return most_common_cookie_list
 
     def get_max_value_in_dict(self, hashmap: Dict) -> int:
@@ -102,10 +133,12 @@ class CookieGetter:
                     max_value = hashmap[key]
             return max_value
         except Exception:
-            logging.critical(
-                f"There is a problem with the dictionary '{hashmap}'. Keys are strings, values are integers."
+            raise_or_exit(
+                InvalidFrequenciesError(
+                    f"There is a problem with the dictionary '{hashmap}'. Keys are strings, values are integers."
+                ),
+                self.exit_on_error,
             )
-            sys.exit()
 
     def get_cookie_frequencies(self, log: List[str]) -> Dict:
         """Return a dict with each cookie and the number of times it occurs.
@@ -115,51 +148,178 @@ class CookieGetter:
         """
 
         cookie_frequency = {}
-        for line in log:
-            # parse cookie from entries in log
-            log_entry = line.split(",")
-            cookie = log_entry[0]
-
-            if cookie in cookie_frequency.keys():
-                cookie_frequency[cookie] += 1
-            else:
-                cookie_frequency[cookie] = 1
+        with metrics.stage("count"):
+            for line in log:
+                # parse cookie from entries in log
+                cookie = line.split(",", 1)[0]
+                cookie_frequency[cookie] = cookie_frequency.get(cookie, 0) + 1
+        metrics.count("count", "distinct_cookies", len(cookie_frequency))
         return cookie_frequency
 
+    def get_cookie_frequencies_in_columns(self, cookie_columns: CookieColumns, dates: Set[datetime]) -> Dict:
+        """Return a dict with each cookie on the specified date(s) and the number of times it occurs.
+
+        As input, take a CookieColumns container, e.g. from CSVFileReader.read_file_to_columns().
+        The entries are counted on their integer cookie ids and day ordinals, without
+        building a tuple or a date object per entry. Only the ids found are turned back
+        into cookie strings, in the order of their first occurrence.
+        """
+
+        days = {log_date.toordinal() for log_date in dates}
+        id_frequency = {}
+        for cookie_id, day in zip(cookie_columns.cookie_column, cookie_columns.day_column):
+            if day in days:
+                id_frequency[cookie_id] = id_frequency.get(cookie_id, 0) + 1
+        return {cookie_columns.cookies[cookie_id]: count for cookie_id, count in id_frequency.items()}
+
     def print_list(self, list_: List) -> None:
         """Print elements of list on separate lines."""
 
         for element in list_:
             print(element)
 
+    def strings_to_dates(self, date_strings: List[str]) -> Set[datetime]:
+        """Convert a list of date strings to a set of datetime.date objects.
+
+        Invalid dates are logged by string_to_date() and dropped. If no valid date
+        remains, log a critical message and stop execution.
+        """
+
+        dates = {self.string_to_date(date_string) for date_string in date_strings}
+
+        # Check if all dates are None. If so, stop execution because there are no valid dates.
+        if all(date is None for date in dates):
+            raise_or_exit(
+                InvalidDateError("No valid date given. Please enter date in 'YYYY-MM-DD' format. Exit."),
+                self.exit_on_error,
+            )
+        dates.discard(None)
+        return dates
+
+    def get_date_strings_in_range(self, from_string: str, to_string: str) -> List[str]:
+        """Return every date from from_string to to_string inclusive as 'YYYY-MM-DD' strings.
+
+        Both ends must be valid dates in YYYY-MM-DD format, with from_string not after
+        to_string. Otherwise log a critical message and stop execution.
+        """
+
+        from_date = self.string_to_date(from_string)
+        to_date = self.string_to_date(to_string)
+        if from_date is None or to_date is None or from_date > to_date:
+            raise_or_exit(
+                InvalidDateError(
+                    f"Invalid date range '{from_string}' to '{to_string}'. Give both ends, first date first."
+                ),
+                self.exit_on_error,
+            )
+        day_count = (to_date - from_date).days + 1
+        return [(from_date + dt.timedelta(days=day)).isoformat() for day in range(day_count)]
+
+    def stream_most_active_cookies(
+        self, cookie_entries: Iterable[Tuple[str, datetime.date]], date_strings: List[str]
+    ) -> List[str]:
+        """Return the most active cookies on the specified date(s) in a single pass over the entries.
+
+        Unlike main(), no intermediate list is built: the entries are filtered and
+        counted as they arrive, so memory is bounded by the number of distinct cookies
+        on the target date(s) rather than by the size of the log.
+        """
+
+        dates = self.strings_to_dates(date_strings)
+        cookie_frequency = self.get_cookie_frequencies(self.iter_cookies_on_dates(cookie_entries, dates))
+        return self.get_most_active_on_dates(cookie_frequency, dates)
+
+    def get_most_active_on_dates(self, cookie_frequency: Dict, dates: Set[datetime]) -> List[str]:
+        """Return the most active cookies given the cookie frequencies counted on the specified date(s).
+
+        If nothing was counted, there are no cookies on the specified date(s): log a
+        critical message and stop execution, as filter_list_on_dates() does.
+        """
+
+        self.require_cookies_on_dates(cookie_frequency, dates)
+        return self.get_most_active_from_frequencies(cookie_frequency)
+
+    def require_cookies_on_dates(self, cookie_frequency: Dict, dates: Set[datetime]) -> None:
+        """Stop execution if no cookie was counted on the specified date(s).
+
+        If nothing was counted, there are no cookies on the specified date(s). Nothing to do.
+        """
+
+        if not cookie_frequency:
+            raise_or_exit(NoCookiesFoundError(f"No cookies found on date: {dates}. Exiting"), self.exit_on_error)
+
+    def get_top_cookies(self, cookie_frequency: Dict, k: int) -> List[Tuple[str, int]]:
+        """Return the k most frequent cookies as (cookie, count) tuples, most frequent first.
+
+        Input is a frequency hashmap as generated by get_cookie_frequencies().
+        Uses a heap of size k, so the cost is O(n log k) rather than a full sort.
+        Cookies with equal counts keep the order of the dict, i.e. their order of first
+        occurrence in the log, so the cookies returned by get_most_active_cookies() are
+        exactly the first entries of the result when k is at least the number of ties.
+        """
+
+        with metrics.stage("select"):
+            return heapq.nlargest(k, cookie_frequency.items(), key=lambda item: item[1])
+
+    def get_frequency_histogram(self, cookie_frequency: Dict) -> Dict[int, int]:
+        """Return a dict mapping each count to the number of cookies seen that many times, by ascending count.
+
+        Input is a frequency hashmap as generated by get_cookie_frequencies().
+        """
+
+        histogram = {}
+        with metrics.stage("select"):
+            for count in cookie_frequency.values():
+                histogram[count] = histogram.get(count, 0) + 1
+        return dict(sorted(histogram.items()))
+
+    def get_cookie_frequencies_by_date(
+        self, cookie_entries: Iterable[Tuple[str, datetime.date]], dates: Set[datetime]
+    ) -> Dict[datetime, Dict]:
+        """Return a dict of cookie frequencies for each of the specified dates, counted in a single pass.
+
+        Entries are consumed one at a time as in iter_cookies_on_dates(). Dates are keyed
+        in the order they are first met in the entries, and dates with no cookies are
+        left out.
+        """
+
+        frequencies_by_date = {}
+        with metrics.stage("count"):
+            for cookie, log_date in cookie_entries:
+                if log_date in dates:
+                    cookie_frequency = frequencies_by_date.get(log_date)
+                    if cookie_frequency is None:
+                        cookie_frequency = frequencies_by_date[log_date] = {}
+                    cookie_frequency[cookie] = cookie_frequency.get(cookie, 0) + 1
+        return frequencies_by_date
+
+    def merge_cookie_frequencies(self, frequency_dicts: Iterable[Dict]) -> Dict:
+        """Return a single dict of cookie frequencies summing the given dicts.
+
+        The dicts must be given in log order (e.g. one per shard, first shard first).
+        Cookies keep the order of their first occurrence, so ties are reported in the
+        same order as when the whole log is counted in one go.
+        """
+
+        cookie_frequency = {}
+        for frequencies in frequency_dicts:
+            for cookie, count in frequencies.items():
+                cookie_frequency[cookie] = cookie_frequency.get(cookie, 0) + count
+        return cookie_frequency
+
     def main(self, cookies: List[Tuple[str, datetime.date]], date_strings: List[str]) -> List[str]:
-        """Given a cookie log file and a list of dates, output a list of the most active cookies on a specified date.
+        """Given the entries of a cookie log and a list of dates, output a list of the most active cookies on a specified date.
 
         Convert date strings to datetime.date objects.
-        Read log file and store each entry in a list.
-        Reduce the list of cookies to cookies that occur on target date.
+        Reduce the entries, e.g. as read by CSVFileReader.read_file_to_list(), to cookies that occur on target date.
         Return the most common cookie(s) which occur on target date(s).
         In the event of FileNotFoundError, log an error message.
         """
 
-        logging.basicConfig(
-            format="%(asctime)s,%(msecs)03d %(levelname)-8s %(message)s",
-            level=logging.INFO,
-            datefmt="%Y-%m-%d %H:%M:%S",
-            handlers=[logging.FileHandler("cookies.log"), logging.StreamHandler()],
-        )
+        # Logging is configured once by the caller, not on every query.
 
-        # try:
-
-        # make this a set
-        dates = {self.string_to_date(date_string) for date_string in date_strings}
-
-        # Check if all dates are None. If so, stop execution because there are no valid dates.
-        if all(date is None for date in dates):
-            logging.critical("No valid date given. Please enter date in 'YYYY-MM-DD' format. Exit.")
-            sys.exit()
-        # log_file_as_list = self.read_file_to_list(log_file)
-        cookies_on_date = self.filter_list_on_dates(COOKIE_LIST, dates)
+        dates = self.strings_to_dates(date_strings)
+        cookies_on_date = self.filter_list_on_dates(cookies, dates)
         most_active_cookies_on_date = self.get_most_active_cookies(cookies_on_date)
         return most_active_cookies_on_date
 
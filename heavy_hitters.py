@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""This module finds the most active cookies of a log approximately, in a fixed amount of memory.
+
+It implements the Space-Saving algorithm: at most 'capacity' cookies are monitored, each
+with a count and the most it may overestimate the true count. When a cookie that is not
+monitored arrives and all counters are in use, the cookie with the smallest count is
+replaced and the newcomer inherits that count (plus one) as its overestimation. Counts
+are never underestimated, and no count is overestimated by more than the smallest
+monitored count, which is itself at most (cookies counted / capacity). It is intended
+to be imported by the 'most_active_cookie.py' file where the SpaceSaving class is
+instantiated.
+"""
+
+from typing import Dict, Iterable, Tuple
+
+# Approximate number of bytes used per monitored cookie: the 16-character cookie string,
+# its entries in the count, error and bucket dicts and the int objects they hold.
+BYTES_PER_COUNTER = 400
+
+
+class SpaceSaving:
+    """Track the most frequent cookies of a stream in a fixed number of counters."""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(1, capacity)
+        # Number of cookies counted so far, monitored or not.
+        self.total = 0
+        self.counts = {}
+        self.errors = {}
+        # Monitored cookies grouped by count, each group kept in arrival order, so the
+        # cookie to evict (the oldest with the smallest count) is found in O(1).
+        self.buckets = {}
+        self.min_count = 0
+
+    @classmethod
+    def for_memory_budget(cls, memory_budget: int) -> "SpaceSaving":
+        """Return a SpaceSaving sized to use roughly memory_budget bytes."""
+
+        return cls(memory_budget // BYTES_PER_COUNTER)
+
+    def offer(self, cookie: str) -> None:
+        """Count one occurrence of cookie."""
+
+        self.total += 1
+        count = self.counts.get(cookie)
+        if count is not None:
+            self._move(cookie, count, count + 1)
+        elif len(self.counts) < self.capacity:
+            self.errors[cookie] = 0
+            self._add(cookie, 1)
+            self.min_count = 1
+        else:
+            min_count = self.min_count
+            evicted = next(iter(self.buckets[min_count]))
+            self._remove(evicted, min_count)
+            del self.errors[evicted]
+            self.errors[cookie] = min_count
+            self._add(cookie, min_count + 1)
+
+    def offer_all(self, cookies: Iterable[str]) -> "SpaceSaving":
+        """Count every cookie of an iterable, e.g. CookieGetter.iter_cookies_on_dates(). Return self."""
+
+        for cookie in cookies:
+            self.offer(cookie)
+        return self
+
+    def max_error(self) -> int:
+        """Return the largest possible overestimation of any count, also the most any unmonitored cookie was seen.
+
+        Zero while fewer cookies than the capacity have been seen, as every count is then exact.
+        """
+
+        return self.min_count if len(self.counts) >= self.capacity else 0
+
+    def get_bounds(self, cookie: str) -> Tuple[int, int]:
+        """Return the (lower, upper) bounds of the true count of a monitored cookie."""
+
+        return (self.counts[cookie] - self.errors[cookie], self.counts[cookie])
+
+    def get_candidates(self) -> Dict[str, Tuple[int, int]]:
+        """Return the cookies that may be the most active, with the (lower, upper) bounds of their counts.
+
+        A cookie is a candidate if its upper bound reaches the best lower bound of any
+        cookie. Candidates are ordered by descending upper bound.
+        """
+
+        if not self.counts:
+            return {}
+        best_lower_bound = max(self.counts[cookie] - self.errors[cookie] for cookie in self.counts)
+        candidates = {
+            cookie: self.get_bounds(cookie) for cookie in self.counts if self.counts[cookie] >= best_lower_bound
+        }
+        return dict(sorted(candidates.items(), key=lambda item: item[1][1], reverse=True))
+
+    def is_complete(self) -> bool:
+        """Return True if every cookie that may be the most active is among the candidates.
+
+        That is the case when the best lower bound is above the most an unmonitored cookie
+        can have been seen.
+        """
+
+        candidates = self.get_candidates()
+        return bool(candidates) and max(lower for lower, _ in candidates.values()) > self.max_error()
+
+    def _add(self, cookie: str, count: int) -> None:
+        """Start monitoring cookie with the given count."""
+
+        self.counts[cookie] = count
+        self.buckets.setdefault(count, {})[cookie] = None
+
+    def _remove(self, cookie: str, count: int) -> None:
+        """Stop monitoring cookie, moving min_count up if its bucket was the smallest and is now empty."""
+
+        del self.counts[cookie]
+        bucket = self.buckets[count]
+        del bucket[cookie]
+        if not bucket:
+            del self.buckets[count]
+            if count == self.min_count:
+                self.min_count = count + 1
+
+    def _move(self, cookie: str, count: int, new_count: int) -> None:
+        """Move a monitored cookie from the bucket of count to the bucket of new_count."""
+
+        self._remove(cookie, count)
+        self._add(cookie, new_count)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""This module measures where the time of a run goes, stage by stage.
+
+The reading and query methods of CSVFileReader and CookieGetter report to the shared
+'metrics' instance: reading raw lines ('read'), parsing them ('parse'), filtering on the
+target dates ('filter'), counting cookies ('count') and picking the answer ('select').
+For each stage it records the wall and CPU time spent in the stage itself (time spent
+in a nested stage, e.g. parsing the lines a filter pulls, is charged to that stage),
+the items it produced, the bytes read and stage specific counters such as the lines
+skipped or the distinct cookies. With memory tracing, the peak memory allocated while
+each stage ran is recorded with tracemalloc, and a cProfile profile of the whole run can
+be written too.
+
+Metrics are disabled by default: stage() then returns a shared no-op context and
+iter_stage() returns the iterable unchanged, so the cost is one method call per stage,
+not per line. It is intended to be imported by the 'most_active_cookie.py' file where
+metrics are enabled and reported with the --stats flag.
+"""
+
+import contextlib
+import json
+import time
+from typing import ContextManager, Dict, Iterable, Iterator, Optional
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows: the peak RSS is then not reported.
+    resource = None
+
+STAGES = ["read", "parse", "filter", "count", "select"]
+
+
+class NoStage:
+    """A context manager doing nothing, like contextlib.nullcontext() which needs Python 3.7."""
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        return None
+
+
+NO_STAGE = NoStage()
+
+
+class Metrics:
+    """Record the time, items, bytes, counters and peak memory of each stage of a run."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.trace_memory = False
+        self.stages = {}
+        self._stack = []
+        self._mark = (0.0, 0.0)
+        self._started = (0.0, 0.0)
+        self._profiler = None
+        self._profile_file_name = None
+
+    def enable(self, trace_memory: bool = False, profile_file_name: Optional[str] = None) -> None:
+        """Start recording. Optionally trace memory allocations and profile the run with cProfile."""
+
+        self.enabled = True
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self._stack = []
+        self._started = self._mark = (time.perf_counter(), time.process_time())
+        # tracemalloc and cProfile are imported only when used: most runs, e.g. result cache hits, need neither.
+        if trace_memory:
+            import tracemalloc
+
+            tracemalloc.start()
+        if profile_file_name:
+            import cProfile
+
+            self._profile_file_name = profile_file_name
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def disable(self) -> Dict:
+        """Stop recording, write the cProfile profile if one was asked for and return the report."""
+
+        report = self.get_report()
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self._profile_file_name)
+            self._profiler = None
+        if self.trace_memory:
+            import tracemalloc
+
+            tracemalloc.stop()
+        self.enabled = False
+        return report
+
+    def stage(self, name: str) -> ContextManager:
+        """Return a context manager timing the code it wraps as stage name."""
+
+        if not self.enabled:
+            return NO_STAGE
+        return self._time_stage(name)
+
+    def iter_stage(self, name: str, iterable: Iterable, count_bytes: bool = False) -> Iterable:
+        """Return iterable with the time taken to produce each item charged to stage name.
+
+        The items are counted, and with count_bytes their lengths are added to the bytes
+        of the stage. When metrics are disabled, iterable is returned as it is.
+        """
+
+        if not self.enabled:
+            return iterable
+        return self._iter_stage(name, iter(iterable), count_bytes)
+
+    def count(self, name: str, counter: str, value: int) -> None:
+        """Add value to a counter of stage name, e.g. count('parse', 'lines_skipped', 3)."""
+
+        if self.enabled:
+            stage = self._get_stage(name)
+            stage[counter] = stage.get(counter, 0) + value
+
+    def get_report(self) -> Dict:
+        """Return the recorded stages, the total and unaccounted times and the peak RSS of the process."""
+
+        wall_seconds = time.perf_counter() - self._started[0]
+        cpu_seconds = time.process_time() - self._started[1]
+        stages = {name: dict(self.stages[name]) for name in sorted(self.stages, key=self._stage_order)}
+        return {
+            "stages": stages,
+            "wall_seconds": wall_seconds,
+            "cpu_seconds": cpu_seconds,
+            "unaccounted_wall_seconds": wall_seconds - sum(stage["wall_seconds"] for stage in stages.values()),
+            # ru_maxrss is in kilobytes on Linux. None where there is no resource module.
+            "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource else None,
+        }
+
+    def format_report(self, report: Dict, output_format: str = "human") -> str:
+        """Return the report as indented JSON, or as a table with one line per stage for 'human'."""
+
+        if output_format == "json":
+            return json.dumps(report, indent=2)
+        lines = [f"{'stage':<8}{'wall s':>10}{'cpu s':>10}{'share':>8}{'items':>12}{'bytes':>14}  counters"]
+        for name, stage in report["stages"].items():
+            counters = {
+                counter: value
+                for counter, value in stage.items()
+                if counter not in ("wall_seconds", "cpu_seconds", "items", "bytes")
+            }
+            share = stage["wall_seconds"] / report["wall_seconds"] if report["wall_seconds"] else 0
+            lines.append(
+                f"{name:<8}{stage['wall_seconds']:>10.3f}{stage['cpu_seconds']:>10.3f}{share:>8.1%}"
+                f"{stage['items']:>12}{stage['bytes']:>14}  "
+                + " ".join(f"{counter}={value}" for counter, value in counters.items())
+            )
+        lines.append(
+            f"{'total':<8}{report['wall_seconds']:>10.3f}{report['cpu_seconds']:>10.3f}{'':>8}{'':>12}{'':>14}  "
+            f"unaccounted_wall_seconds={report['unaccounted_wall_seconds']:.3f} "
+            f"peak_rss_bytes={report['peak_rss_bytes']}"
+        )
+        return "\n".join(lines)
+
+    @contextlib.contextmanager
+    def _time_stage(self, name: str) -> Iterator[None]:
+        """Charge the time spent in the with block to stage name."""
+
+        self._enter(name)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def _iter_stage(self, name: str, iterator: Iterator, count_bytes: bool) -> Iterator:
+        """Yield the items of iterator, charging the time taken by each next() to stage name."""
+
+        stage = self._get_stage(name)
+        while True:
+            self._enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._exit()
+            stage["items"] += 1
+            if count_bytes:
+                stage["bytes"] += len(item)
+            yield item
+
+    def _enter(self, name: str) -> None:
+        """Charge the time so far to the running stage and start stage name inside it."""
+
+        self._charge()
+        self._get_stage(name)
+        self._stack.append(name)
+
+    def _exit(self) -> None:
+        """Charge the time so far to the innermost stage and go back to the stage it was started in."""
+
+        self._charge()
+        self._stack.pop()
+
+    def _charge(self) -> None:
+        """Add the time since the last mark to the innermost running stage, and the memory peak to every running stage."""
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        if self._stack:
+            stage = self.stages[self._stack[-1]]
+            stage["wall_seconds"] += wall - self._mark[0]
+            stage["cpu_seconds"] += cpu - self._mark[1]
+            if self.trace_memory:
+                import tracemalloc
+
+                _, peak = tracemalloc.get_traced_memory()
+                for name in self._stack:
+                    self.stages[name]["peak_memory_bytes"] = max(self.stages[name]["peak_memory_bytes"], peak)
+                # Before Python 3.9 the peak cannot be reset, so each stage gets the peak of the run so far.
+                if hasattr(tracemalloc, "reset_peak"):
+                    tracemalloc.reset_peak()
+        self._mark = (wall, cpu)
+
+    def _get_stage(self, name: str) -> Dict:
+        """Return the record of stage name, creating it on first use."""
+
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {"wall_seconds": 0.0, "cpu_seconds": 0.0, "items": 0, "bytes": 0}
+            if self.trace_memory:
+                stage["peak_memory_bytes"] = 0
+        return stage
+
+    def _stage_order(self, name: str) -> int:
+        """Sort key putting the stages in pipeline order, unknown stages last."""
+
+        return STAGES.index(name) if name in STAGES else len(STAGES)
+
+
+# Shared by all modules, like the logging configuration.
+metrics = Metrics()
@@ -4,6 +4,12 @@
 How to use it:
 
 $ python3 most_active_cookie.py cookie_log.csv -d 2018-12-09
+$ python3 most_active_cookie.py cookie_log.csv --from 2018-12-07 --to 2018-12-09 --combined
+$ python3 most_active_cookie.py logs/ 'archive/node-*.csv.gz' -d 2018-12-09 --workers 8
+$ python3 most_active_cookie.py logs/ --serve 127.0.0.1:8080
+$ python3 most_active_cookie.py access_cookies.csv --follow --window 15m
+$ python3 most_active_cookie.py logs/ --convert cookies.clog
+$ python3 most_active_cookie.py logs/ --cookie AtY0laUfhglK3lC7
 
 This program parses command line arguments for log file and date.  
 It instantiates the CookieGetter class and calls its methods to
@@ -11,21 +17,661 @@ output the most active cookies on a given day.
 """
 
 import argparse
+import datetime as dt
+import itertools
 import logging
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
 from get_cookies import CookieGetter
 from csv_file_reader import CSVFileReader
+from metrics import metrics
+from read_ahead import DEFAULT_BUFFER_SIZE
+from result_cache import DEFAULT_CACHE_SIZE, ResultCache
+
+# The modules of the other reading modes (cookie_index, cookie_lookup, cardinality, heavy_hitters,
+# window_counter, ...) are imported only by the mode using them, so a result cache hit does not load them.
+
+MEMORY_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
+DURATION_UNITS = {"": 1, "S": 1, "M": 60, "H": 3600, "D": 86400}
+
+
+def memory_size(size: str) -> int:
+    """Convert a memory size such as '512K', '64M' or '2G' to a number of bytes for argparse."""
+
+    size = size.strip().upper().rstrip("B")
+    unit = size[-1:] if size[-1:] in MEMORY_UNITS else ""
+    try:
+        return int(float(size[: len(size) - len(unit)]) * MEMORY_UNITS[unit])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid memory size: '{size}'. Use e.g. '512K', '64M' or '2G'.")
+
+
+def positive_int(number: str) -> int:
+    """Convert a count such as '10' to an int for argparse, refusing zero and negative counts."""
+
+    try:
+        value = int(number)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"invalid count: '{number}'. Use a whole number of at least 1.")
+    return value
+
+
+def non_negative_int(number: str) -> int:
+    """Convert a count such as '4' to an int for argparse, accepting 0 but refusing negative counts."""
+
+    try:
+        value = int(number)
+    except ValueError:
+        value = -1
+    if value < 0:
+        raise argparse.ArgumentTypeError(f"invalid count: '{number}'. Use a whole number of at least 0.")
+    return value
+
+
+def duration(duration_string: str) -> int:
+    """Convert a duration such as '90s', '15m', '2h' or '1d' to a number of seconds for argparse."""
+
+    duration_string = duration_string.strip().upper()
+    unit = duration_string[-1:] if duration_string[-1:] in DURATION_UNITS else ""
+    try:
+        seconds = int(float(duration_string[: len(duration_string) - len(unit)]) * DURATION_UNITS[unit])
+    except ValueError:
+        seconds = 0
+    if seconds < 1:
+        raise argparse.ArgumentTypeError(f"invalid duration: '{duration_string}'. Use e.g. '90s', '15m' or '2h'.")
+    return seconds
 
 
 def parse_arguments():
-    """Parse the log file name and date from the command line."""
+    """Parse the log file names and date from the command line.
+
+    Exit with a usage error, status 2, if no date is given to a mode that needs one.
+    """
 
     parser = argparse.ArgumentParser(
         description="MOST_ACTIVE_COOKIE: Given a timestamped list of cookies, return the most common cookie on a given date."
     )
-    parser.add_argument("log_file_name", type=str, help="File to read. Comma-separated CSV expected.")
-    parser.add_argument("-d", "--date", type=str, help="Date 'YYYY-MM-DD' to filter on.", required=True)
-    return parser.parse_args()
+    parser.add_argument(
+        "log_file_names",
+        type=str,
+        nargs="+",
+        metavar="log_file_name",
+        help="File(s), directories or glob patterns to read, counted as one log. Comma-separated CSV expected.",
+    )
+    parser.add_argument(
+        "-d", "--date", type=str, action="append", help="Date 'YYYY-MM-DD' to filter on. May be repeated."
+    )
+    parser.add_argument("--from", dest="from_date", type=str, help="First date 'YYYY-MM-DD' of a range of dates.")
+    parser.add_argument("--to", dest="to_date", type=str, help="Last date 'YYYY-MM-DD' of a range of dates.")
+    parser.add_argument(
+        "--combined",
+        action="store_true",
+        help="With several dates, also report across all of them, prefixed with 'first..last,'.",
+    )
+    parser.add_argument(
+        "--seek",
+        action="store_true",
+        help="Binary search the timestamp-sorted log for the date instead of scanning the whole file.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=positive_int,
+        default=1,
+        help="Number of processes counting newline-aligned shards of the log in parallel.",
+    )
+    parser.add_argument(
+        "--vectorized",
+        action="store_true",
+        help="Count the fixed-width lines of the log a chunk at a time with NumPy. Ignored if NumPy is not installed.",
+    )
+    parser.add_argument(
+        "--read-ahead",
+        type=non_negative_int,
+        default=0,
+        metavar="BUFFERS",
+        help="Read the logs ahead on a background thread, up to BUFFERS buffers, while parsing. Default: 0, off.",
+    )
+    parser.add_argument(
+        "--read-buffer-size",
+        type=memory_size,
+        default=DEFAULT_BUFFER_SIZE,
+        help="Size of each --read-ahead buffer, e.g. '1M'. Default: 4M.",
+    )
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="Answer from the per-day count index next to the log, building it first if needed.",
+    )
+    parser.add_argument(
+        "--stale-index",
+        choices=["rebuild", "refuse"],
+        default="rebuild",
+        help="What to do with --index or --cookie when the log was truncated or rotated. "
+        "Appended lines are always added.",
+    )
+    parser.add_argument(
+        "--cookie",
+        metavar="ID",
+        help="Print 'YYYY-MM-DD,count' for every day the cookie ID was seen, newest first, from the inverted "
+        "cookie index next to each log, building it first if needed. Dates, if given, limit the days.",
+    )
+    parser.add_argument(
+        "--top",
+        type=positive_int,
+        metavar="K",
+        help="Print the K most active cookies as 'cookie,count' instead of only the most active ones.",
+    )
+    parser.add_argument(
+        "--histogram",
+        action="store_true",
+        help="Print 'count,number of cookies seen that many times' for every count instead.",
+    )
+    parser.add_argument(
+        "--distinct",
+        "--cardinality",
+        action="store_true",
+        help="Print 'YYYY-MM-DD,distinct cookies' for every date, estimated with a fixed-memory HyperLogLog sketch "
+        "per date. --workers processes sketch shards of the log, which are merged. --index and --vectorized "
+        "need --exact.",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        help="With --distinct, the relative standard error of the estimates, e.g. 0.01. Smaller errors take more "
+        "memory: 4 KB per date for the default 0.02, 16 KB for 0.01.",
+    )
+    parser.add_argument(
+        "--exact",
+        action="store_true",
+        help="With --distinct, count the distinct cookies exactly from the full cookie counts of every date instead.",
+    )
+    parser.add_argument(
+        "--approximate",
+        action="store_true",
+        help="Find the most active cookies with a fixed-memory Space-Saving sketch and print 'cookie,lower,upper'.",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=memory_size,
+        default=memory_size("64M"),
+        help="Memory for the --approximate sketch or the --external counts, e.g. '512K', '64M', '2G'. Default: 64M.",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="With --approximate, count the candidate cookies exactly in a second pass over the log.",
+    )
+    parser.add_argument(
+        "--external",
+        action="store_true",
+        help="Find the most active cookies over all the dates exactly, spilling the counts to disk "
+        "beyond --memory-budget. --workers processes count the partitions.",
+    )
+    parser.add_argument(
+        "--spill-dir",
+        metavar="DIR",
+        help="With --external, directory of the partition files. Default: the system temporary directory.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither read nor store the answer in the result cache, which is otherwise on and written under --cache-dir.",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Answer from the logs even if the result cache holds the answer, and store the new answer.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        metavar="DIR",
+        help="Directory of the result cache. Default: $XDG_CACHE_HOME/most_active_cookie or ~/.cache/most_active_cookie.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=memory_size,
+        default=DEFAULT_CACHE_SIZE,
+        help="Size above which the least recently used answers are evicted from the result cache. Default: 16M.",
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="ADDRESS",
+        help="Load the logs once and answer queries over HTTP on 'HOST:PORT' or 'unix:PATH' until interrupted.",
+    )
+    parser.add_argument(
+        "--refresh-interval",
+        type=float,
+        help="With --serve or --follow, seconds between checks for lines appended to the logs. Default: 1.0.",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="Follow the logs as they grow, even if rotated, and print 'window end,cookie,count' for the most active "
+        "cookies of the last --window whenever they change, until interrupted.",
+    )
+    parser.add_argument(
+        "--window",
+        type=duration,
+        help="With --follow, the span of log time to count, e.g. '90s', '15m', '2h'. Default: 15m.",
+    )
+    parser.add_argument(
+        "--convert",
+        metavar="FILE",
+        help="Convert the logs into one binary columnar log FILE, partitioned by day, which can then be queried "
+        "like a CSV log without parsing.",
+    )
+    parser.add_argument(
+        "--stats",
+        nargs="?",
+        const="human",
+        choices=["human", "json"],
+        help="Print the time, items, bytes and counters of each stage to stderr, as a table or JSON. "
+        "Stages run by --workers processes are not included.",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="With --stats, also record the peak memory allocated in each stage with tracemalloc. Slows the run.",
+    )
+    parser.add_argument("--profile", metavar="FILE", help="Write a cProfile profile of the run to FILE.")
+    args = parser.parse_args()
+    if not (args.date or args.from_date or args.to_date or args.cookie or args.follow or args.serve or args.convert):
+        parser.error(
+            "a date is required: give -d, or --from and --to, unless using --cookie, --follow, --serve or --convert"
+        )
+    if bool(args.from_date) != bool(args.to_date):
+        parser.error("--from and --to must be given together")
+    if (args.top or args.histogram) and (args.external or args.approximate):
+        parser.error("--top and --histogram cannot be combined with --external or --approximate")
+    if args.distinct and not args.exact and (args.index or args.vectorized):
+        parser.error("--distinct can only be combined with --index or --vectorized when counting with --exact")
+    return args
+
+
+def count_cookies_on_dates(args, cg: CookieGetter, dates: Set[dt.date]) -> Dict:
+    """Return the cookie frequencies on the target date(s) using the reading mode chosen on the command line."""
+
+    if args.index:
+        return cg.merge_cookie_frequencies(
+            cookie_index.load_frequencies(dates) for cookie_index in open_indexes(args, dates)
+        )
+    if args.workers > 1:
+        # Imported only for --workers, like cookie_server for --serve: multiprocessing is slow to import.
+        from shard_counter import ShardCounter
+
+        return ShardCounter(args.workers).count_cookies_on_dates(args.log_file_names, dates)
+    vector_counter = get_vector_counter(args)
+    if vector_counter is not None:
+        return vector_counter.count_cookies_on_dates(args.log_file_names, dates)
+
+    return cg.get_cookie_frequencies(read_cookies(args, dates))
+
+
+def count_cookies_by_date(args, cg: CookieGetter, dates: Set[dt.date]) -> Dict[dt.date, Dict]:
+    """Return the cookie frequencies of each target date, counted in a single read of the log.
+
+    Dates on which no cookie was seen are left out.
+    """
+
+    if args.index:
+        cookie_indexes = open_indexes(args, dates)
+        # Newest first, the order of the dates in a timestamp-sorted log.
+        log_dates = sorted(dates, reverse=True)
+        frequencies_by_date = {
+            log_date: cg.merge_cookie_frequencies(
+                cookie_index.load_frequencies({log_date}) for cookie_index in cookie_indexes
+            )
+            for log_date in log_dates
+        }
+        return {log_date: frequencies for log_date, frequencies in frequencies_by_date.items() if frequencies}
+    if args.workers > 1:
+        from shard_counter import ShardCounter
+
+        return ShardCounter(args.workers).count_cookies_by_date(args.log_file_names, dates)
+    vector_counter = get_vector_counter(args)
+    if vector_counter is not None:
+        return vector_counter.count_cookies_by_date(args.log_file_names, dates)
+
+    return cg.get_cookie_frequencies_by_date(read_entries(args, dates), dates)
+
+
+def get_vector_counter(args):
+    """Return a VectorCounter if --vectorized was given and NumPy is installed, None otherwise."""
+
+    if not args.vectorized:
+        return None
+    # Imported only for --vectorized: NumPy is slow to import and may not be installed.
+    import vector_counter
+
+    if not vector_counter.is_available():
+        logging.warning("NumPy is not installed: --vectorized is ignored and the log is parsed line by line.")
+        return None
+    return vector_counter.VectorCounter()
+
+
+def get_report(args, cg: CookieGetter, cookie_frequency: Dict, prefix: str = "") -> List[str]:
+    """Return the lines of the histogram, the top K cookies or the most active cookies, as chosen on the command line.
+
+    Every line is prefixed with prefix, e.g. the date when reporting several dates.
+    """
+
+    if args.histogram:
+        histogram = cg.get_frequency_histogram(cookie_frequency)
+        return [f"{prefix}{count},{cookies}" for count, cookies in histogram.items()]
+    if args.top:
+        top_cookies = cg.get_top_cookies(cookie_frequency, args.top)
+        return [f"{prefix}{cookie},{count}" for cookie, count in top_cookies]
+    return [f"{prefix}{cookie}" for cookie in cg.get_most_active_from_frequencies(cookie_frequency)]
+
+
+def open_indexes(args, dates: Set[dt.date]) -> List:
+    """Return the up-to-date CookieIndex of every log file that may hold entries on the target date(s), in file order."""
+
+    from cookie_index import CookieIndex
+
+    cookie_indexes = []
+    for file_name in CSVFileReader().filter_files_on_dates(args.log_file_names, dates):
+        cookie_index = CookieIndex(file_name)
+        cookie_index.ensure_current(rebuild=args.stale_index == "rebuild")
+        cookie_indexes.append(cookie_index)
+    return cookie_indexes
+
+
+def get_cookie_activity(args, dates: Optional[Set[dt.date]]) -> List[str]:
+    """Return 'YYYY-MM-DD,count' for every day the cookie of --cookie was seen, newest first.
+
+    The counts come from the inverted cookie index of every log file, brought up to date
+    first, and are summed over the files. Only the target date(s) are kept if dates is
+    not None. If the cookie was never seen, a warning is logged and nothing is returned.
+    """
+
+    from cookie_lookup import CookieLookupIndex, merge_day_counts
+
+    day_counts_list = []
+    for file_name in args.log_file_names:
+        cookie_lookup_index = CookieLookupIndex(file_name)
+        cookie_lookup_index.ensure_current(rebuild=args.stale_index == "rebuild")
+        day_counts_list.append(cookie_lookup_index.lookup(args.cookie))
+    day_counts = merge_day_counts(day_counts_list)
+    lines = [f"{log_date},{count}" for log_date, count in day_counts.items() if dates is None or log_date in dates]
+    if not lines:
+        logging.warning(f"Cookie '{args.cookie}' not found in the log(s).")
+    return lines
+
+
+def get_csv_file_reader(args) -> CSVFileReader:
+    """Return a CSVFileReader reading the logs ahead on a background thread if asked to on the command line."""
+
+    return CSVFileReader(read_ahead_buffers=args.read_ahead, read_ahead_size=args.read_buffer_size)
+
+
+def read_entries(args, dates: Set[dt.date]) -> Iterator[Tuple[str, dt.date]]:
+    """Return a stream of the log entries, seeking to the target date(s) if asked to on the command line.
+
+    The log files are read one after the other, leaving out those that cannot hold the
+    target date(s).
+    """
+
+    cfr = get_csv_file_reader(args)
+    file_names = cfr.filter_files_on_dates(args.log_file_names, dates)
+    if args.seek:
+        return itertools.chain.from_iterable(cfr.iter_entries_on_dates(file_name, dates) for file_name in file_names)
+    return itertools.chain.from_iterable(cfr.iter_entries(file_name) for file_name in file_names)
+
+
+def read_cookies(args, dates: Set[dt.date]) -> Iterator[str]:
+    """Return a stream of the cookies on the target date(s), parsed and filtered in one step.
+
+    Like read_entries(), but only the lines on the target date(s) are decoded, and with
+    --seek reading stops once the target date(s) are passed.
+    """
+
+    cfr = get_csv_file_reader(args)
+    file_names = cfr.filter_files_on_dates(args.log_file_names, dates)
+    return itertools.chain.from_iterable(
+        cfr.iter_cookies_on_dates(file_name, dates, seek=args.seek) for file_name in file_names
+    )
+
+
+def get_approximate_most_active(args, cg: CookieGetter, dates: Set[dt.date]) -> List[str]:
+    """Return the lines reporting the most active cookies found by a Space-Saving sketch within the memory budget.
+
+    Without --verify, return every candidate as 'cookie,lower,upper' with the bounds of its
+    count. With --verify, count only the candidates exactly in a second pass and return the
+    most active of them, warning if a cookie the sketch dropped could still tie with them.
+    If the second pass finds none of the candidates, e.g. the log was rotated in between,
+    stop execution as when no cookie is found.
+    """
+
+    from heavy_hitters import SpaceSaving
+
+    space_saving = SpaceSaving.for_memory_budget(args.memory_budget)
+    space_saving.offer_all(read_cookies(args, dates))
+    cg.require_cookies_on_dates(space_saving.counts, dates)
+    max_error = space_saving.max_error()
+    logging.info(
+        f"Counted {space_saving.total} cookie(s) in {space_saving.capacity} counters. "
+        f"Counts are overestimated by at most {max_error}."
+    )
+
+    candidates = space_saving.get_candidates()
+    if not args.verify:
+        return [f"{cookie},{lower},{upper}" for cookie, (lower, upper) in candidates.items()]
+
+    cookie_frequency = cg.get_cookie_frequencies(cookie for cookie in read_cookies(args, dates) if cookie in candidates)
+    cg.require_cookies_on_dates(cookie_frequency, dates)
+    most_active_cookies = cg.get_most_active_from_frequencies(cookie_frequency)
+    if cookie_frequency[most_active_cookies[0]] <= max_error:
+        logging.warning(
+            f"Cookies dropped by the sketch may have been seen up to {max_error} times and could tie or win. "
+            "Increase --memory-budget for a guaranteed answer."
+        )
+    return most_active_cookies
+
+
+def get_distinct_counts(args, cg: CookieGetter, dates: Set[dt.date]) -> List[str]:
+    """Return 'YYYY-MM-DD,count' with the number of distinct cookies of every target date, newest first.
+
+    The counts are estimated with one HyperLogLog sketch per date, or counted exactly from
+    the cookie frequencies of every date with --exact. With --combined, the distinct
+    cookies over all the dates are added, from the sketches merged across the dates.
+    """
+
+    from cardinality import DEFAULT_ERROR_RATE, merge_sketches, sketch_entries_by_date
+
+    error_rate = DEFAULT_ERROR_RATE if args.error_rate is None else args.error_rate
+    if args.exact:
+        frequencies_by_date = count_cookies_by_date(args, cg, dates)
+        counts_by_date = {log_date: len(frequencies) for log_date, frequencies in frequencies_by_date.items()}
+        if args.combined:
+            combined_count = len(cg.merge_cookie_frequencies(frequencies_by_date.values()))
+    else:
+        if args.workers > 1:
+            from shard_counter import ShardCounter
+
+            sketches_by_date = ShardCounter(args.workers).sketch_cookies_by_date(args.log_file_names, dates, error_rate)
+        else:
+            sketches_by_date = sketch_entries_by_date(read_entries(args, dates), dates, error_rate)
+        counts_by_date = {log_date: sketch.estimate() for log_date, sketch in sketches_by_date.items()}
+        if sketches_by_date:
+            combined_sketch = merge_sketches(sketches_by_date.values())
+            combined_count = combined_sketch.estimate()
+            logging.info(
+                f"Estimated with {len(combined_sketch.registers)}-register HyperLogLog sketches, "
+                f"relative standard error {combined_sketch.error_rate:.2%}."
+            )
+    cg.require_cookies_on_dates(counts_by_date, dates)
+
+    lines = []
+    for log_date in sorted(dates, reverse=True):
+        if log_date in counts_by_date:
+            lines.append(f"{log_date},{counts_by_date[log_date]}")
+        else:
+            logging.warning(f"No cookies found on date: {log_date}.")
+    if args.combined:
+        lines.append(f"{min(dates)}..{max(dates)},{combined_count}")
+    return lines
+
+
+def get_external_most_active(args, cg: CookieGetter, dates: Set[dt.date]) -> List[str]:
+    """Return the most active cookies over the target date(s), counted exactly within the memory budget.
+
+    The counts are spilled to hash partitions on disk whenever they outgrow the budget, so
+    the answer is the same as counting in memory whatever the number of distinct cookies.
+    """
+
+    # Imported only for --external, like shard_counter for --workers: multiprocessing is slow to import.
+    from external_counter import ExternalCounter
+
+    external_counter = ExternalCounter(args.memory_budget, args.workers, args.spill_dir)
+    most_active_cookies, _ = external_counter.get_most_active_cookies(read_cookies(args, dates))
+    cg.require_cookies_on_dates(most_active_cookies, dates)
+    if external_counter.spills:
+        logging.info(f"Counts spilled to disk {external_counter.spills} time(s) to stay within the memory budget.")
+    return most_active_cookies
+
+
+def follow_most_active(args, cg: CookieGetter) -> None:
+    """Follow the logs and print the most active cookies of the last --window whenever they change, until interrupted.
+
+    The logs are read from the start, then polled every --refresh-interval seconds. The
+    window ends at the newest timestamp read, so it also works on a log that is no longer
+    written to. The time taken by each update is logged at debug level and, with --stats,
+    charged to the count and select stages.
+    """
+
+    from window_counter import DEFAULT_POLL_INTERVAL, DEFAULT_WINDOW, LogFollower, SlidingWindowCounter
+
+    window_counter = SlidingWindowCounter(duration(DEFAULT_WINDOW) if args.window is None else args.window)
+    followers = [LogFollower(file_name) for file_name in args.log_file_names]
+    refresh_interval = DEFAULT_POLL_INTERVAL if args.refresh_interval is None else args.refresh_interval
+    last_answer = None
+    try:
+        while True:
+            start = time.perf_counter()
+            malformed_lines = sum(follower.csv_file_reader.malformed_lines for follower in followers)
+            with metrics.stage("count"):
+                entries = sum(window_counter.add_all(follower.iter_entries()) for follower in followers)
+            with metrics.stage("select"):
+                most_active_cookies, count = window_counter.get_most_active()
+            logging.debug(f"Counted {entries} line(s) in {(time.perf_counter() - start) * 1000:.3f} ms.")
+            metrics.count("count", "updates", 1)
+
+            malformed_lines = sum(follower.csv_file_reader.malformed_lines for follower in followers) - malformed_lines
+            if malformed_lines > 0:
+                logging.warning(f"Log file contains invalid data. Skipped {malformed_lines} malformed line(s).")
+            if most_active_cookies and (most_active_cookies, count) != last_answer:
+                window_end = dt.datetime.fromtimestamp(window_counter.newest_time, dt.timezone.utc).isoformat()
+                cg.print_list([f"{window_end},{cookie},{count}" for cookie in most_active_cookies])
+                sys.stdout.flush()
+                last_answer = (most_active_cookies, count)
+            time.sleep(refresh_interval)
+    except KeyboardInterrupt:
+        logging.info(f"Stopped following. {window_counter.late_lines} line(s) older than the window were skipped.")
+    finally:
+        for follower in followers:
+            follower.close()
+
+
+def answer_query(args) -> None:
+    """Serve queries or print the answer to the query given on the command line."""
+
+    args.log_file_names = CSVFileReader().expand_paths(args.log_file_names)
+
+    if args.convert:
+        get_csv_file_reader(args).write_columnar_log(args.log_file_names, args.convert)
+        return
+    if args.serve:
+        # Imported only to serve: importing asyncio takes longer than answering from the result cache.
+        from cookie_errors import CookieLogError, raise_or_exit
+        from cookie_server import DEFAULT_REFRESH_INTERVAL, CookieServer, CookieStore
+
+        # Refreshed on a worker thread once serving: a log that cannot be read is answered with 503, not an exit.
+        cookie_store = CookieStore(args.log_file_names, exit_on_error=False)
+        try:
+            cookie_store.refresh()
+        except CookieLogError as error:
+            raise_or_exit(error, exit_on_error=True)
+        refresh_interval = DEFAULT_REFRESH_INTERVAL if args.refresh_interval is None else args.refresh_interval
+        CookieServer(cookie_store, refresh_interval).serve(args.serve)
+        return
+
+    cg = CookieGetter()
+    if args.follow:
+        follow_most_active(args, cg)
+        return
+    DATE_STRINGS = args.date or []
+    if args.from_date or args.to_date:
+        DATE_STRINGS += cg.get_date_strings_in_range(args.from_date, args.to_date)
+
+    if args.cookie:
+        cg.print_list(get_cookie_activity(args, cg.strings_to_dates(DATE_STRINGS) if DATE_STRINGS else None))
+        return
+    dates = cg.strings_to_dates(DATE_STRINGS)
+    if args.no_cache:
+        cg.print_list(get_answer(args, cg, dates))
+        return
+
+    result_cache = ResultCache(args.cache_dir, args.cache_size)
+    query = get_cache_query(args, dates)
+    cache_key = result_cache.get_key(args.log_file_names, query)
+    lines = None if args.refresh else result_cache.get(cache_key)
+    if lines is None:
+        lines = get_answer(args, cg, dates)
+        # Only store the answer if no log changed while it was being read.
+        if result_cache.get_key(args.log_file_names, query) == cache_key:
+            result_cache.put(cache_key, lines)
+    cg.print_list(lines)
+
+
+def get_answer(args, cg: CookieGetter, dates: Set[dt.date]) -> List[str]:
+    """Return the lines answering the query on the target date(s), reading the logs as chosen on the command line."""
+
+    if args.distinct:
+        return get_distinct_counts(args, cg, dates)
+    if args.approximate:
+        return get_approximate_most_active(args, cg, dates)
+    if args.external:
+        return get_external_most_active(args, cg, dates)
+    if len(dates) == 1:
+        cookie_frequency = count_cookies_on_dates(args, cg, dates)
+        cg.require_cookies_on_dates(cookie_frequency, dates)
+        return get_report(args, cg, cookie_frequency)
+
+    frequencies_by_date = count_cookies_by_date(args, cg, dates)
+    cg.require_cookies_on_dates(frequencies_by_date, dates)
+    lines = []
+    for log_date in sorted(dates, reverse=True):
+        if log_date in frequencies_by_date:
+            lines += get_report(args, cg, frequencies_by_date[log_date], prefix=f"{log_date},")
+        else:
+            logging.warning(f"No cookies found on date: {log_date}.")
+    if args.combined:
+        # Days are merged in the order they were met in the log, which keeps ties in log order.
+        cookie_frequency = cg.merge_cookie_frequencies(frequencies_by_date.values())
+        lines += get_report(args, cg, cookie_frequency, prefix=f"{min(dates)}..{max(dates)},")
+    return lines
+
+
+def get_cache_query(args, dates: Set[dt.date]) -> Dict:
+    """Return the query as stored in result cache keys: everything on the command line that changes the answer.
+
+    How the logs are read (--seek, --workers, --vectorized, --index) does not change the answer and is left out.
+    """
+
+    return {
+        "dates": sorted(log_date.isoformat() for log_date in dates),
+        "top": args.top,
+        "histogram": args.histogram,
+        "combined": args.combined,
+        "approximate": [args.memory_budget, args.verify] if args.approximate else None,
+        "external": args.external,
+        "distinct": [args.error_rate, args.exact] if args.distinct else None,
+    }
 
 
 def main() -> None:
@@ -33,7 +679,8 @@ def main() -> None:
 
     Parse cli arguments for log file name and date. Instantiate CookieGetter class
     and call its methods to output most active cookie given command line args.
-    Events are logged to 'cookies.log'.
+    Events are logged to 'cookies.log'. With --stats, the time spent in each stage is
+    printed to stderr once the answer is out, even if the run stopped early.
     """
 
     logging.basicConfig(
@@ -44,17 +691,15 @@ def main() -> None:
     )
 
     args = parse_arguments()
-    LOG_FILE_NAME = args.log_file_name
-
-    if args.date:
-        DATE_STRINGS = [args.date]
-        cg = CookieGetter()
-        cfr = CSVFileReader()
-        cookies_from_file = cfr.read_file_to_list(LOG_FILE_NAME)
-        most_active_cookies = cg.main(cookies_from_file, DATE_STRINGS)
-        cg.print_list(most_active_cookies)
-    else:
-        logging.critical("No date provied. Please supply a date in 'YYYY-MM-DD' format.")
+    if args.stats or args.trace_memory or args.profile:
+        metrics.enable(trace_memory=args.trace_memory, profile_file_name=args.profile)
+    try:
+        answer_query(args)
+    finally:
+        if metrics.enabled:
+            report = metrics.disable()
+            if args.stats or args.trace_memory:
+                print(metrics.format_report(report, args.stats or "human"), file=sys.stderr)
 
 
 if __name__ == "__main__":
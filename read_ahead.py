@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""This module reads a log file ahead on a background thread while the caller parses the lines already read.
+
+Read line by line on one thread, a log is either waiting for the disk or parsing, never
+both: on network-mounted storage the CPU idles during every read and the disk during
+parsing. A ReadAheadFile hands the reads to a background thread. It reads buffer_size
+bytes at a time, completed to the end of their last line, into a queue of at most
+buffer_count buffers, while the calling thread splits the buffers already read into
+lines and parses them. A file read blocks outside the GIL, so the two overlap. The
+kernel is told the file will be read sequentially with posix_fadvise() where there is
+one, so it reads further ahead itself.
+
+A ReadAheadFile is only read from start to end: it has no seek(). It is intended to be
+imported by the 'csv_file_reader.py' file where the ReadAheadFile class is instantiated.
+"""
+
+import io
+import os
+import queue
+import threading
+from typing import BinaryIO, Iterator
+
+DEFAULT_BUFFER_COUNT = 4
+DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+class ReadAheadFile:
+    """Iterate over the lines of a binary file read ahead, buffer_count buffers of buffer_size bytes at most."""
+
+    def __init__(
+        self, raw_file: BinaryIO, buffer_count: int = DEFAULT_BUFFER_COUNT, buffer_size: int = DEFAULT_BUFFER_SIZE
+    ) -> None:
+        self.raw_file = raw_file
+        self.buffer_size = max(1, buffer_size)
+        self.buffers = queue.Queue(maxsize=max(1, buffer_count))
+        self.stopping = threading.Event()
+        self._advise_sequential()
+        self.reader = threading.Thread(target=self._read_ahead, name="read-ahead", daemon=True)
+        self.reader.start()
+
+    def __enter__(self) -> "ReadAheadFile":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def __iter__(self) -> Iterator[bytes]:
+        """Yield the lines of the file in order, each with its newline but the last line's if it has none.
+
+        An error raised by a read on the background thread is raised here.
+        """
+
+        while True:
+            buffer = self.buffers.get()
+            if isinstance(buffer, BaseException):
+                raise buffer
+            if not buffer:
+                return
+            yield from io.BytesIO(buffer)
+
+    def close(self) -> None:
+        """Stop the background thread, dropping the buffers it read ahead, and close the file."""
+
+        self.stopping.set()
+        while self.reader.is_alive():
+            try:
+                self.buffers.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.reader.join()
+        self.raw_file.close()
+
+    def _read_ahead(self) -> None:
+        """Read the file into the queue until its end, a read error or close(), on the background thread.
+
+        The end of the file is marked by an empty buffer and a read error by the exception.
+        """
+
+        try:
+            while not self.stopping.is_set():
+                buffer = self.raw_file.read(self.buffer_size)
+                if buffer:
+                    buffer += self.raw_file.readline()
+                self._put(buffer)
+                if not buffer:
+                    return
+        except Exception as error:
+            self._put(error)
+
+    def _put(self, item) -> None:
+        """Put item in the queue once there is room for it, unless close() is called first."""
+
+        while not self.stopping.is_set():
+            try:
+                self.buffers.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _advise_sequential(self) -> None:
+        """Tell the kernel the file will be read sequentially, where posix_fadvise() and a file descriptor exist."""
+
+        if not hasattr(os, "posix_fadvise"):
+            return
+        try:
+            os.posix_fadvise(self.raw_file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except (OSError, AttributeError, io.UnsupportedOperation):
+            pass
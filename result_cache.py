@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""This module keeps the answers of past queries on disk, so repeating a query on unchanged logs reads no log.
+
+Each answer is stored as a small JSON file in the cache directory, named after a digest
+of its key. The key holds the normalized query (the dates, --top, --histogram, ...) and
+a fingerprint of every log file: its real path, size, modification time and a digest of
+its first and last blocks. Appending to, rewriting or touching a log changes its
+fingerprint, so a stale answer is never returned.
+
+Entries are written to a temporary file and moved into place, so concurrent processes
+never read a partial entry. A hit sets the modification time of its entry, and once the
+entries take more than the size limit the least recently used ones are removed, under
+an exclusive lock on the cache directory so concurrent writers do not evict twice. The
+lock is taken with fcntl, or msvcrt on Windows; where neither exists eviction runs
+unlocked, which at worst removes a few more entries than needed. The
+cache is best effort: any error reading or writing it is logged and the query is
+answered from the logs. It is intended to be imported by the 'most_active_cookie.py'
+file where the ResultCache class is instantiated.
+"""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: the cache directory is locked with msvcrt instead.
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+
+CACHE_VERSION = 1
+ENTRY_SUFFIX = ".json"
+LOCK_FILE_NAME = "lock"
+DEFAULT_CACHE_SIZE = 16 * 1024**2
+# Number of bytes hashed at each end of a log file for its fingerprint.
+FINGERPRINT_BLOCK_SIZE = 64 * 1024
+
+
+def get_default_cache_directory() -> str:
+    """Return the per-user cache directory: $XDG_CACHE_HOME/most_active_cookie, or ~/.cache/most_active_cookie."""
+
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "most_active_cookie")
+
+
+class ResultCache:
+    """Store and look up the output lines of queries, keyed on the query and the fingerprints of the logs."""
+
+    def __init__(self, directory: Optional[str] = None, max_size: int = DEFAULT_CACHE_SIZE) -> None:
+        self.directory = directory or get_default_cache_directory()
+        self.max_size = max_size
+
+    def get_key(self, file_names: List[str], query: Dict) -> Optional[str]:
+        """Return the cache key of query on the log files, or None if a log cannot be fingerprinted."""
+
+        try:
+            fingerprints = [self.get_fingerprint(file_name) for file_name in file_names]
+        except OSError as error:
+            logging.warning(f"Cannot fingerprint the log files for the result cache: {error}")
+            return None
+        key = {"version": CACHE_VERSION, "files": fingerprints, "query": query}
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def get_fingerprint(self, file_name: str) -> List:
+        """Return [real path, size, mtime in ns, digest of the first and last blocks] of a log file."""
+
+        with open(file_name, "rb") as log_file:
+            log_stat = os.fstat(log_file.fileno())
+            digest = hashlib.sha1(log_file.read(FINGERPRINT_BLOCK_SIZE))
+            if log_stat.st_size > FINGERPRINT_BLOCK_SIZE:
+                log_file.seek(max(FINGERPRINT_BLOCK_SIZE, log_stat.st_size - FINGERPRINT_BLOCK_SIZE))
+                digest.update(log_file.read(FINGERPRINT_BLOCK_SIZE))
+        return [os.path.realpath(file_name), log_stat.st_size, log_stat.st_mtime_ns, digest.hexdigest()]
+
+    def get(self, key: Optional[str]) -> Optional[List[str]]:
+        """Return the output lines stored under key and mark them as recently used, or None on a miss."""
+
+        if key is None:
+            return None
+        entry_file_name = self._get_entry_file_name(key)
+        try:
+            with open(entry_file_name) as entry_file:
+                lines = json.load(entry_file)["lines"]
+            os.utime(entry_file_name)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            logging.warning(f"Ignoring unreadable result cache entry '{entry_file_name}': {error}")
+            return None
+        logging.debug(f"Answer read from the result cache '{entry_file_name}'.")
+        return lines
+
+    def put(self, key: Optional[str], lines: List[str]) -> None:
+        """Store the output lines under key, then evict the least recently used entries over the size limit."""
+
+        if key is None:
+            return
+        # Imported only on a miss: a hit must not pay for it.
+        import tempfile
+
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=self.directory, suffix=".tmp", delete=False) as entry_file:
+                json.dump({"lines": lines}, entry_file)
+            os.replace(entry_file.name, self._get_entry_file_name(key))
+            self.evict()
+        except OSError as error:
+            logging.warning(f"Cannot write to the result cache '{self.directory}': {error}")
+
+    def evict(self) -> int:
+        """Remove the least recently used entries until the cache fits in max_size bytes. Return how many were removed.
+
+        Entries removed meanwhile by another process are skipped.
+        """
+
+        with open(os.path.join(self.directory, LOCK_FILE_NAME), "w") as lock_file, exclusive_lock(lock_file):
+            entries = []
+            with os.scandir(self.directory) as directory_entries:
+                for directory_entry in directory_entries:
+                    if not directory_entry.name.endswith(ENTRY_SUFFIX):
+                        continue
+                    try:
+                        entry_stat = directory_entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((entry_stat.st_mtime_ns, entry_stat.st_size, directory_entry.path))
+
+            total_size = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total_size <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                total_size -= size
+        return removed
+
+    def _get_entry_file_name(self, key: str) -> str:
+        """Return the file name of the entry stored under key."""
+
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+
+@contextlib.contextmanager
+def exclusive_lock(lock_file) -> Iterator[None]:
+    """Hold an exclusive lock on the open lock file, if the platform can lock files, e.g. also for index updates."""
+
+    if fcntl is not None:
+        # Released when the lock file is closed.
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+    elif msvcrt is not None:
+        # Locks the first byte of the file; LK_LOCK retries for 10 seconds before raising OSError.
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        yield
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""This module counts the cookies of one or more log files on several cores.
+
+Each log file is split into newline-aligned byte ranges (shards). Each shard is parsed,
+filtered on the target date(s) and counted in a process pool, and the per-shard
+cookie frequencies are merged in file order so that the result, ties included, is
+the same as counting the files serially, one after the other. Files whose first and
+last lines show they cannot hold the target date(s) are skipped. It is intended to be imported by the
+'most_active_cookie.py' file where the ShardCounter class is instantiated.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import datetime as dt
+import functools
+import logging
+from typing import Callable, Dict, List, Set, Tuple
+
+from cardinality import HyperLogLog, merge_sketches_by_date, sketch_entries_by_date
+from csv_file_reader import CSVFileReader
+from get_cookies import CookieGetter
+
+# Each worker gets several shards so a slow shard does not leave the other cores idle.
+SHARDS_PER_WORKER = 4
+
+
+def count_shard(file_name: str, start: int, end: int, dates: Set[dt.date]) -> Tuple[Dict, int]:
+    """Count the cookies on the target date(s) in one byte range of the log file.
+
+    Return the cookie frequencies of the shard and the number of malformed lines in it.
+    Defined at module level so it can be sent to the worker processes.
+    """
+
+    csv_file_reader = CSVFileReader()
+    cookies = csv_file_reader.iter_cookies_on_dates_in_range(file_name, start, end, dates)
+    cookie_frequency = CookieGetter().get_cookie_frequencies(cookies)
+    return cookie_frequency, csv_file_reader.malformed_lines
+
+
+def count_shard_by_date(file_name: str, start: int, end: int, dates: Set[dt.date]) -> Tuple[Dict, int]:
+    """Count the cookies of each target date in one byte range of the log file.
+
+    Return the cookie frequencies of the shard keyed by date and the number of malformed
+    lines in it. Defined at module level so it can be sent to the worker processes.
+    """
+
+    csv_file_reader = CSVFileReader()
+    entries = csv_file_reader.iter_entries_in_range(file_name, start, end)
+    frequencies_by_date = CookieGetter().get_cookie_frequencies_by_date(entries, dates)
+    return frequencies_by_date, csv_file_reader.malformed_lines
+
+
+def sketch_shard_by_date(
+    file_name: str, start: int, end: int, dates: Set[dt.date], error_rate: float
+) -> Tuple[Dict[dt.date, HyperLogLog], int]:
+    """Sketch the distinct cookies of each target date in one byte range of the log file.
+
+    Return the HyperLogLog sketches of the shard keyed by date and the number of malformed
+    lines in it. Defined at module level so it can be sent to the worker processes.
+    """
+
+    csv_file_reader = CSVFileReader()
+    entries = csv_file_reader.iter_entries_in_range(file_name, start, end)
+    return sketch_entries_by_date(entries, dates, error_rate), csv_file_reader.malformed_lines
+
+
+class ShardCounter:
+    """Count the cookies of log files on the target date(s) with a pool of worker processes."""
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+
+    def count_cookies_on_dates(self, file_names: List[str], dates: Set[dt.date]) -> Dict:
+        """Return the cookie frequencies on the specified date(s) over the whole of the log files.
+
+        Split the files into shards, count each shard in the process pool and merge the
+        per-shard frequencies in file order. Malformed lines are totalled over all
+        shards and logged once, as for a serial read.
+        """
+
+        results = self._map_shards(count_shard, file_names, dates)
+        return CookieGetter().merge_cookie_frequencies(results)
+
+    def count_cookies_by_date(self, file_names: List[str], dates: Set[dt.date]) -> Dict[dt.date, Dict]:
+        """Return the cookie frequencies of each target date over the whole of the log files.
+
+        As count_cookies_on_dates(), but every shard keeps one dict per date and the dicts
+        of each date are merged across shards in file order.
+        """
+
+        cookie_getter = CookieGetter()
+        frequencies_by_date = {}
+        for shard_frequencies_by_date in self._map_shards(count_shard_by_date, file_names, dates):
+            for log_date, shard_frequency in shard_frequencies_by_date.items():
+                frequencies_by_date[log_date] = cookie_getter.merge_cookie_frequencies(
+                    [frequencies_by_date.get(log_date, {}), shard_frequency]
+                )
+        return frequencies_by_date
+
+    def sketch_cookies_by_date(
+        self, file_names: List[str], dates: Set[dt.date], error_rate: float
+    ) -> Dict[dt.date, HyperLogLog]:
+        """Return a HyperLogLog of the distinct cookies of each target date over the whole of the log files.
+
+        Every shard is sketched separately and the sketches of each date are merged, which
+        gives the same sketch as reading the files serially.
+        """
+
+        sketch_function = functools.partial(sketch_shard_by_date, error_rate=error_rate)
+        return merge_sketches_by_date(self._map_shards(sketch_function, file_names, dates))
+
+    def _map_shards(self, count_function: Callable, file_names: List[str], dates: Set[dt.date]) -> List:
+        """Run count_function on every shard of the log files in the process pool and return the counts in file order.
+
+        Files that cannot hold the target date(s) are left out. The others share about
+        SHARDS_PER_WORKER shards per worker, with at least one shard per file, so a single
+        large file is still spread over the pool and thousands of small files are not
+        split further. Malformed lines are totalled over all shards and logged once, as
+        for a serial read.
+        """
+
+        csv_file_reader = CSVFileReader()
+        file_names = csv_file_reader.filter_files_on_dates(file_names, dates)
+        shards_per_file = max(1, self.workers * SHARDS_PER_WORKER // max(1, len(file_names)))
+        shards = [
+            (file_name, start, end)
+            for file_name in file_names
+            for start, end in csv_file_reader.split_into_ranges(file_name, shards_per_file)
+        ]
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = [
+                executor.submit(count_function, file_name, start, end, dates) for file_name, start, end in shards
+            ]
+            results = [future.result() for future in futures]
+
+        malformed_lines = sum(shard_malformed_lines for _, shard_malformed_lines in results)
+        if malformed_lines > 0:
+            logging.warning(f"Log file contains invalid data. Skipped {malformed_lines} malformed line(s).")
+        return [shard_counts for shard_counts, _ in results]
@@ -1,12 +1,65 @@
 #!/usr/bin/env python3
 """This file runs a suite of unit tests on the get_cookies module logging timestamped output in 'tests.log' file.  """
 
+import asyncio
+import bz2
 import datetime
+import gzip
+import json
 import logging
+import lzma
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
 import unittest
 
 from get_cookies import CookieGetter
+from cardinality import HyperLogLog, merge_sketches, sketch_entries_by_date
+from columnar_log import ColumnarLog
+from cookie_errors import (
+    CompressedLogError,
+    EmptyLogError,
+    InvalidDateError,
+    LogFileNotFoundError,
+    NoCookiesFoundError,
+    StaleIndexError,
+)
+from cookie_index import CookieIndex
+from cookie_lookup import CookieLookupIndex
+from cookie_query import CookieLog, MostActiveCookies
+from cookie_server import CookieServer, CookieStore
 from csv_file_reader import CSVFileReader
+from external_counter import ExternalCounter
+from heavy_hitters import SpaceSaving
+from metrics import Metrics, metrics
+from read_ahead import ReadAheadFile
+from result_cache import ResultCache
+from shard_counter import ShardCounter
+from window_counter import LogFollower, SlidingWindowCounter
+from vector_counter import VectorCounter, is_available as numpy_is_available
+
+
+def write_random_log(file_name, line_count, seed=0):
+    """Write a timestamp-sorted log of line_count lines over a few days and a handful of cookies.
+
+    About one line in ten is malformed. The small cookie pool makes ties likely.
+    """
+
+    rng = random.Random(seed)
+    cookies = ["".join(rng.choice("abcdefXYZ0123") for _ in range(16)) for _ in range(8)]
+    newest = datetime.datetime(2018, 12, 9, 23, 59, tzinfo=datetime.timezone.utc)
+    with open(file_name, "w") as log_file:
+        for index in range(line_count):
+            if rng.random() < 0.1:
+                log_file.write("malformed line\n")
+            timestamp = newest - datetime.timedelta(minutes=7 * index)
+            log_file.write(f"{rng.choice(cookies)},{timestamp.isoformat()}\n")
 
 
 class TestCookieGetter(unittest.TestCase):
@@ -91,6 +144,273 @@ class TestCookieGetter(unittest.TestCase):
         with self.assertRaises(SystemExit):
             self.csv_file_reader.read_file_to_list("./test_files/empty_file.txt")
 
+    def test_iter_entries(self):
+        """Test iter_entries() function.
+
+        Function is tested in the following cases:
+        Text file:
+        Expected output: the same entries as read_file_to_list(), yielded lazily.
+        Empty file:
+        Expected output: nothing is yielded and execution is not stopped.
+        Missing file:
+        Expected output: SystemExit once iteration starts.
+        """
+
+        entries = self.csv_file_reader.iter_entries("cookie_log.csv")
+        self.assertNotIsInstance(entries, list)
+        self.assertEqual(list(entries), self.csv_file_reader.read_file_to_list("cookie_log.csv"))
+        self.assertEqual(list(self.csv_file_reader.iter_entries("./test_files/empty_file.txt")), [])
+        with self.assertRaises(SystemExit):
+            list(self.csv_file_reader.iter_entries("This_is_not_a_file.csv"))
+
+    def test_parse_line(self):
+        """Test parse_line() function against parse_entry().
+
+        Function is tested in the following cases:
+        Every line of the sample and malformed test files
+        Hand-written edge cases: invalid calendar dates, non-padded dates, missing fields,
+        extra fields and whitespace
+        Expected output: parse_line() accepts exactly the lines parse_entry() accepts and
+        returns the same tuple, otherwise it raises.
+        """
+
+        lines = [
+            b"AtY0laUfhglK3lC7,2018-12-09T14:19:00+00:00\n",
+            b"AtY0laUfhglK3lC7,2018-12-09T14:19:00+00:00\r\n",
+            b"AtY0laUfhglK3lC7,2018-12-09",
+            b"AtY0laUfhglK3lC7,2019-02-29T14:19:00+00:00\n",
+            b"AtY0laUfhglK3lC7,2020-02-29T14:19:00+00:00\n",
+            b"AtY0laUfhglK3lC7,0000-01-01T14:19:00+00:00\n",
+            b"AtY0laUfhglK3lC7,2018-1-9T14:19:00+00:00\n",
+            b"AtY0laUfhglK3lC7,2018-12-9T\n",
+            b"AtY0laUfhglK3lC7,2018-13-09T14:19:00+00:00\n",
+            b"AtY0laUfhglK3lC7,20181209T14:19:00+00:00\n",
+            b"AtY0laUfhglK3lC7,2018-12-09T14:19:00+00:00,extra\n",
+            b"AtY0laUfhglK3lC7,,2018-12-09T14:19:00+00:00\n",
+            b",2018-12-09T14:19:00+00:00\n",
+            b"AtY0laUfhglK3lC7 2018-12-09T14:19:00+00:00\n",
+            b"cookie,timestamp\n",
+            b"\n",
+            b"",
+        ]
+        for file_name in [
+            "cookie_log.csv",
+            "./test_files/malformed_cookie_log.csv",
+            "./test_files/problem_statement.txt",
+        ]:
+            with open(file_name, "rb") as log_file:
+                lines.extend(log_file)
+
+        for line in lines:
+            try:
+                expected = self.csv_file_reader.parse_entry(line.decode())
+            except (IndexError, ValueError):
+                with self.assertRaises((IndexError, ValueError)):
+                    self.csv_file_reader.parse_line(line)
+            else:
+                self.assertEqual(self.csv_file_reader.parse_line(line), expected)
+
+    def test_iter_entries_on_dates(self):
+        """Test iter_entries_on_dates() function.
+
+        Function is tested in the following cases:
+        Sorted file, one date and a range of dates
+        Expected output: only the entries of the target date(s), in file order.
+        Sorted file with a header and malformed lines
+        Expected output: malformed lines are skipped as in iter_entries().
+        Sorted file, date outside the log
+        Expected output: nothing is yielded.
+        Unsorted file
+        Expected output: falls back to a full scan yielding every entry.
+        Empty file
+        Expected output: nothing is yielded.
+        """
+
+        entries = self.csv_file_reader.read_file_to_list("cookie_log.csv")
+        self.assertEqual(
+            list(self.csv_file_reader.iter_entries_on_dates("cookie_log.csv", {datetime.date(2018, 12, 8)})),
+            entries[4:7],
+        )
+        self.assertEqual(
+            list(
+                self.csv_file_reader.iter_entries_on_dates(
+                    "cookie_log.csv", {datetime.date(2018, 12, 7), datetime.date(2018, 12, 8)}
+                )
+            ),
+            entries[4:],
+        )
+        self.assertEqual(
+            list(self.csv_file_reader.iter_entries_on_dates("cookie_log.csv", {datetime.date(2018, 12, 10)})), []
+        )
+        self.assertEqual(
+            list(self.csv_file_reader.iter_entries_on_dates("cookie_log.csv", {datetime.date(2018, 12, 6)})), []
+        )
+        self.assertEqual(
+            list(
+                self.csv_file_reader.iter_entries_on_dates(
+                    "./test_files/problem_statement.txt", {datetime.date(2018, 12, 9)}
+                )
+            ),
+            entries[:4],
+        )
+        self.assertEqual(
+            list(
+                self.csv_file_reader.iter_entries_on_dates("./test_files/empty_file.txt", {datetime.date(2018, 12, 9)})
+            ),
+            [],
+        )
+
+        with open("cookie_log.csv") as log_file:
+            lines = log_file.readlines()
+        with tempfile.TemporaryDirectory() as directory:
+            unsorted_log = os.path.join(directory, "unsorted.csv")
+            with open(unsorted_log, "w") as log_file:
+                log_file.writelines(lines[4:] + lines[:4])
+            self.assertEqual(
+                sorted(self.csv_file_reader.iter_entries_on_dates(unsorted_log, {datetime.date(2018, 12, 9)})),
+                sorted(entries),
+            )
+
+    def test_iter_cookies_on_dates(self):
+        """Test iter_cookies_on_dates() and iter_cookies_on_dates_in_range() functions.
+
+        Function is tested in the following cases:
+        Random sorted log with malformed and non-canonical lines, on one and several dates, with and without seek
+        Expected output: the same cookies, in the same order, as filtering iter_entries().
+        Gzip-compressed log and the byte ranges of split_into_ranges()
+        Expected output: the same cookies, and the same malformed line count.
+        Canonical-looking lines with an impossible date or a garbage date prefix
+        Expected output: counted as malformed, as by read_file_to_list().
+        Cookies that are not valid UTF-8, on a target date and on another date
+        Expected output: counted as malformed, as by iter_entries(), instead of raising UnicodeDecodeError.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, "cookie_log.csv")
+            write_random_log(log, 2000)
+            with open(log, "a") as log_file:
+                # Not in the canonical layout, but accepted by parse_entry().
+                log_file.write("nonCanonical0000,2018-11-1T10:00:00+00:00\n")
+                log_file.write("impossibleDate00,2018-13-45T10:00:00+00:00\n")
+                log_file.write("february30th0000,2018-02-30T10:00:00+00:00\n")
+                log_file.write("garbagePrefix000,abcdefghijT10:00:00+00:00\n")
+            with open(log, "ab") as log_file:
+                log_file.write(b"invalidUtf8\xff0000,2018-12-05T10:00:00+00:00\n")
+                log_file.write(b"invalidUtf8\xff0000,2018-12-07T10:00:00+00:00\n")
+            expected_malformed_lines = CSVFileReader()
+            expected_malformed_lines.read_file_to_list(log)
+            compressed_log = log + ".gz"
+            with open(log, "rb") as log_file, gzip.open(compressed_log, "wb") as compressed_file:
+                compressed_file.write(log_file.read())
+
+            for dates in [{datetime.date(2018, 12, 5)}, {datetime.date(2018, 12, 8), datetime.date(2018, 11, 1)}]:
+                expected = list(self.cookie_getter.iter_cookies_on_dates(self.csv_file_reader.iter_entries(log), dates))
+                self.assertTrue(expected)
+                for file_name, seek in [(log, False), (log, True), (compressed_log, True)]:
+                    csv_file_reader = CSVFileReader()
+                    cookies = list(csv_file_reader.iter_cookies_on_dates(file_name, dates, seek=seek))
+                    self.assertEqual(cookies, expected)
+                    if not seek:
+                        self.assertEqual(csv_file_reader.malformed_lines, expected_malformed_lines.malformed_lines)
+                csv_file_reader = CSVFileReader()
+                cookies = [
+                    cookie
+                    for start, end in csv_file_reader.split_into_ranges(log, 7)
+                    for cookie in csv_file_reader.iter_cookies_on_dates_in_range(log, start, end, dates)
+                ]
+                self.assertEqual(cookies, expected)
+                self.csv_file_reader.malformed_lines = 0
+                list(self.csv_file_reader.iter_entries(log))
+                self.assertEqual(csv_file_reader.malformed_lines, self.csv_file_reader.malformed_lines)
+
+    def test_split_into_ranges(self):
+        """Test split_into_ranges() and iter_entries_in_range() functions.
+
+        Function is tested in the following cases:
+        More ranges than lines, fewer ranges than lines and a single range
+        Expected output: contiguous newline-aligned ranges covering the file, which read
+        back the same entries and malformed line count as iter_entries().
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, "cookie_log.csv")
+            write_random_log(log, 500)
+            expected_entries = list(self.csv_file_reader.iter_entries(log))
+            expected_malformed_lines = self.csv_file_reader.malformed_lines
+
+            for range_count in [1, 7, 100, 10000]:
+                ranges = self.csv_file_reader.split_into_ranges(log, range_count)
+                self.assertLessEqual(len(ranges), range_count)
+                self.assertEqual(ranges[0][0], 0)
+                self.assertEqual(ranges[-1][1], os.path.getsize(log))
+                for (_, end), (start, _) in zip(ranges, ranges[1:]):
+                    self.assertEqual(end, start)
+
+                csv_file_reader = CSVFileReader()
+                entries = []
+                for start, end in ranges:
+                    entries.extend(csv_file_reader.iter_entries_in_range(log, start, end))
+                self.assertEqual(entries, expected_entries)
+                self.assertEqual(csv_file_reader.malformed_lines, expected_malformed_lines)
+
+    def test_compressed_input(self):
+        """Test reading gzip, bz2, xz and concatenated gzip logs.
+
+        Function is tested in the following cases:
+        Each compressed format under a name without a matching extension, and a gzip log
+        made of two members
+        Expected output: the same entries as the plain log from iter_entries() and
+        iter_entries_on_dates(), a single range from split_into_ranges() and the same
+        frequencies from the index.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, "cookie_log.csv")
+            write_random_log(log, 500)
+            with open(log, "rb") as log_file:
+                data = log_file.read()
+            expected_entries = list(self.csv_file_reader.iter_entries(log))
+            dates = {datetime.date(2018, 12, 9), datetime.date(2018, 12, 8)}
+            expected_on_dates = list(self.cookie_getter.iter_cookies_on_dates(expected_entries, dates))
+
+            half = data.index(b"\n", len(data) // 2) + 1
+            compressed = {
+                "gzip": gzip.compress(data),
+                "bz2": bz2.compress(data),
+                "xz": lzma.compress(data),
+                "gzip-members": gzip.compress(data[:half]) + gzip.compress(data[half:]),
+            }
+            for name, compressed_data in compressed.items():
+                compressed_log = os.path.join(directory, name + ".log")
+                with open(compressed_log, "wb") as log_file:
+                    log_file.write(compressed_data)
+
+                csv_file_reader = CSVFileReader()
+                self.assertEqual(csv_file_reader.get_compression(compressed_log), name.split("-")[0])
+                self.assertEqual(list(csv_file_reader.iter_entries(compressed_log)), expected_entries)
+                self.assertEqual(
+                    list(
+                        self.cookie_getter.iter_cookies_on_dates(
+                            csv_file_reader.iter_entries_on_dates(compressed_log, dates), dates
+                        )
+                    ),
+                    expected_on_dates,
+                )
+                ranges = csv_file_reader.split_into_ranges(compressed_log, 4)
+                self.assertEqual(len(ranges), 1)
+                self.assertEqual(
+                    list(csv_file_reader.iter_entries_in_range(compressed_log, *ranges[0])), expected_entries
+                )
+
+                cookie_index = CookieIndex(compressed_log)
+                cookie_index.ensure_current()
+                self.assertEqual(
+                    cookie_index.load_frequencies(dates),
+                    self.cookie_getter.get_cookie_frequencies(expected_on_dates),
+                )
+
+            self.assertIsNone(self.csv_file_reader.get_compression(log))
+
     def test_filter_list_on_dates(self):
         """Test test_filter_list_on_dates() function.
 
@@ -231,6 +551,979 @@ class TestCookieGetter(unittest.TestCase):
         list_e = ["abc,fd237y,", ",sdf", "def", "abc", "ghi,-----", "ghi", "jkl", "def", "abc"]
         self.assertEqual(self.cookie_getter.get_most_active_cookies(list_e), ["abc"])
 
+    def test_get_top_cookies(self):
+        """Test get_top_cookies() function.
+
+        Function is tested in the following cases:
+        k smaller than, equal to and larger than the number of cookies
+        k equal to the number of cookies tied for the maximum
+        Expected output: (cookie, count) tuples by descending count, ties in dict order,
+        matching get_most_active_cookies() for the tied cookies.
+        """
+
+        cookie_frequency = {"abc": 3, "def": 2, "ghi": 2, "jkl": 3, "": 1}
+        self.assertEqual(self.cookie_getter.get_top_cookies(cookie_frequency, 1), [("abc", 3)])
+        self.assertEqual(self.cookie_getter.get_top_cookies(cookie_frequency, 3), [("abc", 3), ("jkl", 3), ("def", 2)])
+        self.assertEqual(
+            self.cookie_getter.get_top_cookies(cookie_frequency, 10),
+            [("abc", 3), ("jkl", 3), ("def", 2), ("ghi", 2), ("", 1)],
+        )
+        self.assertEqual(self.cookie_getter.get_top_cookies({}, 5), [])
+        self.assertEqual(
+            [cookie for cookie, _ in self.cookie_getter.get_top_cookies(cookie_frequency, 2)],
+            self.cookie_getter.get_most_active_from_frequencies(cookie_frequency),
+        )
+
+    def test_get_frequency_histogram(self):
+        """Test get_frequency_histogram() function.
+
+        Function is tested in the following cases:
+        Several cookies per count, and an empty dict
+        Expected output: a dict of count -> number of cookies, by ascending count.
+        """
+
+        cookie_frequency = {"abc": 3, "def": 2, "ghi": 2, "jkl": 3, "": 1, "mno": 7}
+        histogram = self.cookie_getter.get_frequency_histogram(cookie_frequency)
+        self.assertEqual(list(histogram.items()), [(1, 1), (2, 2), (3, 2), (7, 1)])
+        self.assertEqual(self.cookie_getter.get_frequency_histogram({}), {})
+
+    def test_get_date_strings_in_range(self):
+        """Test get_date_strings_in_range() function.
+
+        Function is tested in the following cases:
+        Range over a month and a leap day, and a single day
+        Expected output: every date of the range, first to last.
+        Reversed range and invalid date
+        Expected output: SystemExit.
+        """
+
+        self.assertEqual(
+            self.cookie_getter.get_date_strings_in_range("2020-02-28", "2020-03-01"),
+            ["2020-02-28", "2020-02-29", "2020-03-01"],
+        )
+        self.assertEqual(self.cookie_getter.get_date_strings_in_range("2018-12-09", "2018-12-09"), ["2018-12-09"])
+        with self.assertRaises(SystemExit):
+            self.cookie_getter.get_date_strings_in_range("2018-12-09", "2018-12-08")
+        with self.assertRaises(SystemExit):
+            self.cookie_getter.get_date_strings_in_range("2018-12-09", None)
+
+    def test_get_cookie_frequencies_by_date(self):
+        """Test get_cookie_frequencies_by_date() function.
+
+        Function is tested in the following cases:
+        Several dates, one with no cookies
+        Expected output: one frequency dict per date with cookies, equal to counting each
+        date on its own, keyed in log order.
+        """
+
+        dates = {datetime.date(2018, 12, 9), datetime.date(2018, 12, 7), datetime.date(2018, 12, 6)}
+        frequencies_by_date = self.cookie_getter.get_cookie_frequencies_by_date(
+            self.csv_file_reader.iter_entries("cookie_log.csv"), dates
+        )
+        self.assertEqual(list(frequencies_by_date), [datetime.date(2018, 12, 9), datetime.date(2018, 12, 7)])
+        self.assertEqual(
+            frequencies_by_date[datetime.date(2018, 12, 9)],
+            {"AtY0laUfhglK3lC7": 2, "SAZuXPGUrfbcn5UA": 1, "5UAVanZf6UtGyKVS": 1},
+        )
+        self.assertEqual(frequencies_by_date[datetime.date(2018, 12, 7)], {"4sMM2LxV07bPJzwf": 1})
+
+    def test_stream_most_active_cookies(self):
+        """Test stream_most_active_cookies() function.
+
+        Function is tested in the following cases:
+        Streamed file, single and multiple dates
+        Expected output: the same cookies main() returns for those dates.
+        Streamed file, date with no data
+        Expected output: SystemExit.
+        """
+
+        def stream(date_strings):
+            entries = self.csv_file_reader.iter_entries("cookie_log.csv")
+            return self.cookie_getter.stream_most_active_cookies(entries, date_strings)
+
+        self.assertEqual(stream(["2018-12-08"]), ["SAZuXPGUrfbcn5UA", "4sMM2LxV07bPJzwf", "fbcn5UAVanZf6UtG"])
+        self.assertEqual(stream(["2018-12-09"]), ["AtY0laUfhglK3lC7"])
+        self.assertEqual(
+            stream(["2018-12-09", "2018-12-08", "2018-12-07"]),
+            ["AtY0laUfhglK3lC7", "SAZuXPGUrfbcn5UA", "4sMM2LxV07bPJzwf"],
+        )
+        with self.assertRaises(SystemExit):
+            stream(["2018-12-06"])
+
+    def test_shard_counter(self):
+        """Test ShardCounter.count_cookies_on_dates() against the serial path.
+
+        Function is tested in the following cases:
+        Random log with ties, one and several dates, one and several workers
+        Expected output: the same frequencies, in the same order, as a serial count, both
+        over all dates together and per date.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, "cookie_log.csv")
+            write_random_log(log, 2000)
+            for date_strings in [["2018-12-09"], ["2018-12-02", "2018-12-05", "2018-12-07"]]:
+                dates = self.cookie_getter.strings_to_dates(date_strings)
+                entries = self.csv_file_reader.iter_entries(log)
+                expected = self.cookie_getter.get_cookie_frequencies(
+                    self.cookie_getter.iter_cookies_on_dates(entries, dates)
+                )
+                expected_by_date = self.cookie_getter.get_cookie_frequencies_by_date(
+                    self.csv_file_reader.iter_entries(log), dates
+                )
+                for workers in [1, 3]:
+                    cookie_frequency = ShardCounter(workers).count_cookies_on_dates([log], dates)
+                    self.assertEqual(list(cookie_frequency.items()), list(expected.items()))
+                    self.assertEqual(
+                        self.cookie_getter.get_most_active_on_dates(cookie_frequency, dates),
+                        self.cookie_getter.get_most_active_from_frequencies(expected),
+                    )
+                    frequencies_by_date = ShardCounter(workers).count_cookies_by_date([log], dates)
+                    self.assertEqual(list(frequencies_by_date), list(expected_by_date))
+                    for log_date, expected_frequency in expected_by_date.items():
+                        self.assertEqual(list(frequencies_by_date[log_date].items()), list(expected_frequency.items()))
+
+    @unittest.skipIf(not numpy_is_available(), "NumPy is not installed")
+    def test_vector_counter(self):
+        """Test VectorCounter.count_cookies_on_dates() and count_cookies_by_date() against the serial path.
+
+        Function is tested in the following cases:
+        Random log with ties and malformed lines, plus lines the fixed layout leaves to parse_line(): a
+        ' 9' day, a comma, NUL or non-ASCII byte in the cookie, an impossible date, '\\r\\n' and
+        no final newline
+        Expected output: the same frequencies, in the same order, as a serial count, with chunks
+        of a few lines and of the whole log, and as many malformed lines as read_file_to_list().
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, "cookie_log.csv")
+            write_random_log(log, 2000)
+            with open(log, "ab") as log_file:
+                log_file.write(b"nonCanonical0000,2018-12- 9T10:00:00+00:00\n")
+                log_file.write(b"abcd,2018-12-09T,2018-12-08T10:00:00+00:00\n")
+                log_file.write(b"nul\x00000000000000,2018-12-09T10:00:00+00:00\n")
+                log_file.write("non-ASCII\u00e9000000,2018-12-09T10:00:00+00:00\n".encode())
+                log_file.write(b"crlf000000000000,2018-12-09T10:00:00+00:00\r\n")
+                log_file.write(b"impossibleDate00,2018-13-45T10:00:00+00:00\n")
+                log_file.write(b"february30th0000,2018-02-30T10:00:00+00:00\n")
+                log_file.write(b"noNewline0000000,2018-12-02T10:00:00+00:00")
+            for date_strings in [["2018-12-09"], ["2018-12-02", "2018-12-05", "2018-12-07"]]:
+                dates = self.cookie_getter.strings_to_dates(date_strings)
+                entries = self.csv_file_reader.iter_entries(log)
+                expected = self.cookie_getter.get_cookie_frequencies(
+                    self.cookie_getter.iter_cookies_on_dates(entries, dates)
+                )
+                expected_by_date = self.cookie_getter.get_cookie_frequencies_by_date(
+                    self.csv_file_reader.iter_entries(log), dates
+                )
+                expected_malformed_lines = CSVFileReader()
+                expected_malformed_lines.read_file_to_list(log)
+                for chunk_size in [100, 1 << 20]:
+                    vector_counter = VectorCounter(chunk_size)
+                    cookie_frequency = vector_counter.count_cookies_on_dates([log], dates)
+                    self.assertEqual(list(cookie_frequency.items()), list(expected.items()))
+                    self.assertEqual(
+                        vector_counter.csv_file_reader.malformed_lines, expected_malformed_lines.malformed_lines
+                    )
+                    frequencies_by_date = VectorCounter(chunk_size).count_cookies_by_date([log], dates)
+                    self.assertEqual(list(frequencies_by_date), list(expected_by_date))
+                    for log_date, expected_frequency in expected_by_date.items():
+                        self.assertEqual(list(frequencies_by_date[log_date].items()), list(expected_frequency.items()))
+
+    def test_multiple_files(self):
+        """Test expand_paths(), get_date_span(), filter_files_on_dates() and counting several log files.
+
+        Function is tested in the following cases:
+        A log split into several files, named by directory, glob pattern and file name
+        Expected output: each file once, in name order, without index files or their lock files.
+        Dates held by only some of the files
+        Expected output: the other files are skipped, and the same frequencies, in the same
+        order, as counting the unsplit log, with one and several workers.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, "cookie_log.csv")
+            write_random_log(log, 2000)
+            with open(log) as log_file:
+                lines = log_file.readlines()
+            node_directory = os.path.join(directory, "nodes")
+            os.mkdir(node_directory)
+            node_logs = [os.path.join(node_directory, f"node-{node}.csv") for node in range(4)]
+            for node, node_log in enumerate(node_logs):
+                with open(node_log, "w") as log_file:
+                    log_file.writelines(lines[node * len(lines) // 4 : (node + 1) * len(lines) // 4])
+            with open(node_logs[0] + ".idx", "wb") as index_file:
+                index_file.write(b"index")
+            with open(node_logs[0] + ".cookies.idx.lock", "wb"):
+                pass
+
+            self.assertEqual(self.csv_file_reader.expand_paths([node_directory]), node_logs)
+            self.assertEqual(
+                self.csv_file_reader.expand_paths([node_logs[2], os.path.join(node_directory, "node-*")]),
+                [node_logs[2], node_logs[0], node_logs[1], node_logs[3]],
+            )
+            with self.assertRaises(SystemExit):
+                self.csv_file_reader.expand_paths([os.path.join(directory, "*.gz")])
+
+            self.assertEqual(
+                self.csv_file_reader.get_date_span(log), (datetime.date(2018, 11, 30), datetime.date(2018, 12, 9))
+            )
+            for date_strings, expected_file_count in [["2018-12-09"], 1], [["2018-12-09", "2018-12-01"], 2]:
+                dates = self.cookie_getter.strings_to_dates(date_strings)
+                self.assertEqual(len(self.csv_file_reader.filter_files_on_dates(node_logs, dates)), expected_file_count)
+                expected = self.cookie_getter.get_cookie_frequencies(
+                    self.cookie_getter.iter_cookies_on_dates(self.csv_file_reader.iter_entries(log), dates)
+                )
+                for workers in [1, 3]:
+                    cookie_frequency = ShardCounter(workers).count_cookies_on_dates(node_logs, dates)
+                    self.assertEqual(list(cookie_frequency.items()), list(expected.items()))
+
+    def test_cookie_server(self):
+        """Test the CookieStore and CookieServer classes.
+
+        Function is tested in the following cases:
+        Store loaded from a random log, queried on one and several dates
+        Expected output: the same frequencies, in the same order, as a full scan.
+        Lines appended to the log, then the log rewritten shorter
+        Expected output: refresh() adds only the new entries, then reloads the log, and the status counts
+        only the cookies of the log as rewritten.
+        Most-active, top-K, histogram and per-date queries, bad dates and paths, over a socket
+        Expected output: the CookieGetter answers as JSON, newest date first per date, or an error status.
+        Log deleted while the server refreshes the store, then put back
+        Expected output: 503 with the error while the log is missing, the answers as before once it is back.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, "cookie_log.csv")
+            write_random_log(log, 1000)
+            cookie_store = CookieStore([log], exit_on_error=False)
+            self.assertEqual(cookie_store.refresh(), len(list(self.csv_file_reader.iter_entries(log))))
+            for date_strings in [["2018-12-09"], ["2018-12-04", "2018-12-06"]]:
+                dates = self.cookie_getter.strings_to_dates(date_strings)
+                expected = self.cookie_getter.get_cookie_frequencies(
+                    self.cookie_getter.iter_cookies_on_dates(self.csv_file_reader.iter_entries(log), dates)
+                )
+                self.assertEqual(list(cookie_store.get_frequencies(dates).items()), list(expected.items()))
+
+            with open(log, "a") as log_file:
+                log_file.write("appended0000000,2018-12-09T10:00:00+00:00\n" * 50)
+            self.assertEqual(cookie_store.refresh(), 50)
+            self.assertEqual(cookie_store.refresh(), 0)
+            cookie_server = CookieServer(cookie_store)
+            status, body = cookie_server.handle_request("GET", "/by-date?date=2018-12-06&date=2018-12-09")
+            self.assertEqual(list(body), ["2018-12-09", "2018-12-06"])
+            status, body = cookie_server.handle_request("GET", "/most-active?date=2018-12-09")
+            self.assertEqual((status, body), (200, {"cookies": ["appended0000000"]}))
+
+            write_random_log(log, 100, seed=1)
+            self.assertEqual(cookie_store.refresh(), len(list(self.csv_file_reader.iter_entries(log))))
+            status, body = cookie_server.handle_request("GET", "/status")
+            self.assertEqual(body["cookies"], len({cookie for cookie, _ in self.csv_file_reader.iter_entries(log)}))
+            dates = {datetime.date(2018, 12, 9)}
+            expected = self.cookie_getter.get_cookie_frequencies(
+                self.cookie_getter.iter_cookies_on_dates(self.csv_file_reader.iter_entries(log), dates)
+            )
+            status, body = cookie_server.handle_request("GET", "/top?date=2018-12-09&k=2")
+            self.assertEqual(body, {"cookies": self.cookie_getter.get_top_cookies(expected, 2)})
+            status, body = cookie_server.handle_request("GET", "/histogram?date=2018-12-09")
+            self.assertEqual(body, {"histogram": list(self.cookie_getter.get_frequency_histogram(expected).items())})
+            status, body = cookie_server.handle_request("GET", "/by-date?date=2018-12-09&date=2017-01-01")
+            self.assertEqual(body, {"2018-12-09": self.cookie_getter.get_most_active_from_frequencies(expected)})
+            for target, expected_status in [
+                ("/most-active?date=2017-01-01", 404),
+                ("/most-active?date=2018-13-01", 400),
+                ("/top?date=2018-12-09&k=0", 400),
+                ("/unknown", 404),
+            ]:
+                self.assertEqual(cookie_server.handle_request("GET", target)[0], expected_status)
+
+            async def query_over_socket():
+                server = await cookie_server.start("127.0.0.1:0")
+                reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+                answers = []
+                for target, connection in [("/status", "keep-alive"), ("/most-active?date=2018-12-09", "close")]:
+                    writer.write(
+                        f"GET {target} HTTP/1.1\r\nHost: localhost\r\nConnection: {connection}\r\n\r\n".encode()
+                    )
+                    self.assertEqual(await reader.readline(), b"HTTP/1.1 200 OK\r\n")
+                    headers = (await reader.readuntil(b"\r\n\r\n")).decode().lower()
+                    content_length = int(headers.split("content-length:")[1].split()[0])
+                    answers.append(json.loads(await reader.readexactly(content_length)))
+                # The server closes the connection after the last answer.
+                self.assertEqual(await reader.read(), b"")
+                writer.close()
+                await cookie_server.stop(server)
+                return answers
+
+            loop = asyncio.new_event_loop()
+            try:
+                status_body, most_active_body = loop.run_until_complete(query_over_socket())
+            finally:
+                loop.close()
+            self.assertEqual(status_body["files"], 1)
+            self.assertEqual(most_active_body, cookie_server.handle_request("GET", "/most-active?date=2018-12-09")[1])
+
+            refreshing_server = CookieServer(cookie_store, refresh_interval=0.01)
+
+            async def refresh_deleted_log():
+                server = await refreshing_server.start("127.0.0.1:0")
+                os.rename(log, log + ".old")
+                await asyncio.sleep(0.2)
+                missing_answer = refreshing_server.handle_request("GET", "/most-active?date=2018-12-09")
+                os.rename(log + ".old", log)
+                await asyncio.sleep(0.2)
+                await refreshing_server.stop(server)
+                return missing_answer
+
+            loop = asyncio.new_event_loop()
+            try:
+                status, body = loop.run_until_complete(refresh_deleted_log())
+            finally:
+                loop.close()
+            self.assertEqual(status, 503)
+            self.assertIn("not found", body["error"])
+            self.assertEqual(
+                refreshing_server.handle_request("GET", "/most-active?date=2018-12-09")[1], most_active_body
+            )
+
+    def test_cookie_columns(self):
+        """Test read_file_to_columns(), the CookieColumns class and get_cookie_frequencies_in_columns().
+
+        Function is tested in the following cases:
+        Random log with malformed lines, one and several dates
+        Expected output: the same entries as read_file_to_list(), the same filtered list
+        from filter_list_on_dates() and the same frequencies, in the same order, as
+        get_cookie_frequencies().
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, "cookie_log.csv")
+            write_random_log(log, 1000)
+            entries = self.csv_file_reader.read_file_to_list(log)
+            cookie_columns = self.csv_file_reader.read_file_to_columns(log)
+
+        self.assertEqual(len(cookie_columns), len(entries))
+        self.assertEqual(list(cookie_columns), entries)
+        self.assertEqual(cookie_columns[0], entries[0])
+        self.assertEqual(cookie_columns[-1], entries[-1])
+        self.assertEqual(len(cookie_columns.cookies), len({cookie for cookie, _ in entries}))
+        for date_strings in [["2018-12-09"], ["2018-12-04", "2018-12-06"]]:
+            dates = self.cookie_getter.strings_to_dates(date_strings)
+            cookie_list = self.cookie_getter.filter_list_on_dates(entries, dates)
+            self.assertEqual(self.cookie_getter.filter_list_on_dates(cookie_columns, dates), cookie_list)
+            expected = self.cookie_getter.get_cookie_frequencies(cookie_list)
+            cookie_frequency = self.cookie_getter.get_cookie_frequencies_in_columns(cookie_columns, dates)
+            self.assertEqual(list(cookie_frequency.items()), list(expected.items()))
+
+    def test_metrics(self):
+        """Test the Metrics class and the stages reported by CSVFileReader and CookieGetter.
+
+        Function is tested in the following cases:
+        Streamed read, parse, filter, count and select of a random log with metrics enabled
+        Expected output: the lines, bytes, entries, skipped lines, filtered cookies and
+        distinct cookies of the log, stage times adding up to at most the total, the JSON
+        report and a cProfile file.
+        Metrics disabled
+        Expected output: iterables returned unchanged and nothing recorded.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, "cookie_log.csv")
+            write_random_log(log, 1000)
+            profile = os.path.join(directory, "run.prof")
+            dates = {datetime.date(2018, 12, 9)}
+            expected = self.cookie_getter.get_cookie_frequencies(
+                self.cookie_getter.iter_cookies_on_dates(self.csv_file_reader.iter_entries(log), dates)
+            )
+
+            metrics.enable(trace_memory=True, profile_file_name=profile)
+            try:
+                csv_file_reader = CSVFileReader()
+                entries = csv_file_reader.iter_entries(log)
+                cookie_frequency = self.cookie_getter.get_cookie_frequencies(
+                    self.cookie_getter.iter_cookies_on_dates(entries, dates)
+                )
+                self.cookie_getter.get_most_active_from_frequencies(cookie_frequency)
+            finally:
+                report = metrics.disable()
+            self.assertTrue(os.path.getsize(profile) > 0)
+
+            with open(log, "rb") as log_file:
+                lines = log_file.readlines()
+            stages = report["stages"]
+            self.assertEqual(list(stages), ["read", "parse", "filter", "count", "select"])
+            self.assertEqual(stages["read"]["items"], len(lines))
+            self.assertEqual(stages["read"]["bytes"], sum(len(line) for line in lines))
+            self.assertEqual(stages["parse"]["items"] + stages["parse"]["lines_skipped"], len(lines))
+            self.assertEqual(stages["parse"]["lines_skipped"], csv_file_reader.malformed_lines)
+            self.assertEqual(stages["filter"]["items"], sum(expected.values()))
+            self.assertEqual(stages["count"]["distinct_cookies"], len(expected))
+            for stage in stages.values():
+                self.assertGreaterEqual(stage["wall_seconds"], 0)
+                self.assertGreater(stage["peak_memory_bytes"], 0)
+            self.assertLessEqual(sum(stage["wall_seconds"] for stage in stages.values()), report["wall_seconds"])
+            self.assertEqual(json.loads(metrics.format_report(report, "json")), report)
+            self.assertEqual(len(metrics.format_report(report).splitlines()), len(stages) + 2)
+
+        disabled_metrics = Metrics()
+        cookie_list = ["cookie"]
+        self.assertIs(disabled_metrics.iter_stage("read", cookie_list), cookie_list)
+        with disabled_metrics.stage("count"):
+            disabled_metrics.count("count", "distinct_cookies", 1)
+        self.assertEqual(disabled_metrics.stages, {})
+
+    def test_cookie_log(self):
+        """Test the CookieLog class and the exit_on_error=False mode of CSVFileReader and CookieGetter.
+
+        Function is tested in the following cases:
+        Random log queried on one and several dates, as strings or datetime.date objects
+        Expected output: the same answers as the CookieGetter methods on a full scan.
+        Missing or empty log, invalid or no dates, dates with no cookies
+        Expected output: the matching CookieLogError is raised instead of stopping execution.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, "cookie_log.csv")
+            write_random_log(log, 1000)
+            cookie_log = CookieLog(log)
+            dates = {datetime.date(2018, 12, 4), datetime.date(2018, 12, 6)}
+            expected = self.cookie_getter.get_cookie_frequencies(
+                self.cookie_getter.iter_cookies_on_dates(self.csv_file_reader.iter_entries(log), dates)
+            )
+            most_active_cookies = self.cookie_getter.get_most_active_from_frequencies(expected)
+            self.assertEqual(
+                cookie_log.most_active(["2018-12-06", datetime.date(2018, 12, 4)]),
+                MostActiveCookies(tuple(sorted(dates)), most_active_cookies, expected[most_active_cookies[0]]),
+            )
+            self.assertEqual(list(cookie_log.frequencies(dates).items()), list(expected.items()))
+            self.assertEqual(cookie_log.top(dates, 3), self.cookie_getter.get_top_cookies(expected, 3))
+            self.assertEqual(cookie_log.histogram(dates), self.cookie_getter.get_frequency_histogram(expected))
+            by_date = cookie_log.most_active_by_date(["2018-12-09", "2017-01-01"])
+            self.assertEqual(list(by_date), [datetime.date(2018, 12, 9)])
+            self.assertEqual(by_date[datetime.date(2018, 12, 9)], cookie_log.most_active("2018-12-09"))
+
+            with open(log, "a") as log_file:
+                log_file.write("appended0000000,2018-12-09T10:00:00+00:00\n" * 100)
+            self.assertEqual(cookie_log.refresh(), 100)
+            self.assertEqual(cookie_log.most_active("2018-12-09").cookies, ["appended0000000"])
+
+            with self.assertRaises(NoCookiesFoundError):
+                cookie_log.most_active("2017-01-01")
+            for invalid_dates in ["2018-13-01", [], ["2018-12-09", 20181209]]:
+                with self.assertRaises(InvalidDateError):
+                    cookie_log.most_active(invalid_dates)
+            with self.assertRaises(LogFileNotFoundError):
+                CookieLog(os.path.join(directory, "missing.csv"))
+            empty_log = os.path.join(directory, "empty.csv")
+            open(empty_log, "w").close()
+            with self.assertRaises(EmptyLogError):
+                CookieLog(empty_log)
+
+            with self.assertRaises(EmptyLogError):
+                CSVFileReader(exit_on_error=False).read_file_to_list(empty_log)
+            with self.assertRaises(NoCookiesFoundError):
+                CookieGetter(exit_on_error=False).filter_list_on_dates([], dates)
+            with self.assertRaises(InvalidDateError):
+                CookieGetter(exit_on_error=False).strings_to_dates(["not a date"])
+
+    def test_result_cache(self):
+        """Test the ResultCache class.
+
+        Function is tested in the following cases:
+        Answer stored, then looked up with the same and with another query
+        Expected output: a hit for the same query only.
+        Log appended to, rewritten with the same size, or touched
+        Expected output: the key changes, so the old answer is not returned.
+        More answers than the size limit holds, one of them looked up again
+        Expected output: the least recently used answers are evicted, the recently read one is kept.
+        Corrupted entry, or a log that cannot be read
+        Expected output: a miss.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, "cookie_log.csv")
+            write_random_log(log, 1000)
+            result_cache = ResultCache(os.path.join(directory, "cache"))
+            query = {"dates": ["2018-12-09"], "top": None}
+            key = result_cache.get_key([log], query)
+            self.assertIsNone(result_cache.get(key))
+            result_cache.put(key, ["AtY0laUfhglK3lC7"])
+            self.assertEqual(result_cache.get(result_cache.get_key([log], dict(query))), ["AtY0laUfhglK3lC7"])
+            self.assertNotEqual(result_cache.get_key([log], dict(query, top=3)), key)
+
+            with open(log, "a") as log_file:
+                log_file.write("appended0000000,2018-12-09T10:00:00+00:00\n")
+            appended_key = result_cache.get_key([log], query)
+            self.assertNotEqual(appended_key, key)
+            with open(log, "r+") as log_file:
+                log_file.write("X")
+            log_stat = os.stat(log)
+            self.assertNotEqual(result_cache.get_key([log], query), appended_key)
+            os.utime(log, ns=(log_stat.st_atime_ns, log_stat.st_mtime_ns + 10**9))
+            self.assertNotEqual(result_cache.get_key([log], query), appended_key)
+
+            with open(result_cache._get_entry_file_name(key), "w") as entry_file:
+                entry_file.write("{not json")
+            self.assertIsNone(result_cache.get(key))
+            self.assertIsNone(result_cache.get_key([os.path.join(directory, "missing.csv")], query))
+            result_cache.put(None, ["ignored"])
+
+            small_cache = ResultCache(os.path.join(directory, "small_cache"), max_size=300)
+            keys = [f"{index:064x}" for index in range(10)]
+            for index, small_key in enumerate(keys):
+                small_cache.put(small_key, [f"cookie{index:010d}"] * 3)
+                # Distinct ages, oldest first, whatever the resolution of the file system clock.
+                entry_time = time.time() - (100 - index)
+                os.utime(small_cache._get_entry_file_name(small_key), (entry_time, entry_time))
+                if index == 2:
+                    self.assertIsNotNone(small_cache.get(keys[0]))
+            entries = [entry for entry in os.scandir(small_cache.directory) if entry.name.endswith(".json")]
+            self.assertLessEqual(sum(entry.stat().st_size for entry in entries), 300)
+            self.assertEqual(small_cache.get(keys[0]), ["cookie0000000000"] * 3)
+            self.assertEqual(small_cache.get(keys[-1]), ["cookie0000000009"] * 3)
+            self.assertIsNone(small_cache.get(keys[1]))
+
+    def test_cookie_index(self):
+        """Test the CookieIndex class.
+
+        Function is tested in the following cases:
+        Fresh index, one and several dates
+        Expected output: the same frequencies, in the same order, as a full scan.
+        Date not in the log
+        Expected output: an empty dict.
+        Lines appended after the index was built, the last one unfinished
+        Expected output: the index is stale and is updated incrementally, even when rebuilds
+        are disabled, to match a full scan of the new log.
+        Log rotated after the index was built
+        Expected output: the index is refused when rebuilds are disabled and rebuilt to
+        match the new log otherwise.
+        Log rotated or removed, with exit_on_error=False
+        Expected output: StaleIndexError or LogFileNotFoundError is raised instead of stopping execution.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, "cookie_log.csv")
+            write_random_log(log, 2000)
+            cookie_index = CookieIndex(log)
+            self.assertFalse(cookie_index.is_current())
+            cookie_index.ensure_current()
+            self.assertTrue(cookie_index.is_current())
+
+            def full_scan(dates):
+                entries = self.csv_file_reader.iter_entries(log)
+                return self.cookie_getter.get_cookie_frequencies(
+                    self.cookie_getter.iter_cookies_on_dates(entries, dates)
+                )
+
+            for date_strings in [["2018-12-09"], ["2018-12-02", "2018-12-05", "2018-12-07"]]:
+                dates = self.cookie_getter.strings_to_dates(date_strings)
+                self.assertEqual(list(cookie_index.load_frequencies(dates).items()), list(full_scan(dates).items()))
+            self.assertEqual(cookie_index.load_frequencies({datetime.date(2000, 1, 1)}), {})
+
+            dates = {datetime.date(2018, 11, 29), datetime.date(2018, 11, 30)}
+            with open(log, "a") as log_file:
+                log_file.write("AtY0laUfhglK3lC7,2018-11-30T00:00:00+00:00\nmalformed line\n")
+                log_file.write("SAZuXPGUrfbcn5UA,2018-11-29T00:00:00+00:00\nSAZuXPGUrfbcn5UA,2018-11-29")
+            self.assertFalse(cookie_index.is_current())
+            cookie_index.ensure_current(rebuild=False)
+            self.assertTrue(cookie_index.is_current())
+            self.assertEqual(list(cookie_index.load_frequencies(dates).items()), list(full_scan(dates).items()))
+            self.assertEqual(cookie_index.load_frequencies({datetime.date(2018, 11, 29)}), {"SAZuXPGUrfbcn5UA": 2})
+
+            with open(log, "a") as log_file:
+                log_file.write("T00:00:00+00:00\nAtY0laUfhglK3lC7,2018-11-29T00:00:00+00:00\n")
+            cookie_index.ensure_current(rebuild=False)
+            self.assertEqual(list(cookie_index.load_frequencies(dates).items()), list(full_scan(dates).items()))
+
+            write_random_log(log, 100, seed=1)
+            self.assertFalse(cookie_index.is_current())
+            with self.assertRaises(SystemExit):
+                cookie_index.ensure_current(rebuild=False)
+            with self.assertRaises(StaleIndexError):
+                CookieIndex(log, exit_on_error=False).ensure_current(rebuild=False)
+            cookie_index.ensure_current()
+            self.assertTrue(cookie_index.is_current())
+            dates = self.cookie_getter.strings_to_dates(["2018-12-09"])
+            self.assertEqual(list(cookie_index.load_frequencies(dates).items()), list(full_scan(dates).items()))
+
+            os.remove(log)
+            with self.assertRaises(LogFileNotFoundError):
+                CookieIndex(log, exit_on_error=False).is_current()
+
+    def test_cookie_lookup_index(self):
+        """Test the CookieLookupIndex class.
+
+        Function is tested in the following cases:
+        Index of many small blocks, every cookie of the log
+        Expected output: the per-day counts of a full scan, newest day first.
+        Cookie not in the log
+        Expected output: an empty dict, most blocks skipped by their Bloom filter.
+        Lines appended after the index was built, the last one unfinished
+        Expected output: the appended lines indexed as new blocks and counted, written in place
+        after the blocks already in the index file.
+        Several threads updating the index at once
+        Expected output: the updates take turns, and lookups still match a full scan.
+        Index with a half-written footer
+        Expected output: the index is rebuilt on lookup, which matches a full scan.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, "cookie_log.csv")
+            write_random_log(log, 2000)
+            cookie_lookup_index = CookieLookupIndex(log, block_entries=100)
+            cookie_lookup_index.ensure_current()
+            self.assertTrue(cookie_lookup_index.index_file_name.endswith(".idx"))
+
+            def full_scan(cookie):
+                day_counts = {}
+                for entry_cookie, log_date in self.csv_file_reader.iter_entries(log):
+                    if entry_cookie == cookie:
+                        day_counts[log_date] = day_counts.get(log_date, 0) + 1
+                return dict(sorted(day_counts.items(), reverse=True))
+
+            cookies = {cookie for cookie, _ in self.csv_file_reader.iter_entries(log)}
+            for cookie in cookies:
+                self.assertEqual(list(cookie_lookup_index.lookup(cookie).items()), list(full_scan(cookie).items()))
+
+            metrics.enable()
+            self.assertEqual(cookie_lookup_index.lookup("AtY0laUfhglK3lC7"), {})
+            read_stage = metrics.disable()["stages"]["read"]
+            self.assertGreater(read_stage["blocks_skipped"], 15)
+
+            cookie = next(iter(cookies))
+            index_inode = os.stat(cookie_lookup_index.index_file_name).st_ino
+            with open(cookie_lookup_index.index_file_name, "rb") as index_file:
+                index_data = index_file.read()
+            blocks = cookie_lookup_index._read_footer()["blocks"]
+            with open(log, "a") as log_file:
+                log_file.write(f"{cookie},2018-11-01T00:00:00+00:00\nmalformed line\n{cookie},2018-11-01")
+            cookie_lookup_index.ensure_current(rebuild=False)
+            self.assertEqual(list(cookie_lookup_index.lookup(cookie).items()), list(full_scan(cookie).items()))
+            self.assertEqual(cookie_lookup_index.lookup(cookie)[datetime.date(2018, 11, 1)], 2)
+            self.assertEqual(os.stat(cookie_lookup_index.index_file_name).st_ino, index_inode)
+            footer = cookie_lookup_index._read_footer()
+            self.assertEqual(footer["blocks"][: len(blocks)], blocks)
+            self.assertEqual(len(footer["blocks"]), len(blocks) + 1)
+            data_end = footer["blocks"][len(blocks)][0]
+            with open(cookie_lookup_index.index_file_name, "rb") as index_file:
+                self.assertEqual(index_file.read(data_end), index_data[:data_end])
+
+            with open(log, "a") as log_file:
+                log_file.write("\n" + f"{cookie},2018-11-02T00:00:00+00:00\n" * 250)
+            threads = [threading.Thread(target=CookieLookupIndex(log, block_entries=100).update) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertTrue(cookie_lookup_index.is_current())
+            self.assertEqual(list(cookie_lookup_index.lookup(cookie).items()), list(full_scan(cookie).items()))
+            self.assertEqual(cookie_lookup_index.lookup(cookie)[datetime.date(2018, 11, 2)], 250)
+
+            with open(cookie_lookup_index.index_file_name, "r+b") as index_file:
+                index_file.seek(-4, os.SEEK_END)
+                index_file.write(b"\xff" * 4)
+            self.assertEqual(list(cookie_lookup_index.lookup(cookie).items()), list(full_scan(cookie).items()))
+            self.assertTrue(cookie_lookup_index.is_current())
+
+    def test_space_saving(self):
+        """Test the SpaceSaving class.
+
+        Function is tested in the following cases:
+        Capacity larger than the number of cookies
+        Expected output: exact counts, no error, and the exact most active cookies as candidates.
+        Skewed stream with a capacity much smaller than the number of cookies
+        Expected output: every true count lies within the reported bounds, unmonitored cookies
+        were seen at most max_error() times, max_error() is at most total / capacity and the
+        true most active cookie is among the candidates.
+        """
+
+        cookies = ["abc", "def", "abc", "ghi", "def", "abc", "jkl"]
+        space_saving = SpaceSaving(10).offer_all(cookies)
+        self.assertEqual(space_saving.max_error(), 0)
+        self.assertEqual(space_saving.get_candidates(), {"abc": (3, 3)})
+        self.assertTrue(space_saving.is_complete())
+
+        rng = random.Random(0)
+        cookies = [f"cookie{int(rng.paretovariate(1.0))}" for _ in range(5000)]
+        space_saving = SpaceSaving(20).offer_all(cookies)
+        cookie_frequency = self.cookie_getter.get_cookie_frequencies(cookies)
+        self.assertEqual(space_saving.total, len(cookies))
+        self.assertLessEqual(space_saving.max_error(), len(cookies) / 20)
+        for cookie, count in cookie_frequency.items():
+            if cookie in space_saving.counts:
+                lower, upper = space_saving.get_bounds(cookie)
+                self.assertTrue(lower <= count <= upper)
+            else:
+                self.assertLessEqual(count, space_saving.max_error())
+        self.assertTrue(space_saving.is_complete())
+        for cookie in self.cookie_getter.get_most_active_from_frequencies(cookie_frequency):
+            self.assertIn(cookie, space_saving.get_candidates())
+
+    def test_hyperloglog(self):
+        """Test the HyperLogLog class and sketching logs with sketch_entries_by_date() and ShardCounter.
+
+        Function is tested in the following cases:
+        Empty sketch, and a few cookies seen several times
+        Expected output: 0, and the exact number of distinct cookies.
+        Error rate of 0.02
+        Expected output: 4096 registers, a relative standard error of at most 0.02.
+        Two overlapping streams of cookies sketched separately, then merged
+        Expected output: the registers of a sketch of both streams, an estimate of the
+        distinct cookies of both within 5%. Merging sketches of different precisions raises ValueError.
+        Log sketched per date, serially and in shards by 2 worker processes
+        Expected output: the same sketches, estimates within 5% of the exact counts.
+        """
+
+        self.assertEqual(HyperLogLog(12).estimate(), 0)
+        self.assertEqual(HyperLogLog(12).add_all(["abc", "def", "abc", "ghi", "def", "abc", "jkl"]).estimate(), 4)
+        sketch = HyperLogLog.for_error_rate(0.02)
+        self.assertEqual(len(sketch.registers), 4096)
+        self.assertLessEqual(sketch.error_rate, 0.02)
+
+        rng = random.Random(0)
+        cookies = [f"{rng.getrandbits(64):016x}" for _ in range(20000)]
+        first_sketch = HyperLogLog(12).add_all(cookies[:12000] * 2)
+        second_sketch = HyperLogLog(12).add_all(cookies[8000:])
+        self.assertEqual(
+            merge_sketches([first_sketch, second_sketch]).registers, HyperLogLog(12).add_all(cookies).registers
+        )
+        self.assertAlmostEqual(first_sketch.merge(second_sketch).estimate(), 20000, delta=1000)
+        with self.assertRaises(ValueError):
+            first_sketch.merge(HyperLogLog(10))
+
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, "cookie_log.csv")
+            write_random_log(log, 2000)
+            dates = {datetime.date(2018, 12, 9), datetime.date(2018, 12, 5)}
+            frequencies_by_date = self.cookie_getter.get_cookie_frequencies_by_date(
+                self.csv_file_reader.iter_entries(log), dates
+            )
+            sketches_by_date = sketch_entries_by_date(self.csv_file_reader.iter_entries(log), dates, 0.02)
+            self.assertEqual(list(sketches_by_date), list(frequencies_by_date))
+            for log_date, sketch in sketches_by_date.items():
+                self.assertAlmostEqual(sketch.estimate(), len(frequencies_by_date[log_date]), delta=10)
+            shard_sketches_by_date = ShardCounter(2).sketch_cookies_by_date([log], dates, 0.02)
+            self.assertEqual(
+                {log_date: sketch.registers for log_date, sketch in shard_sketches_by_date.items()},
+                {log_date: sketch.registers for log_date, sketch in sketches_by_date.items()},
+            )
+
+    def test_external_counter(self):
+        """Test ExternalCounter.get_most_active_cookies() against get_most_active_cookies().
+
+        Function is tested in the following cases:
+        Few distinct cookies with ties
+        Expected output: the tied cookies in order of first occurrence, counted without spilling.
+        Many more distinct cookies than fit in the budget, with ties, one and two workers
+        Expected output: the same cookies and count, with spills, and memory traced under the budget.
+        Empty stream
+        Expected output: no cookie.
+        """
+
+        cookies = ["abc", "def", "abc", "ghi", "def", "jkl"]
+        external_counter = ExternalCounter(1024**2)
+        self.assertEqual(external_counter.get_most_active_cookies(cookies), (["abc", "def"], 2))
+        self.assertEqual(external_counter.spills, 0)
+
+        # Four cookies tie for the highest count.
+        rng = random.Random(2)
+        pool = [f"{index:016x}" for index in range(12000)]
+        cookies = [rng.choice(pool) for _ in range(24000)]
+        most_active_cookies = self.cookie_getter.get_most_active_cookies(cookies)
+        expected = (most_active_cookies, cookies.count(most_active_cookies[0]))
+        memory_budget = 128 * 1024
+        tracemalloc.start()
+        try:
+            external_counter = ExternalCounter(memory_budget)
+            self.assertEqual(external_counter.get_most_active_cookies(iter(cookies)), expected)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(external_counter.spills, 1)
+        self.assertLess(peak, memory_budget)
+        external_counter = ExternalCounter(memory_budget, workers=2)
+        self.assertEqual(external_counter.get_most_active_cookies(iter(cookies)), expected)
+        self.assertEqual(ExternalCounter(memory_budget).get_most_active_cookies([]), ([], 0))
+
+    def test_sliding_window_counter(self):
+        """Test the SlidingWindowCounter class against counting the lines in the window from scratch.
+
+        Function is tested in the following cases:
+        Random stream with ties, out-of-order lines, lines older than the window and gaps longer than it
+        Expected output: after every few lines, the same counts and the same most active cookies, in
+        order of first occurrence, as recounting the lines still in the window.
+        """
+
+        rng = random.Random(0)
+        window_counter = SlidingWindowCounter(600, buckets=60)
+        self.assertEqual(window_counter.get_most_active(), ([], 0))
+        counted = []
+        seconds = 1544313600
+        for index in range(3000):
+            seconds += rng.choice([0, 0, 1, 2, 5, 30, 1000])
+            entry = (f"cookie{rng.randint(0, 20)}", seconds - rng.choice([0] * 8 + [3, 40, 700]))
+            late_lines = window_counter.late_lines
+            window_counter.add(*entry)
+            if window_counter.late_lines == late_lines:
+                counted.append(entry)
+            if index % 7 == 0:
+                start, end = window_counter.get_window()
+                # Recount by bucket, then by arrival, which is the order of first occurrence the counter keeps.
+                in_window = sorted((entry for entry in counted if entry[1] >= start), key=lambda entry: entry[1] // 10)
+                cookie_frequency = self.cookie_getter.get_cookie_frequencies(cookie for cookie, _ in in_window)
+                self.assertEqual(window_counter.counts, cookie_frequency)
+                most_active_cookies = self.cookie_getter.get_most_active_from_frequencies(cookie_frequency)
+                self.assertEqual(
+                    window_counter.get_most_active(), (most_active_cookies, cookie_frequency[most_active_cookies[0]])
+                )
+                self.assertEqual(end, max(seconds for _, seconds in in_window))
+        self.assertGreater(window_counter.late_lines, 0)
+
+    def test_log_follower(self):
+        """Test LogFollower.iter_entries() on a growing, rotated and truncated log.
+
+        Function is tested in the following cases:
+        Whole file, then appended lines, the last one written in two parts
+        Expected output: each complete line once, an unfinished line only once it is complete.
+        Log renamed and replaced, then truncated
+        Expected output: the lines left in the old file, then the new file from the start.
+        Malformed line
+        Expected output: left out and counted in malformed_lines.
+        Log replaced by a gzip compressed file
+        Expected output: CompressedLogError with exit_on_error=False, SystemExit otherwise.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, "cookie_log.csv")
+            follower = LogFollower(log)
+            self.assertEqual(list(follower.iter_entries()), [])
+            with open(log, "w") as log_file:
+                log_file.write("AtY0laUfhglK3lC7,2018-12-09T14:19:00+00:00\n")
+            self.assertEqual(list(follower.iter_entries()), [("AtY0laUfhglK3lC7", 1544365140)])
+            with open(log, "a") as log_file:
+                log_file.write("SAZuXPGUrfbcn5UA,2018-12-09T14:20:00+00:00\nmalformed line\n5UAVanZf6U")
+            self.assertEqual(list(follower.iter_entries()), [("SAZuXPGUrfbcn5UA", 1544365200)])
+            self.assertEqual(follower.csv_file_reader.malformed_lines, 1)
+            with open(log, "a") as log_file:
+                log_file.write("tGyKVS,2018-12-09T14:21:00+01:00\n")
+            self.assertEqual(list(follower.iter_entries()), [("5UAVanZf6UtGyKVS", 1544361660)])
+
+            with open(log, "a") as log_file:
+                log_file.write("AtY0laUfhglK3lC7,2018-12-09T14:22:00+00:00\n")
+            os.rename(log, log + ".1")
+            with open(log, "w") as log_file:
+                log_file.write("4sMM2LxV07bPJzwf,2018-12-09T14:23:00+00:00\n")
+            self.assertEqual(
+                list(follower.iter_entries()),
+                [("AtY0laUfhglK3lC7", 1544365320), ("4sMM2LxV07bPJzwf", 1544365380)],
+            )
+            with open(log, "w") as log_file:
+                log_file.write("fbcn5UAVanZf6UtG,2018-12-09T14:24\n")
+            self.assertEqual(list(follower.iter_entries()), [("fbcn5UAVanZf6UtG", 1544365440)])
+            follower.close()
+
+            with gzip.open(log, "wt") as log_file:
+                log_file.write("AtY0laUfhglK3lC7,2018-12-09T14:25:00+00:00\n")
+            with self.assertRaises(CompressedLogError):
+                list(LogFollower(log, exit_on_error=False).iter_entries())
+            with self.assertRaises(SystemExit):
+                list(LogFollower(log).iter_entries())
+
+    def test_columnar_log(self):
+        """Test converting logs with write_columnar_log() and reading the columnar log with CSVFileReader.
+
+        Function is tested in the following cases:
+        Sorted log with malformed lines, followed by an unsorted log with a time in another
+        UTC offset and a time that cannot be read
+        Expected output: the same entries from iter_entries() and the same cookies per date
+        from iter_cookies_on_dates() as the logs, the date span read from the footer, a
+        single range from split_into_ranges() and the time of every line from iter_rows().
+        Columnar log among the logs converted
+        Expected output: its entries copied over.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, "cookie_log.csv")
+            write_random_log(log, 500)
+            unsorted_log = os.path.join(directory, "unsorted_log.csv")
+            with open(unsorted_log, "w") as log_file:
+                log_file.write("AtY0laUfhglK3lC7,2018-12-08T23:30:00-01:00\n")
+                log_file.write("SAZuXPGUrfbcn5UA,2018-12-09T10:00:00+00:00\n")
+                log_file.write("5UAVanZf6UtGyKVS,2018-12-08Tlate\n")
+            columnar_log = os.path.join(directory, "cookie_log.clog")
+            entries = self.csv_file_reader.write_columnar_log([log, unsorted_log], columnar_log)
+
+            expected_entries = list(self.csv_file_reader.iter_entries(log)) + list(
+                self.csv_file_reader.iter_entries(unsorted_log)
+            )
+            self.assertEqual(entries, len(expected_entries))
+            self.assertLess(os.path.getsize(columnar_log), os.path.getsize(log) / 3)
+            csv_file_reader = CSVFileReader()
+            self.assertEqual(sorted(csv_file_reader.iter_entries(columnar_log)), sorted(expected_entries))
+            for log_date in {log_date for _, log_date in expected_entries}:
+                self.assertEqual(
+                    list(csv_file_reader.iter_cookies_on_dates(columnar_log, {log_date})),
+                    [cookie for cookie, entry_date in expected_entries if entry_date == log_date],
+                )
+            self.assertEqual(
+                csv_file_reader.get_date_span(columnar_log),
+                (min(log_date for _, log_date in expected_entries), datetime.date(2018, 12, 9)),
+            )
+            self.assertEqual(csv_file_reader.split_into_ranges(columnar_log, 4), [(0, sys.maxsize)])
+            self.assertEqual(csv_file_reader.malformed_lines, 0)
+
+            with ColumnarLog(columnar_log) as columnar_log_file:
+                rows = list(columnar_log_file.iter_rows({datetime.date(2018, 12, 8)}))[-2:]
+            self.assertEqual(
+                rows,
+                [
+                    ("AtY0laUfhglK3lC7", datetime.date(2018, 12, 8), 24 * 3600 + 30 * 60),
+                    ("5UAVanZf6UtGyKVS", datetime.date(2018, 12, 8), None),
+                ],
+            )
+
+            copied_log = os.path.join(directory, "copied_log.clog")
+            self.csv_file_reader.write_columnar_log([columnar_log], copied_log)
+            self.assertEqual(
+                list(csv_file_reader.iter_entries(copied_log)), list(csv_file_reader.iter_entries(columnar_log))
+            )
+
+    def test_read_ahead_file(self):
+        """Test reading logs ahead with ReadAheadFile and with CSVFileReader(read_ahead_buffers=...).
+
+        Function is tested in the following cases:
+        Buffers smaller than a line, one buffer ahead, last line without a newline
+        Expected output: the same lines as iterating over the file.
+        Closed after the first line
+        Expected output: the background thread stopped and the file closed.
+        CSVFileReader reading two buffers ahead
+        Expected output: the same entries and cookies per date as without read-ahead.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, "cookie_log.csv")
+            write_random_log(log, 500)
+            with open(log, "ab") as log_file:
+                log_file.write(b"AtY0laUfhglK3lC7,2018-11-30T10:13:00+00:00")
+            with open(log, "rb") as log_file:
+                expected_lines = list(log_file)
+            with ReadAheadFile(open(log, "rb"), buffer_count=1, buffer_size=10) as read_ahead_file:
+                self.assertEqual(list(read_ahead_file), expected_lines)
+
+            read_ahead_file = ReadAheadFile(open(log, "rb"), buffer_count=1, buffer_size=10)
+            self.assertEqual(next(iter(read_ahead_file)), expected_lines[0])
+            read_ahead_file.close()
+            self.assertFalse(read_ahead_file.reader.is_alive())
+            self.assertTrue(read_ahead_file.raw_file.closed)
+
+            csv_file_reader = CSVFileReader(read_ahead_buffers=2, read_ahead_size=64)
+            self.assertEqual(list(csv_file_reader.iter_entries(log)), list(self.csv_file_reader.iter_entries(log)))
+            dates = {datetime.date(2018, 12, 9), datetime.date(2018, 11, 30)}
+            self.assertEqual(
+                list(csv_file_reader.iter_cookies_on_dates(log, dates)),
+                list(self.csv_file_reader.iter_cookies_on_dates(log, dates)),
+            )
+
     def test_main(self):
         """Test the entire program for correct output in various conditions.
 
@@ -249,18 +1542,21 @@ class TestCookieGetter(unittest.TestCase):
         Valid file, some invalid dates
         """
 
+        log = self.csv_file_reader.read_file_to_list("cookie_log.csv")
         self.assertEqual(
-            self.cookie_getter.main("cookie_log.csv", ["2018-12-08"]),
+            self.cookie_getter.main(log, ["2018-12-08"]),
             ["SAZuXPGUrfbcn5UA", "4sMM2LxV07bPJzwf", "fbcn5UAVanZf6UtG"],
         )
-        self.assertEqual(self.cookie_getter.main("cookie_log.csv", ["2018-12-09"]), ["AtY0laUfhglK3lC7"])
-        self.assertEqual(self.cookie_getter.main("cookie_log.csv", ["2018-12-07"]), ["4sMM2LxV07bPJzwf"])
+        self.assertEqual(self.cookie_getter.main(log, ["2018-12-09"]), ["AtY0laUfhglK3lC7"])
+        self.assertEqual(self.cookie_getter.main(log, ["2018-12-07"]), ["4sMM2LxV07bPJzwf"])
         with self.assertRaises(SystemExit):
-            self.cookie_getter.main("cookie_log.csv", ["2018-12-06"])
+            self.cookie_getter.main(log, ["2018-12-06"])
         self.assertEqual(
-            self.cookie_getter.main("cookie_log.csv", ["2018-12-09", "2018-12-08", "2018-12-07"]),
+            self.cookie_getter.main(log, ["2018-12-09", "2018-12-08", "2018-12-07"]),
             ["AtY0laUfhglK3lC7", "SAZuXPGUrfbcn5UA", "4sMM2LxV07bPJzwf"],
         )
+        # The entries passed in are the ones counted.
+        self.assertEqual(self.cookie_getter.main(log[:5], ["2018-12-08"]), ["SAZuXPGUrfbcn5UA"])
         # Test program in condition: File not found.
         with self.assertRaises(SystemExit):
             self.csv_file_reader.read_file_to_list("This_is_not_a_file.csv")
@@ -346,6 +1642,91 @@ class TestCookieGetter(unittest.TestCase):
             ["SAZuXPGUrfbcn5UA", "4sMM2LxV07bPJzwf", "fbcn5UAVanZf6UtG"],
         )
 
+    def test_command_line(self):
+        """Test most_active_cookie.py run as a command line program on 'cookie_log.csv'.
+
+        Function is tested in the following cases:
+        One date
+        Expected output: the most active cookie, unprefixed.
+        Several dates given with -d, in any order
+        Expected output: 'YYYY-MM-DD,cookie' for every date, newest first.
+        A range of dates with --combined and --top
+        Expected output: 'YYYY-MM-DD,cookie,count' for every date of the range, newest first, then the
+        range across all of them.
+        No date, only one end of a range, --top or --workers 0 or negative, --read-ahead negative, --top or
+        --histogram with --external or --approximate, or --distinct with --index or --vectorized but without --exact
+        Expected output: a usage error with exit status 2.
+        --distinct --exact with --index
+        Expected output: 'YYYY-MM-DD,distinct cookies' counted from the index.
+        --follow on a compressed log, with the default window
+        Expected output: execution stops with a critical message before anything is printed.
+        """
+
+        program = os.path.join(os.path.dirname(os.path.abspath(__file__)), "most_active_cookie.py")
+        log = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cookie_log.csv")
+
+        def run(*arguments, log_file_name=log):
+            # Run in a temporary directory, where the program writes its 'cookies.log'.
+            return subprocess.run(
+                [sys.executable, program, log_file_name, "--no-cache"] + list(arguments),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+                cwd=directory,
+            )
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(run("-d", "2018-12-09").stdout.splitlines(), ["AtY0laUfhglK3lC7"])
+            self.assertEqual(run("-d", "2018-12-09", "--read-ahead", "0").stdout.splitlines(), ["AtY0laUfhglK3lC7"])
+            self.assertEqual(
+                run("-d", "2018-12-08", "-d", "2018-12-09").stdout.splitlines(),
+                [
+                    "2018-12-09,AtY0laUfhglK3lC7",
+                    "2018-12-08,SAZuXPGUrfbcn5UA",
+                    "2018-12-08,4sMM2LxV07bPJzwf",
+                    "2018-12-08,fbcn5UAVanZf6UtG",
+                ],
+            )
+            self.assertEqual(
+                run("--from", "2018-12-07", "--to", "2018-12-09", "--combined", "--top", "2").stdout.splitlines(),
+                [
+                    "2018-12-09,AtY0laUfhglK3lC7,2",
+                    "2018-12-09,SAZuXPGUrfbcn5UA,1",
+                    "2018-12-08,SAZuXPGUrfbcn5UA,1",
+                    "2018-12-08,4sMM2LxV07bPJzwf,1",
+                    "2018-12-07,4sMM2LxV07bPJzwf,1",
+                    "2018-12-07..2018-12-09,AtY0laUfhglK3lC7,2",
+                    "2018-12-07..2018-12-09,SAZuXPGUrfbcn5UA,2",
+                ],
+            )
+            usage_errors = [(), ("--from", "2018-12-07"), ("--combined",)]
+            usage_errors += [("-d", "2018-12-09", "--top", top) for top in ["0", "-1", "two"]]
+            usage_errors += [("-d", "2018-12-09", "--workers", workers) for workers in ["0", "-2"]]
+            usage_errors += [("-d", "2018-12-09", "--read-ahead", buffers) for buffers in ["-1", "many"]]
+            usage_errors += [
+                ("-d", "2018-12-09", "--top", "2", "--external"),
+                ("-d", "2018-12-09", "--histogram", "--approximate"),
+                ("-d", "2018-12-09", "--distinct", "--index"),
+                ("-d", "2018-12-09", "--distinct", "--vectorized"),
+            ]
+            for arguments in usage_errors:
+                completed = run(*arguments)
+                self.assertEqual(completed.returncode, 2)
+                self.assertEqual(completed.stdout, "")
+                self.assertIn("error:", completed.stderr)
+
+            indexed_log = os.path.join(directory, "cookie_log.csv")
+            shutil.copyfile(log, indexed_log)
+            completed = run("-d", "2018-12-09", "--distinct", "--exact", "--index", log_file_name=indexed_log)
+            self.assertEqual(completed.stdout.splitlines(), ["2018-12-09,3"])
+
+            compressed_log = os.path.join(directory, "cookie_log.csv.gz")
+            with open(log, "rb") as log_file, gzip.open(compressed_log, "wb") as compressed_file:
+                compressed_file.write(log_file.read())
+            completed = run("--follow", log_file_name=compressed_log)
+            self.assertEqual(completed.stdout, "")
+            self.assertIn("CRITICAL Cannot follow the gzip compressed log", completed.stderr)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""This module counts the cookies of fixed-width log files with NumPy, a chunk of lines at a time.
+
+Lines such as 'AtY0laUfhglK3lC7,2018-12-09T14:19:00+00:00' are 16 bytes of cookie, a
+comma and a 25-byte timestamp. The log is read in large chunks cut at a newline. In a
+clean chunk every line has that width, so the lines are found by arithmetic and checked
+with a single pass over the chunk; otherwise they are found with one vectorized search.
+Filtering on a target date compares one byte column of all the lines at a time, and
+only the cookies of the matching lines are gathered and counted with np.unique(). Any
+other line (another width, '\\r\\n' endings, a comma, NUL or non-ASCII byte in the cookie,
+the last line without a newline) goes through CSVFileReader.parse_line(), and every
+chunk is merged in order of first occurrence, so the counts and the order of ties are
+the same as those of a serial read with the scalar parser. The date of the fixed lines
+is checked once per run of lines on the same date with CSVFileReader.get_date_of_key(),
+so a line with an impossible date such as '2018-13-45' goes through parse_line() and is
+counted as malformed, as by a serial read. Columnar logs are read by CSVFileReader,
+which needs no parsing.
+
+NumPy is optional: if it cannot be imported, is_available() returns False and the
+caller counts with the scalar parser instead. It is intended to be imported by the
+'most_active_cookie.py' file where the VectorCounter class is instantiated.
+"""
+
+import datetime as dt
+import logging
+from typing import Dict, Iterator, List, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from columnar_log import is_columnar_log
+from csv_file_reader import CSVFileReader
+from metrics import metrics
+
+COOKIE_WIDTH = 16
+DATE_WIDTH = 10
+# Position of the tens of the day in 'YYYY-MM-DD'.
+DAY_TENS = 8
+# Positions of 'YYYY-MM-DD' in the order they are compared: the day rules out most lines.
+DATE_MATCH_ORDER = [9, 8, 6, 5, 3, 2, 1, 0, 4, 7]
+# 'cookie,YYYY-MM-DDThh:mm:ss+00:00' without the newline, and the position of its '+'.
+LINE_WIDTH = COOKIE_WIDTH + 1 + 25
+OFFSET_SIGN = LINE_WIDTH - 6
+CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def is_available() -> bool:
+    """Return whether NumPy could be imported, i.e. whether the VectorCounter can be used."""
+
+    return np is not None
+
+
+class VectorCounter:
+    """Count the cookies of log files on the target date(s) with vectorized NumPy operations."""
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE) -> None:
+        self.chunk_size = chunk_size
+        self.csv_file_reader = CSVFileReader()
+
+    def count_cookies_on_dates(self, file_names: List[str], dates: Set[dt.date]) -> Dict:
+        """Return the cookie frequencies on the specified date(s) over the log files, in order of first occurrence."""
+
+        return self._count(file_names, [dates])[0]
+
+    def count_cookies_by_date(self, file_names: List[str], dates: Set[dt.date]) -> Dict[dt.date, Dict]:
+        """Return the cookie frequencies of each target date over the log files, leaving out dates with no cookie."""
+
+        log_dates = sorted(dates, reverse=True)
+        frequencies = self._count(file_names, [{log_date} for log_date in log_dates])
+        return {log_date: frequency for log_date, frequency in zip(log_dates, frequencies) if frequency}
+
+    def _count(self, file_names: List[str], date_groups: List[Set[dt.date]]) -> List[Dict]:
+        """Return one dict of cookie frequencies per group of dates, counting the files in the order given.
+
+        Malformed lines are totalled over all the files and logged once.
+        """
+
+        frequencies = [{} for _ in date_groups]
+        malformed_lines = self.csv_file_reader.malformed_lines
+        for file_name in self.csv_file_reader.filter_files_on_dates(file_names, set().union(*date_groups)):
+            if is_columnar_log(file_name):
+                # Nothing to parse: the cookies are read from the segments of the dates.
+                for frequency, dates in zip(frequencies, date_groups):
+                    for cookie in self.csv_file_reader.iter_cookies_on_dates(file_name, dates):
+                        frequency[cookie] = frequency.get(cookie, 0) + 1
+                continue
+            with self.csv_file_reader.open_log(file_name) as log_file:
+                for chunk in metrics.iter_stage("read", self._iter_chunks(log_file), count_bytes=True):
+                    with metrics.stage("count"):
+                        for frequency, chunk_counts in zip(frequencies, self._count_chunk(chunk, date_groups)):
+                            for cookie, count in chunk_counts:
+                                frequency[cookie] = frequency.get(cookie, 0) + count
+
+        malformed_lines = self.csv_file_reader.malformed_lines - malformed_lines
+        metrics.count("count", "lines_skipped", malformed_lines)
+        if malformed_lines > 0:
+            logging.warning(f"Log file contains invalid data. Skipped {malformed_lines} malformed line(s).")
+        return frequencies
+
+    def _iter_chunks(self, log_file) -> Iterator[bytearray]:
+        """Yield the log in chunks of about chunk_size bytes, each ending just after a newline but the last.
+
+        Each chunk is read straight into a new buffer and completed with the rest of its
+        last line, so no chunk is copied to cut it at a newline.
+        """
+
+        while True:
+            chunk = bytearray(self.chunk_size)
+            size = log_file.readinto(chunk)
+            if not size:
+                break
+            del chunk[size:]
+            chunk += log_file.readline()
+            yield chunk
+
+    def _find_lines(self, buffer) -> Tuple:
+        """Return the start offsets of the lines of the chunk, their end offsets and the indices of the fixed ones.
+
+        A line is in the fixed layout if it is LINE_WIDTH bytes long, its first comma follows
+        the cookie, a 'T' follows the date and the tens of the day are not a space, which
+        strptime() would accept as ' 9'. A clean chunk, nothing but such lines, is told by
+        one pass over the buffer: the only bytes below '-' in it are the comma, the '+' of
+        the offset and the newline of each line, at their fixed columns.
+        """
+
+        line_count = len(buffer) // (LINE_WIDTH + 1)
+        if (
+            line_count * (LINE_WIDTH + 1) == len(buffer)
+            and np.count_nonzero(buffer < ord("-")) == 3 * line_count
+            and (buffer[LINE_WIDTH :: LINE_WIDTH + 1] == ord("\n")).all()
+            and (buffer[COOKIE_WIDTH :: LINE_WIDTH + 1] == ord(",")).all()
+            and (buffer[OFFSET_SIGN :: LINE_WIDTH + 1] == ord("+")).all()
+        ):
+            line_starts = np.arange(0, len(buffer), LINE_WIDTH + 1)
+            is_fixed = buffer[COOKIE_WIDTH + 1 + DATE_WIDTH :: LINE_WIDTH + 1] == ord("T")
+            return line_starts, line_starts + LINE_WIDTH, np.flatnonzero(is_fixed)
+
+        line_ends = np.flatnonzero(buffer == ord("\n"))
+        if len(line_ends) == 0 or line_ends[-1] != len(buffer) - 1:
+            # The last line of the log has no newline.
+            line_ends = np.append(line_ends, len(buffer))
+        line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+        candidates = np.flatnonzero(line_ends - line_starts == LINE_WIDTH)
+        starts = line_starts[candidates]
+        commas = np.append(np.flatnonzero(buffer == ord(",")), len(buffer))
+        is_fixed = (
+            (commas[np.searchsorted(commas, starts)] == starts + COOKIE_WIDTH)
+            & (buffer[starts + COOKIE_WIDTH + 1 + DATE_WIDTH] == ord("T"))
+            & (buffer[starts + COOKIE_WIDTH + 1 + DAY_TENS] != ord(" "))
+        )
+        return line_starts, line_ends, candidates[is_fixed]
+
+    def _keep_valid_dates(self, buffer, line_starts, fixed_lines):
+        """Return the indices of the fixed lines whose 'YYYY-MM-DD' is a date parse_line() reads.
+
+        The lines of a log come in runs on the same date, so the date of each line is only
+        compared with that of the previous line, and the distinct dates starting a run are
+        checked once each, with CSVFileReader.get_date_of_key(). The other fixed lines are
+        left to parse_line(), which counts them as malformed.
+        """
+
+        if len(fixed_lines) == 0:
+            return fixed_lines
+        # Each date read as two integers, 'YYYY-MM-' and 'DD', from overlapping views of the chunk.
+        date_starts = line_starts[fixed_lines] + COOKIE_WIDTH + 1
+        year_months = np.ndarray((len(buffer) - 7,), dtype="<u8", buffer=buffer, strides=(1,))[date_starts]
+        days = np.ndarray((len(buffer) - 1,), dtype="<u2", buffer=buffer, strides=(1,))[date_starts + 8]
+        is_run_start = np.ones(len(fixed_lines), dtype=bool)
+        is_run_start[1:] = (year_months[1:] != year_months[:-1]) | (days[1:] != days[:-1])
+        run_starts = date_starts[is_run_start]
+        _, first_runs, key_indices = np.unique(
+            np.stack([year_months[is_run_start], days[is_run_start].astype(np.uint64)], axis=1),
+            axis=0,
+            return_index=True,
+            return_inverse=True,
+        )
+        is_valid_key = np.array(
+            [
+                self.csv_file_reader.get_date_of_key(bytes(buffer[start : start + DATE_WIDTH])) is not None
+                for start in run_starts[first_runs].tolist()
+            ],
+            dtype=bool,
+        )
+        is_valid = is_valid_key[key_indices.ravel()][np.cumsum(is_run_start) - 1]
+        return fixed_lines[is_valid]
+
+    def _count_chunk(self, chunk: bytearray, date_groups: List[Set[dt.date]]) -> List[List[Tuple[str, int]]]:
+        """Return, for each group of dates, the (cookie, count) pairs of one chunk in order of first occurrence.
+
+        Fixed-layout lines are matched on their date a byte column at a time, the most
+        selective columns first, and only the cookies of the matching lines are gathered
+        and counted with np.unique(); other lines are parsed one by one. The pairs of both
+        are put back in the order their cookie first appears in the chunk, so merging the
+        chunks one after the other keeps the order of a serial read.
+        """
+
+        buffer = np.frombuffer(chunk, dtype=np.uint8)
+        line_starts, line_ends, fixed_lines = self._find_lines(buffer)
+        fixed_lines = self._keep_valid_dates(buffer, line_starts, fixed_lines)
+        date_starts = line_starts[fixed_lines] + COOKIE_WIDTH + 1
+
+        matches_by_group = []
+        for dates in date_groups:
+            is_on_dates = np.zeros(len(fixed_lines), dtype=bool)
+            for log_date in dates:
+                date_key = log_date.isoformat().encode()
+                matches = np.arange(len(fixed_lines))
+                for position in DATE_MATCH_ORDER:
+                    matches = matches[buffer[date_starts[matches] + position] == date_key[position]]
+                is_on_dates[matches] = True
+            matches_by_group.append(np.flatnonzero(is_on_dates))
+
+        # Cookies holding a NUL or non-ASCII byte are left to parse_line().
+        all_matches = np.unique(np.concatenate(matches_by_group)) if len(matches_by_group) > 1 else matches_by_group[0]
+        cookie_rows = buffer[line_starts[fixed_lines[all_matches], None] + np.arange(COOKIE_WIDTH)]
+        is_valid = ((cookie_rows > 0) & (cookie_rows < 128)).all(axis=1)
+        cookies = cookie_rows.view(f"S{COOKIE_WIDTH}").ravel()
+
+        is_fallback = np.ones(len(line_starts), dtype=bool)
+        is_fallback[fixed_lines] = False
+        is_fallback[fixed_lines[all_matches[~is_valid]]] = True
+        fallback_lines = np.flatnonzero(is_fallback)
+        fallback_entries = self._parse_fallback_lines(chunk, line_starts[fallback_lines], line_ends[fallback_lines])
+
+        chunk_counts = []
+        for dates, matches in zip(date_groups, matches_by_group):
+            rows = np.searchsorted(all_matches, matches)
+            rows = rows[is_valid[rows]]
+            unique_cookies, first_rows, counts = np.unique(cookies[rows], return_index=True, return_counts=True)
+            first_match_lines = fixed_lines[all_matches[rows[first_rows]]]
+
+            # cookie -> [line of its first occurrence in the chunk, count]
+            first_lines = {}
+            for cookie, line, count in zip(unique_cookies.tolist(), first_match_lines.tolist(), counts.tolist()):
+                first_lines[cookie.decode()] = [line, count]
+            for line, (cookie, log_date) in zip(fallback_lines.tolist(), fallback_entries):
+                if log_date not in dates:
+                    continue
+                first_line = first_lines.get(cookie)
+                if first_line is None:
+                    first_lines[cookie] = [line, 1]
+                else:
+                    first_line[0] = min(first_line[0], line)
+                    first_line[1] += 1
+            chunk_counts.append(
+                [(cookie, count) for cookie, (_, count) in sorted(first_lines.items(), key=lambda item: item[1][0])]
+            )
+        return chunk_counts
+
+    def _parse_fallback_lines(self, chunk: bytearray, line_starts, line_ends) -> List[Tuple]:
+        """Parse the lines of the chunk not in the fixed layout with parse_line(), one entry per line.
+
+        A malformed line gives (None, None) and is counted in csv_file_reader.malformed_lines.
+        """
+
+        entries = []
+        for start, end in zip(line_starts.tolist(), line_ends.tolist()):
+            try:
+                entries.append(self.csv_file_reader.parse_line(bytes(chunk[start : end + 1])))
+            except (IndexError, ValueError, Exception):
+                self.csv_file_reader.malformed_lines += 1
+                entries.append((None, None))
+        return entries
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""This module follows growing log files and keeps the most active cookies of the last minutes up to date.
+
+A LogFollower reads the lines appended to a log, like 'tail -F': it waits for a line to
+be complete before returning it, and reopens the file from the start when it is
+rotated (replaced by a new file of the same name) or truncated, after reading whatever
+was left in the old file.
+
+A SlidingWindowCounter counts the cookies of the lines whose timestamps fall within the
+window, e.g. the last 15 minutes before the newest timestamp seen. The window is split
+into BUCKETS_PER_WINDOW time buckets, each holding the cookie counts of its lines. When
+a line opens a new bucket, the buckets that fell out of the window are subtracted, so
+every line is counted once and expired once. The cookies are also grouped by count,
+so the highest count and the cookies that reach it are known at any time without
+going over all the counts: each line moves its cookie up one group, in O(1), and
+expiring a bucket moves each of its cookies down by its count in that bucket.
+
+It is intended to be imported by the 'most_active_cookie.py' file where the
+LogFollower and SlidingWindowCounter classes are instantiated.
+"""
+
+import logging
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from cookie_errors import CompressedLogError, raise_or_exit
+from csv_file_reader import CSVFileReader
+from metrics import metrics
+
+BUCKETS_PER_WINDOW = 60
+DEFAULT_WINDOW = "15m"
+DEFAULT_POLL_INTERVAL = 1.0
+READ_SIZE = 1024 * 1024
+
+
+class SlidingWindowCounter:
+    """Count the cookies of the last window_seconds of log time and track the most active ones as lines arrive."""
+
+    def __init__(self, window_seconds: int, buckets: int = BUCKETS_PER_WINDOW) -> None:
+        self.bucket_seconds = max(1, window_seconds // buckets)
+        self.bucket_count = -(-window_seconds // self.bucket_seconds)
+        # Bucket index (POSIX seconds // bucket_seconds) -> {cookie: count}, cookies in order of arrival.
+        self.buckets = {}
+        self.newest_bucket = None
+        # cookie -> count over the window, and the set of cookies with each count: cookies_by_count[count].
+        # Sets emptied by expiry are kept, so there is one for every count up to the highest ever reached.
+        self.counts = {}
+        self.cookies_by_count = [set()]
+        self.max_count = 0
+        # POSIX time of the newest line counted, the end of the window.
+        self.newest_time = None
+        # Lines older than the window when they arrived, which are not counted.
+        self.late_lines = 0
+
+    def add(self, cookie: str, seconds: int) -> None:
+        """Count one line of cookie stamped seconds (POSIX time), expiring the buckets it pushes out of the window."""
+
+        self.add_all([(cookie, seconds)])
+
+    def add_all(self, entries: Iterable[Tuple[str, int]]) -> int:
+        """Count the (cookie, seconds) entries in order, as add() does for each. Return how many there were.
+
+        This is the loop every line goes through, so the state it touches on each line is
+        held in local variables and only written back to the counter when a bucket changes
+        and at the end.
+        """
+
+        buckets, counts, cookies_by_count = self.buckets, self.counts, self.cookies_by_count
+        bucket_seconds = self.bucket_seconds
+        newest_time, max_count = self.newest_time, self.max_count
+        bucket_index = newest_bucket = self.newest_bucket
+        bucket = None if bucket_index is None else buckets.get(bucket_index)
+        added = 0
+        for cookie, seconds in entries:
+            added += 1
+            index = seconds // bucket_seconds
+            if index != bucket_index or bucket is None:
+                if newest_bucket is None or index > newest_bucket:
+                    self.max_count = max_count
+                    self._advance(index)
+                    max_count = self.max_count
+                    newest_bucket = index
+                    if newest_time is None:
+                        newest_time = seconds
+                elif index <= newest_bucket - self.bucket_count:
+                    self.late_lines += 1
+                    continue
+                bucket_index = index
+                bucket = buckets.get(index)
+                if bucket is None:
+                    bucket = buckets[index] = {}
+            if seconds > newest_time:
+                newest_time = seconds
+            bucket[cookie] = bucket.get(cookie, 0) + 1
+
+            count = counts.get(cookie, 0)
+            cookies_by_count[count].discard(cookie)
+            count += 1
+            counts[cookie] = count
+            if count > max_count:
+                max_count = count
+                if count == len(cookies_by_count):
+                    cookies_by_count.append(set())
+            cookies_by_count[count].add(cookie)
+
+        self.newest_time, self.max_count = newest_time, max_count
+        return added
+
+    def get_most_active(self) -> Tuple[List[str], int]:
+        """Return the most active cookies of the window, in order of first occurrence in it, and their count.
+
+        The list is empty if the window is. Only when several cookies tie are the buckets
+        gone over, from the oldest, until all the tied cookies have been met.
+        """
+
+        if not self.max_count:
+            return [], 0
+        tied_cookies = self.cookies_by_count[self.max_count]
+        if len(tied_cookies) == 1:
+            return list(tied_cookies), self.max_count
+        most_active_cookies = {}
+        for bucket_index in sorted(self.buckets):
+            for cookie in self.buckets[bucket_index]:
+                if cookie in tied_cookies:
+                    most_active_cookies[cookie] = None
+            if len(most_active_cookies) == len(tied_cookies):
+                break
+        return list(most_active_cookies), self.max_count
+
+    def get_window(self) -> Optional[Tuple[int, int]]:
+        """Return the POSIX times (start, end) of the window, or None before the first line."""
+
+        if self.newest_time is None:
+            return None
+        return (self.newest_bucket - self.bucket_count + 1) * self.bucket_seconds, self.newest_time
+
+    def _advance(self, bucket_index: int) -> None:
+        """Make bucket_index the newest bucket and subtract the buckets that fall out of the window."""
+
+        self.newest_bucket = bucket_index
+        oldest_bucket = bucket_index - self.bucket_count + 1
+        for expired_index in [index for index in self.buckets if index < oldest_bucket]:
+            self._expire(self.buckets.pop(expired_index))
+
+    def _expire(self, bucket: Dict[str, int]) -> None:
+        """Subtract the counts of an expired bucket from the window."""
+
+        cookies_by_count = self.cookies_by_count
+        for cookie, bucket_count in bucket.items():
+            count = self.counts[cookie]
+            cookies_by_count[count].remove(cookie)
+            count -= bucket_count
+            if count:
+                self.counts[cookie] = count
+                cookies_by_count[count].add(cookie)
+            else:
+                del self.counts[cookie]
+        while self.max_count and not cookies_by_count[self.max_count]:
+            self.max_count -= 1
+        metrics.count("count", "expired_buckets", 1)
+
+
+class LogFollower:
+    """Read the complete lines appended to a log file, reopening it when it is rotated or truncated.
+
+    Only plain text logs can be followed: a compressed stream cannot be read from where the
+    last read stopped, so a compressed log stops execution, or raises CompressedLogError with
+    exit_on_error=False.
+    """
+
+    def __init__(self, file_name: str, exit_on_error: bool = True) -> None:
+        self.file_name = file_name
+        self.csv_file_reader = CSVFileReader(exit_on_error)
+        self.log_file = None
+        self.inode = None
+        # Bytes of the unfinished last line, kept until its newline is written.
+        self.tail = b""
+
+    def iter_batches(self) -> Iterator[List[bytes]]:
+        """Yield the complete lines written since the last call, one list per block read.
+
+        The first call yields the whole file. A file that was rotated is read to its end
+        before its replacement is opened, and a file that was truncated is read again from
+        the start. A missing file yields nothing until it is created.
+        """
+
+        if self.log_file is not None:
+            yield from self._iter_available_batches()
+            try:
+                log_stat = os.stat(self.file_name)
+            except FileNotFoundError:
+                return
+            if log_stat.st_ino == self.inode and log_stat.st_size >= self.log_file.tell():
+                return
+            logging.info(f"Log file '{self.file_name}' was rotated or truncated. Reading it from the start.")
+            self.close()
+        try:
+            self.log_file = open(self.file_name, "rb")
+        except FileNotFoundError:
+            return
+        compression = self.csv_file_reader.get_compression(self.file_name)
+        if compression is not None:
+            self.close()
+            raise_or_exit(
+                CompressedLogError(
+                    f"Cannot follow the {compression} compressed log '{self.file_name}'. Follow the plain text log."
+                ),
+                self.csv_file_reader.exit_on_error,
+            )
+        self.inode = os.fstat(self.log_file.fileno()).st_ino
+        yield from self._iter_available_batches()
+
+    def iter_entries(self) -> Iterator[Tuple[str, int]]:
+        """Yield the (cookie, POSIX seconds) entries of the lines written since the last call.
+
+        Malformed lines are counted in csv_file_reader.malformed_lines and left out.
+        """
+
+        parse_line_time = self.csv_file_reader.parse_line_time
+        for lines in self.iter_batches():
+            for line in lines:
+                try:
+                    yield parse_line_time(line)
+                except (IndexError, ValueError):
+                    self.csv_file_reader.malformed_lines += 1
+
+    def close(self) -> None:
+        """Close the log file and forget its unfinished last line."""
+
+        if self.log_file is not None:
+            self.log_file.close()
+        self.log_file = None
+        self.tail = b""
+
+    def _iter_available_batches(self) -> Iterator[List[bytes]]:
+        """Yield the complete lines between the current position and the end of the file, one list per block."""
+
+        blocks = iter(lambda: self.log_file.read(READ_SIZE), b"")
+        for block in metrics.iter_stage("read", blocks, count_bytes=True):
+            lines = (self.tail + block).split(b"\n")
+            self.tail = lines.pop()
+            yield lines